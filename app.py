@@ -1,6 +1,23 @@
 import streamlit as st
-import google.generativeai as genai
+import background
+import career_memory
+import engine
+import event_prompts
+import event_queue
+import fixtures
 import game_data
+import json_stream
+import llm_backends
+import llm_cache
+import prompt_builder
+import rate_limit
+import resilience
+import routing
+import schemas
+import speculation
+import standings
+import team_store
+import telemetry
 import json
 import random
 import datetime
@@ -9,6 +26,15 @@ import numpy as np
 import pandas as pd
 import time
 import re
+import logging
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger(__name__)
+
+# レート制限の公平キューはセッション単位で順番を回すので、この実行のセッションIDを紐付ける
+_script_ctx = get_script_run_ctx()
+rate_limit.bind_session(_script_ctx.session_id if _script_ctx else "")
+telemetry.get_telemetry().register_collector("rate_limit", rate_limit.get_limiter().prometheus_lines)
 
 # ページ設定
 st.set_page_config(page_title="Football Career AI", layout="wide", initial_sidebar_state="collapsed")
@@ -97,44 +123,8 @@ def determine_category(team_name: str) -> str:
 
 
 # --- 汎用ユーティリティ ---
-def safe_json_load(text):
-    try:
-        text = text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(text)
-        if isinstance(data, list):
-            return data[0] if data else {}
-        return data
-    except Exception:
-        return {}
-
-
-def safe_float(val, default=0.0):
-    try:
-        return float(val)
-    except Exception:
-        return default
-
-
-def safe_int(val, default=0):
-    try:
-        if isinstance(val, (int, float)):
-            return int(val)
-        val_str = str(val).lower()
-        multiplier = 1
-        if 'm' in val_str:
-            multiplier = 1_000_000
-        elif 'k' in val_str:
-            multiplier = 1_000
-        elif '億' in val_str:
-            multiplier = 100_000_000
-        elif '万' in val_str:
-            multiplier = 10_000
-        clean_str = re.sub(r'[^\d.]', '', val_str)
-        if not clean_str:
-            return default
-        return int(float(clean_str) * multiplier)
-    except Exception:
-        return default
+safe_float = schemas.safe_float
+safe_int = schemas.safe_int
 
 
 def convert_position_by_foot(category: str, position: str, foot: str) -> str:
@@ -152,72 +142,11 @@ def convert_position_by_foot(category: str, position: str, foot: str) -> str:
     return position
 
 
-def ca_offer_bucket(ca: float) -> str:
-    thresholds = [
-        (37, "大学下位チームベンチ"),
-        (40, "大学Dスタメン"),
-        (45, "大学Cベンチ"),
-        (50, "大学Cスタメン"),
-        (55, "大学Bベンチ"),
-        (60, "大学Bスタメン可"),
-        (70, "大学Aスタメン争い"),
-        (80, "大学Aスタメン / JFL特指クラス"),
-        (90, "J1練習参加・特指レベル"),
-        (100, "J1正規メンバー"),
-        (110, "海外挑戦可能な若手"),
-        (130, "J1エース級"),
-        (140, "日本代表入りレベル"),
-        (150, "日本代表主力"),
-        (160, "欧州主要リーグスタメン級"),
-        (170, "欧州トップクラブ主力候補"),
-        (180, "世界的ビッグクラブ争奪戦"),
-        (200, "歴史的レジェンド"),
-    ]
-    for bound, label in thresholds:
-        if ca <= bound:
-            return label
-    return "特級"  # safety
-
-
-def maybe_generate_transfer_offer(player):
-    """Create a transfer offer based on CA buckets and return it if triggered."""
-    ca = player.ca
-    bucket = ca_offer_bucket(ca)
-    base_chance = 0.0
-    if ca >= 80:
-        base_chance = 0.12
-    elif ca >= 60:
-        base_chance = 0.08
-    elif ca >= 45:
-        base_chance = 0.05
-    elif ca >= 37:
-        base_chance = 0.03
-    if random.random() > base_chance:
-        return None
-
-    leagues = [
-        "明治安田J1リーグ", "明治安田J2リーグ", "関東大学サッカーリーグ1部", "関西学生リーグ1部",
-        "プレミアリーグ", "セリエA", "リーガ・エスパニョーラ", "ブンデスリーガ"
-    ]
-    club_prefix = ["FC", "SC", "AC", "ユナイテッド", "シティ", "ヴィレッジ", "カレッジ"]
-    club_suffix = ["東京", "大阪", "名古屋", "札幌", "マドリード", "ロンドン", "デュッセルドルフ", "フィレンツェ"]
-    category = "Professional" if ca >= 70 else player.team_category
-
-    offer = {
-        "club": f"{random.choice(club_suffix)}{random.choice(club_prefix)}",
-        "league": random.choice(leagues),
-        "category": category,
-        "status": "new",
-        "bucket": bucket,
-        "created": player.current_date.isoformat(),
-        "salary": max(player.salary, int(500000 + ca * 10_000)),
-    }
-    player.transfer_offers.append(offer)
-    return offer
-
-
 def apply_transfer(player, offer):
     """Apply an accepted offer to the player and regenerate team context."""
+    career_memory.CareerMemory(player.memory).record_transfer(
+        player.current_date.isoformat(), player.team_name, offer.get("club", player.team_name)
+    )
     player.team_name = offer.get("club", player.team_name)
     player.team_category = offer.get("category", "Professional")
     player.salary = offer.get("salary", player.salary)
@@ -234,6 +163,9 @@ def apply_transfer(player, offer):
     player.team_members = members
     player.formation = formation
     player.update_hierarchy()
+    # 移籍後は所属も人間関係も変わるので、一括生成済みのイベントは使えない
+    if "event_queue" in st.session_state:
+        st.session_state.event_queue.invalidate("transfer")
 
 
 def offer_summary_text(offer: dict) -> str:
@@ -256,6 +188,48 @@ with st.sidebar:
         "models/gemini-3-pro-preview"
     ]
     selected_model = st.selectbox("使用モデル", model_options, index=0)
+    # 週間予定・時間割・日々のイベントは速いモデルに回し、山場の物語だけ選択モデルを使う
+    model_routing_enabled = st.checkbox(
+        "種別ごとにモデルを自動で振り分ける", value=True,
+        help="レイテンシ目標を超えたら速いモデルへ切り替えます。物語の山場は常に選択モデルを使います。"
+    )
+
+    # LLMバックエンド: 負荷試験・ベンチマーク用にローカルのスタブやカセット再生へ切り替えられる
+    backend_labels = {
+        "gemini": "Gemini API",
+        "record": "Gemini API + カセット記録",
+        "replay": "カセット再生（オフライン）",
+        "stub": "ローカルスタブ（オフライン）",
+    }
+    backend_mode = st.selectbox(
+        "LLMバックエンド", list(backend_labels.keys()), format_func=lambda x: backend_labels[x]
+    )
+    cassette_name = "default"
+    stub_latency = 0.0
+    if backend_mode in ("record", "replay"):
+        cassette_name = st.text_input("カセット名", "default")
+    if backend_mode == "stub":
+        stub_latency = st.slider("スタブの疑似レイテンシ (秒)", 0.0, 10.0, 0.0, 0.1)
+    # 再実行のたびに作り直すと再生カーソルが先頭に戻るので、設定が変わるまで使い回す
+    backend_key = (backend_mode, cassette_name, api_key, stub_latency)
+    if st.session_state.get("llm_backend_key") != backend_key:
+        try:
+            st.session_state.llm_backend = llm_backends.make_backend(
+                backend_mode, api_key=api_key, cassette=cassette_name, latency=stub_latency
+            )
+        except ValueError as e:
+            st.error(f"カセット名が不正です: {e}")
+            st.session_state.llm_backend = None
+        st.session_state.llm_backend_key = backend_key
+    llm_backend = st.session_state.llm_backend
+
+    # 先読み（投機実行）: イベント閲覧中に選択肢の結果と次イベントを裏で生成しておく
+    speculation_enabled = st.checkbox("先読み生成を有効にする", value=True)
+    speculation_cap = st.number_input(
+        "先読みの無駄打ち上限（1日あたり）", 0, 50, speculation.DEFAULT_MAX_WASTED
+    )
+    # 複数日分のイベントを1回で生成してキューに積む（1 なら従来どおり1日ずつ）
+    event_batch_days = st.slider("イベント一括生成（日数）", 1, 10, event_queue.DEFAULT_BATCH_DAYS)
 
     if st.session_state.player:
         st.divider()
@@ -268,22 +242,250 @@ with st.sidebar:
         st.session_state.clear()
         st.rerun()
 
+    # 管理パネル（URL に ?admin=1 を付けたときだけ表示）
+    if st.query_params.get("admin") == "1":
+        with st.expander("🛠 管理パネル: LLM呼び出し計測"):
+            tele = telemetry.get_telemetry()
+            rows = tele.summary()
+            if rows:
+                st.dataframe(pd.DataFrame(rows), use_container_width=True)
+            else:
+                st.caption("まだ呼び出し記録がありません。")
+            st.caption(f"キャッシュ: {llm_cache.get_cache().stats()}")
+            st.caption(f"同時生成の共有: {background.get_single_flight().stats()}")
+            st.caption(f"チームテンプレート: {team_store.get_store().stats()}")
+            pool_stats = llm_backends.client_pool_stats()
+            if pool_stats:
+                # avg_build_ms が毎回払っていた構築コスト、avg_acquire_ms がプール後の1呼び出しあたり
+                st.caption(f"クライアントプール: {pool_stats}")
+            routing_rows = routing.get_router().stats()
+            if routing_rows:
+                st.caption("モデル振り分け（種別×モデルの p95 と目標）")
+                st.dataframe(pd.DataFrame(routing_rows), use_container_width=True)
+            limiter_rows = rate_limit.get_limiter().stats()
+            if limiter_rows:
+                st.caption("レート制限キュー（APIキー×モデル）")
+                st.dataframe(pd.DataFrame(limiter_rows), use_container_width=True)
+            if "speculator" in st.session_state:
+                st.caption(f"先読み: {st.session_state.speculator.stats()}")
+            prom = tele.prometheus_text()
+            st.download_button("Prometheus形式でダウンロード", prom, file_name="metrics.txt")
+            metrics_port = st.number_input("メトリクスHTTPポート", 1024, 65535, 9464)
+            if st.button("/metrics を公開 (localhost)"):
+                port = telemetry.start_metrics_server(int(metrics_port))
+                if port is None:
+                    st.error(f"ポート {int(metrics_port)} を使えませんでした（使用中の可能性があります）")
+                else:
+                    st.success(f"http://127.0.0.1:{port}/metrics で公開中")
+            with st.popover("テキスト表示"):
+                st.code(prom, language="text")
+
 
 # --- Gemini呼び出しラッパー ---
-def call_gemini(prompt):
-    if not api_key:
+def notify_error(message):
+    """バックグラウンドスレッドからは st.error が描画できないためログに回す。"""
+    if get_script_run_ctx() is None:
+        logger.warning(message)
+        return
+    st.error(message)
+
+
+def call_gemini(prompt, kind="default", use_cache=True, stream_field=None, on_text=None, critical=False,
+                caller=None):
+    """
+    Gemini を呼び出して JSON を dict で返す。
+    kind はプロンプト種別（team_data / schedule など）で、キャッシュTTLの判定に使う。
+    use_cache=False で毎回変化してほしい呼び出しはキャッシュを素通りさせる。
+    stream_field と on_text を渡すとストリーミング生成し、その文字列フィールドの
+    途中経過を on_text(これまでの本文) で逐次通知する。構造化フィールドは完了後の dict で返す。
+    応答は schemas でスキーマ検証・数値正規化済みのものを返し、不正なら1回だけ修正依頼を投げる。
+    呼び出しごとに telemetry へ所要時間・トークン数・キャッシュ状況などを記録する。
+    caller は telemetry 上の呼び出し元の名前で、省略時は kind を使う。
+    モデルは routing が種別ごとに選ぶ。critical=True（物語上の山場）はサイドバーの選択を必ず使う。
+    """
+    backend = llm_backend
+    if backend is None:
         return None
+
+    router = routing.get_router()
+    model = router.route(kind, selected_model, critical=critical, enabled=model_routing_enabled)
+    started = time.perf_counter()
+    rec = telemetry.CallRecord(
+        kind=kind,
+        caller=caller or kind,
+        model=model,
+        backend=backend.name,
+        prompt_chars=len(prompt),
+        saved_tokens=getattr(prompt, "saved_tokens", 0),
+    )
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            selected_model,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        res = model.generate_content(prompt)
-        return safe_json_load(res.text)
-    except Exception as e:
-        st.error(f"Geminiエラー: {e}")
+        return _call_gemini(backend, model, prompt, kind, use_cache, stream_field, on_text, rec)
+    finally:
+        telemetry.record(rec.finish(started))
+        if rec.status == "ok" and rec.cache not in ("hit", "shared"):
+            # ヘッジ側が答えたときは、そのモデルの計測として記録する
+            router.observe(kind, rec.model, rec.wall_ms / 1000)
+
+
+def _call_gemini(backend, model, prompt, kind, use_cache, stream_field, on_text, rec):
+    def config_for(model_name):
+        config = {"response_mime_type": "application/json"}
+        schema = schemas.response_schema_for(kind, model_name)
+        if schema:
+            config["response_schema"] = schema
+        return config
+
+    cache = llm_cache.get_cache()
+    cache_key = None
+    if use_cache and backend.cacheable and cache.is_cacheable(kind):
+        cache_key = llm_cache.make_key(model, config_for(model), prompt)
+        cached = cache.get(cache_key, kind)
+        rec.cache = "miss"
+        if cached is not None:
+            data, errors = schemas.load(kind, cached)
+            if not errors:
+                rec.cache = "hit"
+                rec.response_chars = len(cached)
+                if stream_field and on_text:
+                    on_text(str(data.get(stream_field, "")))
+                return data
+
+    streaming = bool(stream_field and on_text)
+    # ヘッジ用スレッドではコンテキストが引き継がれないので、優先度とセッションはここで確定させる
+    priority = rate_limit.priority_for(kind, background=get_script_run_ctx() is None)
+    session = rate_limit.session_var.get()
+
+    def generate():
+        """API を叩いて検証済みの応答テキストを返す（失敗時は None）。"""
+        usage = {}
+
+        def send(model_name, timeout):
+            if streaming:
+                chunks = backend.stream(model_name, config_for(model_name), prompt, kind, timeout, usage)
+                return _consume_stream(chunks, stream_field, on_text)
+            return backend.generate(model_name, config_for(model_name), prompt, kind, timeout, usage)
+
+        attempt = throttled(backend, send, priority, session)
+
+        def on_retry(n, exc):
+            rec.retries = n
+
+        try:
+            # デッドライン・リトライ・ヘッジ・サーキットブレーカーは resilience 側で扱う
+            # （ストリーミングは途中経過を表示中なのでヘッジしない）
+            caller = resilience.get_caller()
+            text, rec.model = caller.call(
+                kind, attempt, model,
+                scope=backend.scope,
+                hedge=not streaming,
+                on_retry=on_retry,
+            )
+            rec.add_usage(usage)
+            data, errors = schemas.load(kind, text)
+            if errors:
+                # 壊れた応答とエラー箇所だけを渡して直させる（全文の再生成はしない）
+                logger.info("repairing %s response: %s", kind, errors[:3])
+                rec.repaired = True
+                fix_prompt = schemas.repair_prompt(kind, text, errors)
+                fix_usage = {}
+                text, rec.model = caller.call(
+                    kind,
+                    throttled(
+                        backend,
+                        lambda model_name, timeout: backend.generate(
+                            model_name, config_for(model_name), fix_prompt, kind, timeout, fix_usage
+                        ),
+                        priority, session,
+                    ),
+                    model,
+                    scope=backend.scope,
+                )
+                rec.add_usage(fix_usage)
+                data, errors = schemas.load(kind, text)
+                if errors:
+                    rec.status = "invalid"
+                    notify_error(f"Gemini応答の形式が不正です: {errors[0]}")
+                    return None
+            if cache_key:
+                # ヘッジ側の応答は、そのモデルのキーで保存する（元のモデルのキャッシュを汚さない）
+                answered_key = cache_key if rec.model == model else llm_cache.make_key(
+                    rec.model, config_for(rec.model), prompt
+                )
+                cache.put(answered_key, kind, text, model=rec.model)
+            return text
+        except resilience.CircuitOpenError:
+            # API が不調な間は呼び出しを止め、各関数のローカルなフォールバックに任せる
+            rec.status = "circuit_open"
+            logger.info("circuit open; using local fallback for %s", kind)
+            return None
+        except rate_limit.RateLimited as e:
+            # 枠が空くのを待ちきれなかった。エラー表示はせずフォールバックに任せる
+            rec.status = "rate_limited"
+            logger.info("%s; using local fallback for %s", e, kind)
+            return None
+        except Exception as e:
+            rec.status = "error"
+            notify_error(f"Geminiエラー: {e}")
+            return None
+
+    if cache_key:
+        # 同じプロンプトが他セッションで生成中なら、その結果を待って共有する
+        text, shared = background.get_single_flight().do(cache_key, generate)
+        if shared:
+            rec.cache = "shared"
+            if not text:
+                rec.status = "error"
+            elif stream_field and on_text:
+                on_text(str(schemas.load(kind, text)[0].get(stream_field, "")))
+    else:
+        text = generate()
+    if not text:
         return None
+    rec.response_chars = len(text)
+    # テキストから各呼び出し元ごとに dict を作るので、共有した応答でも書き換えが干渉しない
+    return schemas.load(kind, text)[0]
+
+
+def throttled(backend, send, priority, session):
+    """
+    send(model, timeout) の前に API キー×モデルのトークンバケットから1枠取るようにする。
+    枠が無ければ優先度順・セッション間で公平に待ち、待った分はタイムアウトから差し引く。
+    429 が返ったらバケットを空にして、後続を待たせる（バーストとエラーの繰り返しを防ぐ）。
+    """
+    if not backend.rate_limited:
+        return send
+    limiter = rate_limit.get_limiter()
+
+    def attempt(model_name, timeout):
+        scope = backend.scope
+        waited = limiter.acquire(scope, model_name, priority=priority, session=session, timeout=timeout)
+        try:
+            return send(model_name, max(0.1, timeout - waited))
+        except Exception as exc:
+            if resilience.is_throttled(exc):
+                limiter.penalize(scope, model_name)
+            raise
+
+    return attempt
+
+
+def _consume_stream(chunks, field, on_text):
+    """ストリームを読み切り、field の文字列が伸びるたびに on_text を呼ぶ。全文を返す。"""
+    extractor = json_stream.StreamingFieldExtractor(field)
+    parts = []
+    for piece in chunks:
+        parts.append(piece)
+        if extractor.feed(piece):
+            on_text(extractor.text)
+    return "".join(parts)
+
+
+def placeholder_writer(placeholder, style="markdown"):
+    """st.empty() のプレースホルダへ本文を上書きし続けるコールバックを返す。"""
+    if placeholder is None:
+        return None
+    render = getattr(placeholder, style)
+    return lambda text: render(text + " ▌")
 
 
 # --- ゲームロジック関数 ---
@@ -337,7 +539,7 @@ def create_initial_data(profile_data, category, start_date):
 
     prompt = base_prompt
     for _ in range(3):
-        res = call_gemini(prompt)
+        res = call_gemini(prompt, kind="initial_data")
         if not res:
             return res
         if not res.get("need_questions"):
@@ -351,6 +553,24 @@ def create_initial_data(profile_data, category, start_date):
 
 
 def create_team_data(team_name, category, start_date):
+    """
+    チームデータ（フォーメーションと選手リスト）を返す。
+    同じチーム・シーズンは全セッションで共有する読み取り専用テンプレートで、
+    同時に入団した複数ユーザーがいても生成は1回だけになる。
+    """
+    return team_store.get_store().get_or_build(
+        "team_data", team_name, category, start_date.year,
+        lambda: _generate_team_data(team_name, category, start_date),
+        source=template_source(),
+    )
+
+
+def template_source():
+    """共有テンプレートの出所（バックエンドとモデル）。スタブや再生の結果を本番のセッションに回さない。"""
+    return f"{getattr(llm_backend, 'name', 'none')}/{selected_model}"
+
+
+def _generate_team_data(team_name, category, start_date):
     prompt = f"""
     チーム名「{team_name}」({start_date}時点)のデータを生成せよ。
     カテゴリ: {category}
@@ -377,60 +597,64 @@ def create_team_data(team_name, category, start_date):
         ]
     }}
     """
-    return call_gemini(prompt)
+    return call_gemini(prompt, kind="team_data")
 
-def create_school_timetable(player):
+def create_school_timetable(player, team_plan=None):
     """
     高校/ユースの「学校時間割」を作成する。
     チーム週間スケジュールと矛盾しないように、授業は基本的に日中、部活は放課後という前提。
     """
-    team_plan = getattr(player, "team_weekly_plan", [])
-
-    prompt = f"""
-    あなたは日本の高校サッカー部員（または高校年代ユース選手）の
-    「学校の時間割」を設計するAIです。
-
-    [前提]
-    - 氏名: {player.name}
-    - 年齢: {player.age}
-    - チーム: {player.team_name}
-    - チームカテゴリ: {player.team_category}
-    - サッカーの週間スケジュール(概略):
-      {json.dumps(team_plan, ensure_ascii=False)}
-
-    [制約・方針]
-    - 日本の一般的な高校の時間割をベースにすること。
-      - 平日は Mon〜Fri を必須、必要なら Sat に午前授業を入れてよい。
-      - 1日あたりおおよそ 5〜6コマ（p1〜p6）を想定。
-    - サッカー部のトレーニングは「放課後」に行われる前提とし、
-      この時間割の p1〜p6 の中には原則サッカー部の活動を含めないこと。
-    - サッカーの週間スケジュールと大きく矛盾しないように、
-      例: トレーニングが非常にハードな日の翌日は、授業のコマ数をやや抑える など、
-      最低限の整合性は意識してください（ただし細かい時刻までは考えなくてよい）。
-
-    [出力形式]
-    次の形式の JSON のみを出力してください:
-
-    {{
-      "timetable": [
-        {{
-          "weekday": "Mon",
-          "p1": "現代文",
-          "p2": "数学I",
-          "p3": "英語コミュニケーション",
-          "p4": "世界史",
-          "p5": "体育",
-          "p6": "HR"
-        }}
-      ]
-    }}
+    if team_plan is None:
+        team_plan = getattr(player, "team_weekly_plan", [])
+
+    prompt = (
+        prompt_builder.PromptBuilder("timetable")
+        .instructions("""
+        あなたは日本の高校サッカー部員（または高校年代ユース選手）の
+        「学校の時間割」を設計するAIです。[前提] の選手とサッカーの週間スケジュール(概略)に合わせてください。
+
+        [制約・方針]
+        - 日本の一般的な高校の時間割をベースにすること。
+          - 平日は Mon〜Fri を必須、必要なら Sat に午前授業を入れてよい。
+          - 1日あたりおおよそ 5〜6コマ（p1〜p6）を想定。
+        - サッカー部のトレーニングは「放課後」に行われる前提とし、
+          この時間割の p1〜p6 の中には原則サッカー部の活動を含めないこと。
+        - サッカーの週間スケジュールと大きく矛盾しないように、
+          例: トレーニングが非常にハードな日の翌日は、授業のコマ数をやや抑える など、
+          最低限の整合性は意識してください（ただし細かい時刻までは考えなくてよい）。
+
+        [出力形式]
+        次の形式の JSON のみを出力してください:
+
+        {
+          "timetable": [
+            {
+              "weekday": "Mon",
+              "p1": "現代文",
+              "p2": "数学I",
+              "p3": "英語コミュニケーション",
+              "p4": "世界史",
+              "p5": "体育",
+              "p6": "HR"
+            }
+          ]
+        }
 
-    - weekday は "Mon","Tue","Wed","Thu","Fri","Sat","Sun" のいずれか。
-    - 少なくとも Mon〜Fri の5日分を含めること。
-    - JSON 以外のテキストは出力してはいけません。
-    """
+        - weekday は "Mon","Tue","Wed","Thu","Fri","Sat","Sun" のいずれか。
+        - 少なくとも Mon〜Fri の5日分を含めること。
+        - JSON 以外のテキストは出力してはいけません。
+        """)
+        .section("前提", f"氏名: {player.name} / 年齢: {player.age} / チーム: {player.team_name}({player.team_category})")
+        .section(
+            "サッカーの週間スケジュール(概略)",
+            prompt_builder.compact_weekly_plan(team_plan),
+            raw=json.dumps(team_plan, ensure_ascii=False),
+            priority=1,
+        )
+        .build()
+    )
 
-    res = call_gemini(prompt)
+    res = call_gemini(prompt, kind="timetable")
     if not res:
         # フォールバック（かなり単純なデフォルト）
         default = [
@@ -442,78 +666,81 @@ def create_school_timetable(player):
         ]
         return {"timetable": default}
 
-    if "timetable" not in res:
-        res["timetable"] = []
     return res
 
 
-def create_univ_timetable(player):
+def create_univ_timetable(player, team_plan=None):
     """
     大学生用の「履修時間割」を作成する。
     チーム週間スケジュールと矛盾しないように、トレーニング時間帯を避けて講義を配置させる。
     """
-    team_plan = getattr(player, "team_weekly_plan", [])
-
-    prompt = f"""
-    あなたは日本の大学サッカー部員の履修相談に乗るAIです。
-
-    [前提]
-    - 氏名: {player.name}
-    - 年齢: {player.age}
-    - 所属チーム: {player.team_name}
-    - チームカテゴリ: {player.team_category}
-    - サッカーの週間スケジュール(概略):
-      {json.dumps(team_plan, ensure_ascii=False)}
-
-    [前提（抽象）]
-    - 一般的な日本の大学を想定してよい（例: 1限 9:00〜、2限 10:40〜... 程度）。
-    - サッカーのトレーニングは主に「夕方〜夜」に行われる想定で、
-      heavy な講義はその時間帯には入れないように配慮すること。
-
-    [タスク]
-    - Mon〜Fri を中心に、「1週間の履修時間割」を作成してください。
-    - 各曜日について、p1〜p5 までの5コマを定義し、
-      それぞれに講義名または「空きコマ」「自習」などを設定してください。
-    - サッカーのトレーニングが「午後〜夕方」に集中している曜日は、
-      p4, p5 を空きコマにする など、最低限の両立を意識してください。
-    - それぞれのコマには、次の付加情報を必ず付けてください:
-      - required: "必修" または "選択"
-      - delivery: "オンライン" / "オンデマンド" / "オフライン" のいずれか
-    - 履修科目名は、それっぽい日本語の講義名で構いません
-      （例: 「経済学入門」「スポーツ科学基礎」「統計学Ⅰ」など）。
-
-    [出力形式]
-    次の形式の JSON のみを出力してください:
-
-    {{
-      "timetable": [
-        {{
-          "weekday": "Mon",
-          "p1": "経済学入門",
-          "p1_required": "必修",
-          "p1_delivery": "オフライン",
-          "p2": "統計学Ⅰ",
-          "p2_required": "選択",
-          "p2_delivery": "オンライン",
-          "p3": "空きコマ",
-          "p3_required": "選択",
-          "p3_delivery": "オンデマンド",
-          "p4": "スポーツ科学基礎",
-          "p4_required": "選択",
-          "p4_delivery": "オフライン",
-          "p5": "空きコマ",
-          "p5_required": "選択",
-          "p5_delivery": "オンデマンド"
-        }}
-      ]
-    }}
+    if team_plan is None:
+        team_plan = getattr(player, "team_weekly_plan", [])
+
+    prompt = (
+        prompt_builder.PromptBuilder("timetable")
+        .instructions("""
+        あなたは日本の大学サッカー部員の履修相談に乗るAIです。
+        [前提] の選手とサッカーの週間スケジュール(概略)に合わせてください。
+
+        [前提（抽象）]
+        - 一般的な日本の大学を想定してよい（例: 1限 9:00〜、2限 10:40〜... 程度）。
+        - サッカーのトレーニングは主に「夕方〜夜」に行われる想定で、
+          heavy な講義はその時間帯には入れないように配慮すること。
+
+        [タスク]
+        - Mon〜Fri を中心に、「1週間の履修時間割」を作成してください。
+        - 各曜日について、p1〜p5 までの5コマを定義し、
+          それぞれに講義名または「空きコマ」「自習」などを設定してください。
+        - サッカーのトレーニングが「午後〜夕方」に集中している曜日は、
+          p4, p5 を空きコマにする など、最低限の両立を意識してください。
+        - それぞれのコマには、次の付加情報を必ず付けてください:
+          - required: "必修" または "選択"
+          - delivery: "オンライン" / "オンデマンド" / "オフライン" のいずれか
+        - 履修科目名は、それっぽい日本語の講義名で構いません
+          （例: 「経済学入門」「スポーツ科学基礎」「統計学Ⅰ」など）。
+
+        [出力形式]
+        次の形式の JSON のみを出力してください:
+
+        {
+          "timetable": [
+            {
+              "weekday": "Mon",
+              "p1": "経済学入門",
+              "p1_required": "必修",
+              "p1_delivery": "オフライン",
+              "p2": "統計学Ⅰ",
+              "p2_required": "選択",
+              "p2_delivery": "オンライン",
+              "p3": "空きコマ",
+              "p3_required": "選択",
+              "p3_delivery": "オンデマンド",
+              "p4": "スポーツ科学基礎",
+              "p4_required": "選択",
+              "p4_delivery": "オフライン",
+              "p5": "空きコマ",
+              "p5_required": "選択",
+              "p5_delivery": "オンデマンド"
+            }
+          ]
+        }
 
-    - weekday は "Mon","Tue","Wed","Thu","Fri","Sat","Sun" のいずれか。
-    - 少なくとも Mon〜Fri の5日分を含めること。
-    - JSON 以外のテキストは出力してはいけません。
-    """
+        - weekday は "Mon","Tue","Wed","Thu","Fri","Sat","Sun" のいずれか。
+        - 少なくとも Mon〜Fri の5日分を含めること。
+        - JSON 以外のテキストは出力してはいけません。
+        """)
+        .section("前提", f"氏名: {player.name} / 年齢: {player.age} / 所属チーム: {player.team_name}({player.team_category})")
+        .section(
+            "サッカーの週間スケジュール(概略)",
+            prompt_builder.compact_weekly_plan(team_plan),
+            raw=json.dumps(team_plan, ensure_ascii=False),
+            priority=1,
+        )
+        .build()
+    )
 
-    res = call_gemini(prompt)
+    res = call_gemini(prompt, kind="timetable")
     if not res:
         default = [
             {"weekday": "Mon", "p1": "基礎ゼミ", "p1_required": "必修", "p1_delivery": "オフライン", "p2": "統計学Ⅰ", "p2_required": "必修", "p2_delivery": "オフライン", "p3": "空きコマ", "p3_required": "選択", "p3_delivery": "オンデマンド", "p4": "スポーツ科学入門", "p4_required": "選択", "p4_delivery": "オフライン", "p5": "空きコマ", "p5_required": "選択", "p5_delivery": "オンライン"},
@@ -524,8 +751,6 @@ def create_univ_timetable(player):
         ]
         return {"timetable": default}
 
-    if "timetable" not in res:
-        res["timetable"] = []
     return res
 
 
@@ -574,7 +799,7 @@ def create_team_weekly_plan(team_name, category):
     - JSON 以外のテキストは出力してはいけません。
     """
 
-    res = call_gemini(prompt)
+    res = call_gemini(prompt, kind="weekly_plan")
     if not res:
         # フォールバック：ごく単純なデフォルト
         default_plan = [
@@ -588,18 +813,29 @@ def create_team_weekly_plan(team_name, category):
         ]
         return {"plan": default_plan}
 
-    if "plan" not in res:
-        # 形式がおかしいときの最低限の保険
-        res["plan"] = []
     return res
 
 
 def create_schedule_data(team_name, category, year):
     """
-    チーム名・カテゴリ・年から、現実に近い大会構造と年間スケジュールを Gemini に推定させる。
-    - competitions: 大会メタ情報
-    - schedule: 1年分の試合リスト
+    チーム名・カテゴリ・年から、現実に近い大会構造を Gemini に推定させ、年間スケジュールは fixtures で組む。
+    - competitions: 大会メタ情報（対戦相手名を含む）
+    - schedule: 1年分の試合リスト（総当たり＋カップ戦、間隔・期間・曜日の制約を満たす）
+    生成結果は team_store の共有テンプレート（読み取り専用）。Player に載せるときは thaw してコピーする。
     """
+    tpl = team_store.get_store().get_or_build(
+        "schedule", team_name, category, year,
+        lambda: _generate_schedule_data(team_name, category, year),
+        source=template_source(),
+    )
+    if tpl:
+        return tpl
+
+    # Gemini から何も返ってこなかったときは、カテゴリ標準の大会構成からローカルで日程を組む
+    return fixtures.build_schedule(team_name, fixtures.default_competitions(category, year), year)
+
+
+def _generate_schedule_data(team_name, category, year):
     prompt = f"""
     あなたは世界中のサッカー大会構造に詳しいデータアナリストAIです。
 
@@ -634,18 +870,11 @@ def create_schedule_data(team_name, category, year):
                  カップの場合はそのチームが最大で到達しうるラウンド数
        - include_for_player: true/false
          このゲーム内で扱うべき大会かどうか。マイナー大会は false でもよい。
+       - opponents: 対戦相手になりうるチーム名の配列
+         - リーグの場合: このチームを除く参加チームすべて（team_count - 1 チーム）
+         - カップの場合: 対戦の可能性が高いチームを rounds 程度
 
-    3. 上記メタ情報にもとづいて、{year}年のこのチームの年間試合日程を作成してください。
-       制約:
-       - "schedule" には、少なくとも 30 試合以上を含めること。
-       - 国内リーグは現実に近い試合数になるようにすること。
-         - 18〜22チームのホーム&アウェーなら 34〜42 試合が目安。
-       - 国内カップは 1〜6 試合程度でよい（このチームの格に応じて推定してよい）。
-       - 欧州コンペティションは、現実の出場状況を知らない場合でも、
-         出場の可能性が相応にある強豪クラブなら数試合を想定して良い。
-       - 試合間隔はできるだけ 3 日以上あけること。
-       - 明らかなオフシーズン（リーグ終了後〜年末など）は試合を入れない。
-       - "date" は "{year}-01-01"〜"{year}-12-31" の範囲に収めること。
+    日付つきの試合日程は作らなくてよい（メタ情報からこちらで組みます）。
 
     [出力形式]
     100% 有効な JSON だけを出力してください。
@@ -663,68 +892,32 @@ def create_schedule_data(team_name, category, year):
           "match_days": ["Sat","Sun"],
           "team_count": 18,
           "rounds": 2,
-          "include_for_player": true
-        }}
-      ],
-      "schedule": [
-        {{
-          "date": "{year}-02-25",
-          "opponent": "横浜F・マリノス",
-          "home": true,
-          "competition_code": "LEAGUE",
-          "round": "MD1"
+          "include_for_player": true,
+          "opponents": ["横浜F・マリノス", "鹿島アントラーズ"]
         }}
       ]
     }}
 
     注意:
-    - 上記は例です。実際には {team_name} に合わせた大会・対戦相手・日程を生成してください。
+    - 上記は例です。実際には {team_name} に合わせた大会・対戦相手を生成してください。
     - JSON 以外のテキスト（説明文やコメント）は一切出力してはいけません。
     """
 
-    res = call_gemini(prompt)
+    res = call_gemini(prompt, kind="schedule")
+    if not res or not res.get("competitions"):
+        return None
 
-    # Gemini から何も返ってこなかったときのフォールバック（日程だけダミー生成）
-    if not res:
-        dummy_schedule = []
-        start = datetime.date(year, 3, 1)
-        for i in range(30):
-            d = start + datetime.timedelta(days=7 * i)
-            dummy_schedule.append({
-                "date": d.isoformat(),
-                "opponent": f"クラブ{i+1}",
-                "home": (i % 2 == 0),
-                "competition_code": "LEAGUE",
-                "round": f"MD{i+1}"
-            })
-        return {"competitions": [], "schedule": dummy_schedule}
-
-    # competitions / schedule が無い場合の保険
-    if "competitions" not in res:
-        res["competitions"] = []
-    if "schedule" not in res:
-        res["schedule"] = []
+    # 古いキャッシュ等で日程が付いてきた場合は制約に合わせて修復し、無ければローカルで生成する
+    return fixtures.build_schedule(team_name, res["competitions"], year, proposed=res.get("schedule"))
 
-    return res
 
-
-def summarize_annual_outline(schedule, year):
+def summarize_annual_outline(index, year):
     """Rough monthly outline (off-season, transfer, camps) before daily play."""
-    month_buckets = {m: [] for m in range(1, 13)}
-    for match in schedule:
-        date_str = match.get("date")
-        try:
-            d = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        except Exception:
-            continue
-        if d.year != year:
-            continue
-        month_buckets[d.month].append(match)
+    month_counts = index.month_counts(year)
 
     outline = []
     for month in range(1, 13):
-        matches = month_buckets[month]
-        match_count = len(matches)
+        match_count = month_counts[month]
         label = "リーグ/カップ進行"
         if match_count == 0:
             label = "オフ・自主トレ期間"
@@ -740,22 +933,12 @@ def summarize_annual_outline(schedule, year):
     return outline
 
 
-def align_weekly_plan_with_schedule(plan, schedule):
+def align_weekly_plan_with_schedule(plan, index):
     """Match weekly plan match-days to the most common schedule weekdays."""
-    if not plan or not schedule:
+    if not plan or not len(index):
         return plan, False
 
-    weekday_count = {}
-    for match in schedule:
-        try:
-            d = datetime.datetime.strptime(match.get("date", ""), "%Y-%m-%d").date()
-        except Exception:
-            continue
-        wd = d.strftime("%a")
-        weekday_count[wd] = weekday_count.get(wd, 0) + 1
-
-    if not weekday_count:
-        return plan, False
+    weekday_count = index.weekday_counts()
 
     common_days = sorted(weekday_count.items(), key=lambda x: x[1], reverse=True)
     target_days = {day for day, _ in common_days[:2]}
@@ -779,169 +962,310 @@ def align_weekly_plan_with_schedule(plan, schedule):
     return new_plan, updated
 
 
+def timetable_kind(player):
+    """時間割フェーズの種類を返す（不要なカテゴリは None）。"""
+    if player.team_category == "University":
+        return "univ"
+    if player.team_category in ["HighSchool", "Youth"] and player.age <= 18:
+        return "school"
+    return None
 
-def generate_story(player, topic):
-    prompt = f"""
-    あなたはリアル志向のサッカー小説家です。
-
-    【選手設定】
-    - 名前: {player.name}
-    - 所属クラブ / チーム: {player.team_name}
-    - 年齢: {player.age}
-    - ポジション: {player.position}
-    - 現在の日付: {player.current_date}
-
-    【シーン】
-    - 状況: {topic}
-
-    【執筆方針】
-    - 一人称視点（「僕」）で書くこと。
-    - 地の文と会話文をバランスよく混ぜること。
-    - 感情・身体感覚・周囲の空気感を具体的に描写すること
-      （例: 汗の匂い、スタンドのざわめき、スパイクの音、視線の重さなど）。
-    - ご都合主義ではなく、等身大のリアリティのあるトーン。
-    - 分量の目安は 400〜800字程度。
-
-    Output JSON ONLY:
-    {{
-        "story": "ここに日本語テキストを入れる。改行は \\n を使う。"
-    }}
+
+def start_onboarding_pipeline(player):
+    """
+    入団確定直後に、チーム名・カテゴリ・年だけで決まる生成をまとめて並列に開始する。
+    時間割だけは週間スケジュールを参照するので、その完了を待ってから走らせる。
+    各フェーズは onboarding_result() で（たいてい完了済みの）結果を受け取る。
     """
-    res = call_gemini(prompt)
+    pipe = background.TaskGraph()
+    pipe.submit("team_data", create_team_data, player.team_name, player.team_category, player.current_date)
+    pipe.submit("weekly_plan", create_team_weekly_plan, player.team_name, player.team_category)
+    pipe.submit("schedule", create_schedule_data, player.team_name, player.team_category, player.current_date.year)
+
+    kind = timetable_kind(player)
+    if kind:
+        create_tt = create_univ_timetable if kind == "univ" else create_school_timetable
+        pipe.submit(
+            "timetable",
+            lambda plan_res: create_tt(player, team_plan=(plan_res or {}).get("plan", [])),
+            after=["weekly_plan"],
+        )
+    st.session_state.onboarding = pipe
+    return pipe
+
+
+def onboarding_result(name, fallback):
+    """パイプラインに結果があればそれを待って返し、無ければ fallback() を同期実行する。"""
+    pipe = st.session_state.get("onboarding")
+    if pipe is not None and pipe.has(name):
+        res = pipe.pop(name)
+        if res:
+            return res
+    return fallback()
+
+
+def generate_story(player, topic, placeholder=None):
+    prompt = (
+        prompt_builder.PromptBuilder("story")
+        .instructions("""
+        あなたはリアル志向のサッカー小説家です。
+        [選手設定] の選手を主人公に、[シーン] の場面を書いてください。
+
+        [執筆方針]
+        - 一人称視点（「僕」）で書くこと。
+        - 地の文と会話文をバランスよく混ぜること。
+        - 感情・身体感覚・周囲の空気感を具体的に描写すること
+          （例: 汗の匂い、スタンドのざわめき、スパイクの音、視線の重さなど）。
+        - ご都合主義ではなく、等身大のリアリティのあるトーン。
+        - 分量の目安は 400〜800字程度。
+
+        Output JSON ONLY:
+        {
+            "story": "ここに日本語テキストを入れる。改行は \\n を使う。"
+        }
+        """)
+        .section(
+            "選手設定",
+            f"名前: {player.name} / 所属: {player.team_name} / 年齢: {player.age} / "
+            f"ポジション: {player.position} / 現在の日付: {player.current_date}",
+        )
+        .section("シーン", topic, priority=1, floor=200)
+        .build()
+    )
+    res = call_gemini(
+        prompt, kind="story",
+        stream_field="story", on_text=placeholder_writer(placeholder),
+        critical=True,
+    )
     return res.get("story", "") if res else ""
 
 
-def generate_next_event(player):
-    sorted_npcs = sorted(player.npcs, key=lambda x: abs(float(x.relation)), reverse=True)[:5]
-    npcs_txt = ", ".join([f"{n.role}:{n.name}({n.relation})" for n in sorted_npcs]) or "重要な人間関係はまだ少ない"
-
-    next_match = None
-    if player.schedule:
-        sorted_sched = sorted(player.schedule, key=lambda x: x.get('date', '9999'))
-        for m in sorted_sched:
-            if m.get('date', '9999') >= str(player.current_date):
-                next_match = m
-                break
-    schedule_info = (
-        f"次戦: {next_match.get('date')} vs {next_match.get('opponent','未定')}"
-        if next_match else "次戦予定なし"
+def generate_next_event(player, placeholder=None):
+    res = call_gemini(
+        event_prompts.next_event_prompt(player), kind="next_event", use_cache=False,
+        stream_field="description", on_text=placeholder_writer(placeholder, "info")
     )
+    return res or event_prompts.fallback_event()
 
-    prompt = f"""
-    あなたはリアル志向のサッカー小説家兼ゲームマスターです。
-
-    【プレイヤー情報】
-    - 名前: {player.name}
-    - 所属: {player.team_name}
-    - カテゴリ: {player.team_category}
-    - ポジション: {player.position}
-    - 年齢: {player.age}
-    - 現在日付: {player.current_date}
-    - 現在CA: {player.ca:.2f}, PA: {player.pa:.2f}
-    - HP: {player.hp}, MP: {player.mp}
-
-    【文脈】
-    - 直近スケジュール情報: {schedule_info}
-    - 関係性が強い/こじれているNPC一覧: {npcs_txt}
-
-    【タスク】
-    - 「今このタイミングで起こりうる、等身大のイベント」を1つ作りなさい。
-      - 例: 練習後のロッカーでの会話 / 寮での夜の独り時間 / 恋人とのすれ違い /
-            監督との面談 / 次戦メンバー発表 など。
-      - サッカー要素と生活要素が両方少しずつ絡むのが理想。
-
-    【表現ルール】
-    - title: 20文字以内の短いイベント名。
-    - description: 400〜900字程度の本文。
-      - 一人称の地の文＋会話文。
-      - 感情・身体感覚・空気感を丁寧に描写。
-      - 直近の試合・序列・練習への不安や期待なども自然に織り込んでよい。
-
-    【選択肢】
-    - choices は必ず3つ。
-    - text: プレイヤーが即座に選べる行動（短文）。
-    - hint: その行動がプレイヤーのキャリアに与えそうな影響のニュアンスを一言で。
-
-    Output JSON ONLY:
-    {{
-      "title": "短いイベント名",
-      "description": "本文テキスト。改行は \\n を使う。",
-      "choices": [
-        {{"text":"...", "hint":"..." }},
-        {{"text":"...", "hint":"..." }},
-        {{"text":"...", "hint":"..." }}
-      ]
-    }}
+
+def generate_event_batch(player, days, placeholder=None):
     """
-    res = call_gemini(prompt)
-    if not res:
-        return {
-            "title": "静かな一日",
-            "description": "今日は大きな出来事はなかった。\\n\\n寮の部屋で一人、次の練習と試合のことを考えながらストレッチをしている。",
-            "choices": [{"text": "軽く自主練に出る", "hint": "わずかに成長"}]
-        }
-    return res
+    今日から days 日分のイベントを1回の呼び出しでまとめて生成する。
+    先頭イベントの description はストリーミング表示できる。
+    """
+    res = call_gemini(
+        event_prompts.event_batch_prompt(player, days), kind="event_batch", use_cache=False,
+        stream_field="description", on_text=placeholder_writer(placeholder, "info")
+    )
+    events = res.get("events", []) if res else []
+    return [ev for ev in events if isinstance(ev, dict)]
 
 
-def resolve_action(player, choice_text, event_desc):
-    prompt = f"""
-    あなたはリアル志向のサッカーコーチ兼ストーリーテラーです。
-
-    【前提状況】
-    - イベント本文: {event_desc}
-    - プレイヤーの選択: {choice_text}
-
-    【選手情報】
-    - 名前: {player.name}
-    - 所属: {player.team_name}
-    - カテゴリ: {player.team_category}
-    - ポジション: {player.position}
-    - 年齢: {player.age}
-    - 現在日付: {player.current_date}
-    - 現在CA: {player.ca:.2f}, PA: {player.pa:.2f}
-    - HP: {player.hp}, MP: {player.mp}
-
-    【タスク】
-    1. この選択をした結果、その日の出来事がどう展開したかを
-       一人称視点で 400〜800字程度のストーリー(result_story)にまとめること。
-       - 練習・試合内容、周囲の反応、自分の感情や身体感覚、
-         帰り道や夜のベッドの中での反芻までを描いてよい。
-       - 「成功した／失敗した」だけでなく、モヤモヤや学びも描写すること。
-
-    2. その日のサッカー活動強度(Base)と、体感採点に対応するPerformanceを決めること。
-       - Base: TRや試合、自主練の合計。だいたい 0.01〜0.30 の範囲。
-       - Performance: 0.6〜1.5（標準は0.8〜1.0）
-
-    3. 成長させるべき能力(grow_stats)を2〜6個程度選び、
-       それぞれ 0.01〜0.30 程度の微小な成長値を割り当てること。
-       - 行動内容に整合的な能力のみを上げること
-         （例: ハードなフィジカルトレ → Stamina, Strength など）。
-       - JSONのキーは game_data.WEIGHTS にある能力名と一致させること。
-
-    4. 必要に応じて人間関係relation_changeも1件だけ指定してよい。
-       - role: 関係性のラベル（例: "監督", "チームメイト", "恋人" など）
-       - val: -10〜+10の整数。
-
-    【出力フォーマット】
-    以下のJSONだけを出力してください:
+def resolve_action(player, choice_text, event_desc, placeholder=None):
+    res = call_gemini(
+        event_prompts.resolve_action_prompt(player, choice_text, event_desc), kind="resolve_action",
+        use_cache=False, stream_field="result_story", on_text=placeholder_writer(placeholder)
+    )
+    # API不調時でも1日を進められるよう、控えめな結果を返す
+    return res or event_prompts.fallback_resolution(choice_text)
 
-    {{
-      "result_story": "本文。改行は \\n を使う。",
-      "grow_stats": {{
-         "Decisions": 0.05,
-         "Acceleration": 0.10
-      }},
-      "hp_cost": 10,
-      "mp_cost": 5,
-      "relation_change": {{
-         "role": "監督",
-         "val": 3
-      }},
-      "base": 0.12,
-      "performance": 0.9
-    }}
+
+def get_speculator():
+    spec = st.session_state.get("speculator")
+    if spec is None:
+        spec = speculation.Speculator()
+        st.session_state.speculator = spec
+    spec.max_wasted = int(speculation_cap)
+    return spec
+
+
+def speculative_resolution(player, choice_text, event_desc):
+    """先読み用の解決。失敗時は控えめな既定値ではなく None を返し、本番の呼び出しに任せる。"""
+    return call_gemini(
+        event_prompts.resolve_action_prompt(player, choice_text, event_desc), kind="resolve_action",
+        use_cache=False, caller="speculate_choices",
+    )
+
+
+def speculative_event(player):
+    """先読み用の次イベント。失敗時は None（既定イベントを先読み結果として使わない）。"""
+    return call_gemini(
+        event_prompts.next_event_prompt(player), kind="next_event", use_cache=False,
+        caller="speculate_next_event",
+    )
+
+
+def speculate_choices(player, ev):
+    """表示中イベントの全選択肢を裏で解決しておく。"""
+    if not speculation_enabled or not ev or llm_backend is None:
+        return
+    spec = get_speculator()
+    version = speculation.state_version(player)
+    snap = None
+    for c in ev.get("choices", []):
+        text = c.get("text")
+        if not text:
+            continue
+        snap = snap or speculation.snapshot(player)
+        spec.speculate(
+            version, "resolve", text,
+            rate_limit.with_priority(rate_limit.PRIORITY_SPECULATIVE, speculative_resolution),
+            snap, text, ev.get("description"),
+        )
+
+
+def speculate_next_event(player):
+    """解決を反映した直後に、次のイベントを裏で生成しておく。"""
+    if not speculation_enabled or llm_backend is None:
+        return
+    spec = get_speculator()
+    version = speculation.state_version(player)
+    # 前日の使われなかった先読みは新しい日の上限に数える
+    spec.new_day()
+    spec.invalidate(keep_version=version)
+    if get_event_queue().has_event_for(player):
+        # キューに翌日分があれば先読みは不要
+        return
+    spec.speculate(
+        version, "event", None,
+        rate_limit.with_priority(rate_limit.PRIORITY_SPECULATIVE, speculative_event),
+        speculation.snapshot(player),
+    )
+
+
+def resolve_choice(player, choice_text, event_desc, placeholder=None):
+    """先読みが完了済みならその結果を使い、まだなら取り消して resolve_action をストリーミングで呼ぶ。"""
+    if speculation_enabled:
+        res = get_speculator().take(speculation.state_version(player), "resolve", choice_text)
+        if res:
+            return res
+    return resolve_action(player, choice_text, event_desc, placeholder=placeholder)
+
+
+def get_event_queue():
+    queue = st.session_state.get("event_queue")
+    if queue is None:
+        queue = event_queue.EventQueue()
+        st.session_state.event_queue = queue
+    return queue
+
+
+def next_event(player, placeholder=None):
     """
-    return call_gemini(prompt)
+    次のイベントを返す。優先順位は
+    一括生成キュー → 先読み済みイベント → 一括生成（有効時） → generate_next_event。
+    """
+    queue = get_event_queue()
+    ev = queue.pop_for(player)
+    if ev:
+        return ev
+    if speculation_enabled:
+        ev = get_speculator().take(speculation.state_version(player), "event")
+        if ev:
+            return ev
+    if event_batch_days > 1:
+        events = generate_event_batch(player, event_batch_days, placeholder=placeholder)
+        if queue.fill(player, events):
+            ev = queue.pop_for(player)
+            if ev:
+                return ev
+    return generate_next_event(player, placeholder=placeholder)
+
+
+def summarize_career(name, summary, pending):
+    """要約と未要約の日々を1本の新しい要約にまとめる（失敗時は None）。"""
+    res = call_gemini(career_memory.summary_prompt(name, summary, pending), kind="memory", use_cache=False)
+    return res.get("summary") if res else None
+
+
+def play_day(player, ev, choice_text, res):
+    """解決結果を1日分反映して保存し、オファー通知・記憶の要約・次イベントの先読みまで済ませる。"""
+    day = engine.CareerEngine(player, save_path=game_data.SAVE_PATH, compact_memory=False).step(
+        res, ev, choice_text
+    )
+    if day.match:
+        st.session_state.messages.append({"role": "assistant", "content": f"⚽ 試合結果: {day.match}"})
+    if day.offer:
+        st.session_state.transfer_notice = day.offer
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": f"📩 新しいオファー\n{offer_summary_text(day.offer)}"
+        })
+    st.session_state.current_event = None
+    schedule_memory_compaction(player)
+    speculate_next_event(player)
+    return day
+
+
+FAST_FORWARD_REASONS = {
+    engine.STOP_MATCH: "試合日",
+    engine.STOP_BIRTHDAY: "誕生日",
+    engine.STOP_CUTOFF: "年度末",
+    engine.STOP_DATE: "指定日",
+    engine.STOP_OFFER: "オファー到着",
+}
+
+
+def run_fast_forward(player, stops, until=None):
+    """通常の日をローカルで処理して次の区切りまで進め、ログ・通知・保存を済ませる。"""
+    result = engine.fast_forward(player, until=until, stops=stops)
+    if not result.days:
+        # 1日も進んでいなければ、今日のイベントや先読み分はそのまま使える
+        st.toast(f"{FAST_FORWARD_REASONS.get(result.reason, result.reason)}のため早送りできません")
+        return result
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": f"⏩ {result.summary()}\n→ {FAST_FORWARD_REASONS.get(result.reason, result.reason)}で停止",
+    })
+    for offer in result.offers:
+        st.session_state.transfer_notice = offer
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": f"📩 新しいオファー\n{offer_summary_text(offer)}"
+        })
+    st.session_state.current_event = None
+    # 早送りした日付分の一括生成イベントは使えない
+    get_event_queue().invalidate("fast_forward")
+    game_data.save_game(player)
+    schedule_memory_compaction(player)
+    speculate_next_event(player)
+    return result
+
+
+def schedule_memory_compaction(player):
+    """未要約の日々が数日分たまったら、モデルでの要約を裏で走らせる。"""
+    collect_memory_job(player)
+    memory = career_memory.CareerMemory(player.memory)
+    if not memory.due() or "memory_job" in st.session_state:
+        return
+    if llm_backend is None:
+        memory.compact_locally()
+        return
+    summary, pending = memory.compaction_input()
+    fut = background.submit(
+        rate_limit.with_priority(rate_limit.PRIORITY_BACKGROUND, summarize_career),
+        player.name, summary, pending,
+    )
+    st.session_state.memory_job = (fut, pending[-1]["date"])
+
+
+def collect_memory_job(player):
+    """裏で走らせた要約が終わっていれば記憶に反映する（失敗ならローカルで畳む）。"""
+    job = st.session_state.get("memory_job")
+    if not job or not job[0].done():
+        return
+    fut, through = job
+    del st.session_state.memory_job
+    memory = career_memory.CareerMemory(player.memory)
+    try:
+        summary = fut.result()
+    except Exception as e:
+        logger.warning("memory compaction failed: %s", e)
+        summary = None
+    if summary:
+        memory.apply_summary(summary, through)
+    else:
+        memory.compact_locally(sum(1 for p in memory.pending if p["date"] <= through))
 
 
 # ==========================================
@@ -957,7 +1281,7 @@ if st.session_state.game_phase == "start":
 # --- 1. 入力フェーズ ---
 elif st.session_state.game_phase == "create":
     st.title("📝 選手エントリーシート")
-    if not api_key:
+    if llm_backend is None:
         st.error("← サイドバー(左上)を開いてAPIキーを設定してください")
         st.stop()
 
@@ -1028,12 +1352,9 @@ elif st.session_state.game_phase == "review_stats":
 
     data = st.session_state.temp_data["stats"]
 
-    # Gemini が返した attributes に、FM準拠の全キーをマージして 10.0 で初期化する
-    raw_attr = data.get("attributes", {}) or {}
-    base_attrs = {k: 10.0 for k in game_data.WEIGHTS.keys()}
-    for k in base_attrs.keys():
-        if k in raw_attr and raw_attr[k] is not None:
-            base_attrs[k] = float(raw_attr[k])
+    # attributes はスキーマ検証で数値化済み。欠けたキーだけ 10.0 で補う
+    raw_attr = data.get("attributes", {})
+    base_attrs = {k: raw_attr.get(k, 10.0) for k in game_data.WEIGHTS.keys()}
 
     c1, c2 = st.columns(2)
     with c1:
@@ -1055,8 +1376,8 @@ elif st.session_state.game_phase == "review_stats":
         )
 
         st.write("経済")
-        funds = st.number_input("所持金", value=safe_int(data.get("funds", 100000)))
-        salary = st.number_input("年俸", value=safe_int(data.get("salary", 0)))
+        funds = st.number_input("所持金", value=data.get("funds", 100000))
+        salary = st.number_input("年俸", value=data.get("salary", 0))
 
     if st.button("確定して入団"):
         prof = st.session_state.temp_data["base"]
@@ -1093,6 +1414,7 @@ elif st.session_state.game_phase == "review_stats":
             )
 
         st.session_state.player = p
+        start_onboarding_pipeline(p)
 
         # カテゴリに応じて次フェーズを分岐
         cat_raw = p.team_category or ""
@@ -1145,14 +1467,16 @@ elif st.session_state.game_phase == "pro_contract":
     p = st.session_state.player
     st.title("📝 契約交渉")
 
+    story_area = st.empty()
     if "pro_contract_story" not in st.session_state:
         with st.spinner("契約交渉のシーンを生成中..."):
             st.session_state.pro_contract_story = generate_story(
                 p,
-                "代理人（または自分）とクラブが年俸や契約年数について詰めている契約交渉のシーン"
+                "代理人（または自分）とクラブが年俸や契約年数について詰めている契約交渉のシーン",
+                placeholder=story_area
             )
 
-    st.markdown(st.session_state.pro_contract_story)
+    story_area.markdown(st.session_state.pro_contract_story)
 
     # いまは条件いじらず、演出だけ
     if st.button("契約にサインする"):
@@ -1165,15 +1489,16 @@ elif st.session_state.game_phase == "story_intro":
     p = st.session_state.player
     st.title("🎬 入団")
 
+    story_area = st.empty()
     if "intro_text" not in st.session_state:
         with st.spinner("物語を生成中..."):
             if p.team_category in ["Professional", "Youth"]:
                 topic = "入団会見とメディア向けフォトセッション"
             else:
                 topic = "部室での自己紹介"
-            st.session_state.intro_text = generate_story(p, topic)
+            st.session_state.intro_text = generate_story(p, topic, placeholder=story_area)
 
-    st.markdown(st.session_state.intro_text)
+    story_area.markdown(st.session_state.intro_text)
 
     if st.button("チームメイトと対面する"):
         # プロ/ユースはここからチーム内自己紹介へ
@@ -1186,6 +1511,7 @@ elif st.session_state.game_phase == "team_intro":
     p = st.session_state.player
     st.title("👥 チーム内自己紹介")
 
+    story_area = st.empty()
     if "intro_text" not in st.session_state:
         with st.spinner("自己紹介シーンを生成中..."):
             if p.team_category in ["University", "HighSchool"]:
@@ -1195,9 +1521,9 @@ elif st.session_state.game_phase == "team_intro":
             else:
                 topic = "チームメイトへの自己紹介"
 
-            st.session_state.intro_text = generate_story(p, topic)
+            st.session_state.intro_text = generate_story(p, topic, placeholder=story_area)
 
-    st.markdown(st.session_state.intro_text)
+    story_area.markdown(st.session_state.intro_text)
 
     if st.button("チームメイト一覧を確認する"):
         del st.session_state.intro_text
@@ -1214,7 +1540,10 @@ elif st.session_state.game_phase == "review_team":
             # 念のためここで再度カテゴリをチーム名から強制判定
             p.team_category = determine_category(p.team_name)
 
-            res = create_team_data(p.team_name, p.team_category, p.current_date)
+            res = onboarding_result(
+                "team_data",
+                lambda: create_team_data(p.team_name, p.team_category, p.current_date)
+            )
             if res:
                 p.formation = res.get("formation", "4-4-2")
                 members, fmt = game_data.TeamGenerator.generate_teammates(
@@ -1300,9 +1629,14 @@ elif st.session_state.game_phase == "team_weekly_plan":
     # まだ作っていなければ Gemini で生成
     if not getattr(p, "team_weekly_plan", None):
         with st.spinner("チームの週間スケジュールを作成中..."):
-            res = create_team_weekly_plan(p.team_name, p.team_category)
+            res = onboarding_result(
+                "weekly_plan",
+                lambda: create_team_weekly_plan(p.team_name, p.team_category)
+            )
             if res:
                 p.team_weekly_plan = res.get("plan", [])
+                # 先読みした時間割がこの計画を前提にしているか後で照合する
+                st.session_state.onboarding_plan = list(p.team_weekly_plan)
                 game_data.save_game(p)
 
     st.info("コーチ陣が決めたベースの週間スケジュールです。必要なら編集してください。")
@@ -1320,12 +1654,19 @@ elif st.session_state.game_phase == "team_weekly_plan":
 
     if st.button("確定して次へ"):
         p.team_weekly_plan = edited_plan.to_dict(orient="records")
+        p.invalidate_calendar("plan")
         game_data.save_game(p)
 
+        # 編集で週間スケジュールが変わったら、先読みした時間割は前提が崩れるので捨てる
+        pipe = st.session_state.get("onboarding")
+        if pipe is not None and p.team_weekly_plan != st.session_state.get("onboarding_plan"):
+            pipe.discard("timetable")
+
         # ★カテゴリ・年齢に応じて遷移先を分岐
-        if p.team_category == "University":
+        tt_kind = timetable_kind(p)
+        if tt_kind == "univ":
             st.session_state.game_phase = "univ_timetable"
-        elif p.team_category in ["HighSchool", "Youth"] and p.age <= 18:
+        elif tt_kind == "school":
             st.session_state.game_phase = "school_timetable"
         else:
             # 社会人・プロなどはそのまま年間日程へ
@@ -1340,7 +1681,7 @@ elif st.session_state.game_phase == "school_timetable":
 
     if not getattr(p, "school_timetable", None):
         with st.spinner("学校の時間割を作成中..."):
-            res = create_school_timetable(p)
+            res = onboarding_result("timetable", lambda: create_school_timetable(p))
             if res:
                 p.school_timetable = res.get("timetable", [])
                 game_data.save_game(p)
@@ -1360,6 +1701,7 @@ elif st.session_state.game_phase == "school_timetable":
 
     if st.button("確定して年間日程へ進む"):
         p.school_timetable = edited_tt.to_dict(orient="records")
+        p.invalidate_calendar("timetable")
         game_data.save_game(p)
         st.session_state.game_phase = "review_schedule"
         st.rerun()
@@ -1371,7 +1713,7 @@ elif st.session_state.game_phase == "univ_timetable":
 
     if not getattr(p, "school_timetable", None):
         with st.spinner("履修時間割を作成中..."):
-            res = create_univ_timetable(p)
+            res = onboarding_result("timetable", lambda: create_univ_timetable(p))
             if res:
                 # 大学でも school_timetable にまとめて持たせる
                 p.school_timetable = res.get("timetable", [])
@@ -1411,6 +1753,7 @@ elif st.session_state.game_phase == "univ_timetable":
 
     if st.button("確定して年間日程へ進む"):
         p.school_timetable = edited_tt.to_dict(orient="records")
+        p.invalidate_calendar("timetable")
         game_data.save_game(p)
         st.session_state.game_phase = "review_schedule"
         st.rerun()
@@ -1423,15 +1766,20 @@ elif st.session_state.game_phase == "review_schedule":
 
     if not p.schedule:
         with st.spinner("リーグ日程を編成中..."):
-            res = create_schedule_data(p.team_name, p.team_category, p.current_date.year)
+            res = onboarding_result(
+                "schedule",
+                lambda: create_schedule_data(p.team_name, p.team_category, p.current_date.year)
+            )
             if res:
-                # 大会メタ情報（今はまだ画面には出さないが、今後の順位表などで使う）
-                if hasattr(p, "competitions"):
-                    p.competitions = res.get("competitions", [])
+                # 共有テンプレートなので、このセッション用の書き換え可能なコピーを取る
+                res = team_store.thaw(res)
+                # 大会メタ情報（順位表のチーム数・大会名に使う）
+                p.competitions = res.get("competitions", [])
+                p.standings = {}
                 # 実際に使う年間日程
                 p.schedule = res.get("schedule", [])
                 if p.team_weekly_plan:
-                    aligned, changed = align_weekly_plan_with_schedule(p.team_weekly_plan, p.schedule)
+                    aligned, changed = align_weekly_plan_with_schedule(p.team_weekly_plan, p.schedule_index)
                     if changed:
                         p.team_weekly_plan = aligned
                         st.info("年間試合日程に合わせて週間スケジュールの試合日を同期しました。")
@@ -1445,8 +1793,9 @@ elif st.session_state.game_phase == "review_schedule":
 
     if st.button("日程確定 & シーズン開幕"):
         p.schedule = edited_sched.to_dict(orient='records')
+        p.invalidate_schedule()
         if p.team_weekly_plan:
-            aligned, changed = align_weekly_plan_with_schedule(p.team_weekly_plan, p.schedule)
+            aligned, changed = align_weekly_plan_with_schedule(p.team_weekly_plan, p.schedule_index)
             if changed:
                 p.team_weekly_plan = aligned
                 st.info("編集後の日程に合わせて週間スケジュールを調整しました。")
@@ -1459,18 +1808,20 @@ elif st.session_state.game_phase == "review_schedule":
 elif st.session_state.game_phase == "story_schedule":
     p = st.session_state.player
     st.title("⚽ シーズン開幕")
-    if p.schedule:
-        opener = p.schedule[0]
+    opener = p.schedule_index.first()
+    if opener:
         st.info(f"開幕戦は **{opener.get('date')}** vs **{opener.get('opponent')}** です！")
 
     if p.schedule:
-        outline = summarize_annual_outline(p.schedule, p.current_date.year)
+        outline = summarize_annual_outline(p.schedule_index, p.current_date.year)
         st.subheader("ざっくり年間スケジュール")
         st.dataframe(pd.DataFrame(outline), use_container_width=True)
 
     if st.button("日常パートへ"):
+        st.session_state.pop("onboarding", None)
+        st.session_state.pop("onboarding_plan", None)
         st.session_state.game_phase = "main"
-        ev = generate_next_event(p)
+        ev = next_event(p)
         st.session_state.current_event = ev
         st.rerun()
 
@@ -1479,6 +1830,12 @@ elif st.session_state.game_phase == "main":
     p = st.session_state.player
     p.update_hierarchy()
 
+    # ショップ購入や生活水準の変更などで状態が変わっていれば古い先読みは捨てる
+    if "speculator" in st.session_state:
+        st.session_state.speculator.invalidate(keep_version=speculation.state_version(p))
+    # 裏で走らせていた長期記憶の要約が終わっていれば取り込む
+    collect_memory_job(p)
+
     st.markdown(
         f"## ⚽ {p.name} <small>({p.team_name})</small>",
         unsafe_allow_html=True
@@ -1509,7 +1866,7 @@ elif st.session_state.game_phase == "main":
         render_stat(c6, "MP", f"{p.mp}")
 
         # 生活水準の即時切替（HPやコストに影響）
-        living_levels = {"節約": 1000, "標準": 3000, "充実": 8000}
+        living_levels = game_data.LIVING_COSTS
         new_level = st.select_slider(
             "生活水準 (1日コスト)",
             options=list(living_levels.keys()),
@@ -1621,24 +1978,21 @@ elif st.session_state.game_phase == "main":
 
         # ========== タブ: 順位表 ==========
         with tab_standings:
-            st.write("### 順位表（編集可）")
-            standings = p.competitions or []
-            if not standings:
-                # 簡易初期値：スケジュールから大会名を拾う
-                comp_names = list({m.get("competition", "") for m in p.schedule if m.get("competition")})
-                if not comp_names:
-                    comp_names = ["リーグ"]
-                standings = [
-                    {"competition": comp, "team": p.team_name, "played": 0, "win": 0, "draw": 0, "loss": 0, "points": 0}
-                    for comp in comp_names
-                ]
-
-            df_st = pd.DataFrame(standings)
-            edited_st = st.data_editor(df_st, num_rows="dynamic", use_container_width=True)
-            if st.button("順位表を保存"):
-                p.competitions = edited_st.to_dict(orient="records")
-                game_data.save_game(p)
-                st.toast("順位表を保存しました")
+            st.write("### 順位表")
+            if p.standings:
+                codes = list(p.standings)
+                code = codes[0]
+                if len(codes) > 1:
+                    code = st.selectbox("大会", codes, format_func=lambda c: p.standings[c].name)
+                table = p.standings[code]
+                own_rank = table.rank_of(p.team_name)
+                if own_rank:
+                    st.caption(f"{table.name}（{table.through} 終了時点） / {p.team_name} は {own_rank}位")
+                st.dataframe(pd.DataFrame(table.rows(highlight=p.team_name)), use_container_width=True)
+            else:
+                # 試合結果が入るまでは日程の大会ごとに 0 行を出す
+                st.info("リーグ戦の結果が入ると、他クラブの試合もあわせて順位表が自動で更新されます。")
+                st.dataframe(pd.DataFrame(standings.fallback_rows(p)), use_container_width=True)
 
         # ========== タブ: 年間日程 ==========
         with tab_year:
@@ -1653,27 +2007,20 @@ elif st.session_state.game_phase == "main":
 
         # ========== タブ: 週間日程（現在日付から7日分） ==========
         with tab_week:
-            from datetime import timedelta
-
             rows = []
-            for i in range(7):
-                d = p.current_date + timedelta(days=i)
-                d_str = str(d)
-                match = None
-                for m in p.schedule or []:
-                    if m.get("date") == d_str:
-                        match = m
-                        break
-                if match:
+            for day in p.calendar.week(p.current_date):
+                if day.match:
+                    match = p.schedule_index.on(day.date)
                     kind = "試合"
                     detail = f"vs {match.get('opponent', '')} ({'H' if match.get('home') else 'A'})"
                 else:
-                    kind = "トレーニング / 休養"
-                    detail = "-"
+                    kind = "トレーニング" if day.training else "休養"
+                    detail = day.line()
                 rows.append({
-                    "Date": d_str,
+                    "Date": str(day.date),
                     "Type": kind,
-                    "Detail": detail
+                    "Detail": detail,
+                    "負荷": round(day.intensity, 2),
                 })
 
             st.dataframe(
@@ -1849,136 +2196,78 @@ elif st.session_state.game_phase == "main":
         # イベントがない → 「時間を進める」ボタンだけ
         if not ev:
             if st.button("時間を進める", key="advance_time_main"):
+                event_area = st.empty()
                 with st.spinner("イベント生成中..."):
-                    ev_new = generate_next_event(p)
+                    ev_new = next_event(p, placeholder=event_area)
                     st.session_state.current_event = ev_new
                     st.rerun()
+
+            # 早送り: 何もない日はローカルで処理して、次の区切りの日まで一気に進める
+            stops = engine.next_stops(p)
+            ff_modes = {
+                "次の区切り（試合・誕生日・年度末）": engine.DEFAULT_STOPS,
+                "次の試合": (engine.STOP_MATCH,),
+                "次の誕生日": (engine.STOP_BIRTHDAY,),
+                "年度末 (3/31)": (engine.STOP_CUTOFF,),
+                "日付を指定": (),
+            }
+            ff_c1, ff_c2, ff_c3 = st.columns([2, 2, 1])
+            ff_mode = ff_c1.selectbox("⏩ 早送り", list(ff_modes), key="ff_mode")
+            ff_until = None
+            if ff_modes[ff_mode]:
+                ff_targets = [stops[k] for k in ff_modes[ff_mode] if k in stops]
+                ff_c2.caption(f"到着日: {min(ff_targets)}" if ff_targets else "該当する予定がありません")
+            else:
+                ff_until = ff_c2.date_input(
+                    "到着日",
+                    value=p.current_date + datetime.timedelta(days=7),
+                    min_value=p.current_date + datetime.timedelta(days=1),
+                    max_value=p.current_date + datetime.timedelta(days=engine.MAX_FAST_FORWARD_DAYS),
+                    key="ff_until",
+                )
+                ff_targets = [ff_until]
+            # 今日が試合日だと試合で止まるモードは1日も進めないので押せなくする
+            ff_blocked = engine.STOP_MATCH in ff_modes[ff_mode] and engine.match_on(p, p.current_date) is not None
+            if ff_blocked:
+                ff_c2.caption("今日は試合日です（試合を消化してから早送りできます）")
+            if ff_c3.button("早送り", key="ff_go", disabled=not ff_targets or ff_blocked):
+                run_fast_forward(p, ff_modes[ff_mode], ff_until)
+                st.rerun()
         else:
             # イベント表示
             if isinstance(ev, str):
                 ev = {"title": "Ev", "description": ev, "choices": []}
             st.markdown(f"**{ev.get('title')}**")
             st.info(ev.get('description'))
+            speculate_choices(p, ev)
 
             # 選択肢ボタン
             choices = ev.get('choices', [])
+            result_area = st.empty()
             if choices:
                 cols = st.columns(len(choices))
                 for i, c in enumerate(choices):
                     if cols[i].button(c.get('text'), help=c.get('hint'), key=f"choice_{i}"):
-                        res = resolve_action(p, c.get('text'), ev.get('description'))
+                        res = resolve_choice(p, c.get('text'), ev.get('description'), placeholder=result_area)
                         if res:
                             # ログ追加
                             st.session_state.messages.append({
                                 "role": "assistant",
                                 "content": f"**{c.get('text')}**\n{res.get('result_story')}"
                             })
-
-                            # 成長処理
-                            grow_stats = res.get("grow_stats", {})
-                            base_intensity = safe_float(res.get("base", 0.0))
-                            performance = safe_float(res.get("performance", 0.8))
-                            if base_intensity <= 0:
-                                base_intensity = 0.05
-
-                            target_ca_gain = p.compute_daily_growth_ca(
-                                base_intensity,
-                                performance
-                            )
-
-                            raw_gain = 0.0
-                            if grow_stats:
-                                tmp_attrs = p.attributes.copy()
-                                for k, v in grow_stats.items():
-                                    if k in tmp_attrs:
-                                        tmp_attrs[k] = min(
-                                            20.0,
-                                            tmp_attrs[k] + safe_float(v)
-                                        )
-                                tmp_total = sum(
-                                    tmp_attrs[key] * game_data.WEIGHTS[key]
-                                    for key in game_data.WEIGHTS.keys()
-                                )
-                                tmp_ca = (tmp_total / game_data.THEORETICAL_MAX_SCORE) * 200
-                                raw_gain = max(0.0, tmp_ca - p.ca)
-
-                            scale = 1.0
-                            if target_ca_gain > 0 and raw_gain > 0:
-                                scale = target_ca_gain / raw_gain
-
-                            for k, v in grow_stats.items():
-                                p.grow_attribute(k, safe_float(v) * scale)
-
-                            p.hp -= safe_int(res.get("hp_cost", 0))
-                            p.mp -= safe_int(res.get("mp_cost", 0))
-                            p.advance_day(1)
-                            offer = maybe_generate_transfer_offer(p)
-                            if offer:
-                                st.session_state.transfer_notice = offer
-                                st.session_state.messages.append({
-                                    "role": "assistant",
-                                    "content": f"📩 新しいオファー\n{offer_summary_text(offer)}"
-                                })
-                            st.session_state.current_event = None
-                            game_data.save_game(p)
+                            play_day(p, ev, c.get('text'), res)
                             st.rerun()
 
         # 自由記述アクション
         if ev:
             free = st.chat_input("自由記述で行動する", key="free_action")
             if free:
-                res = resolve_action(p, free, ev.get('description'))
+                res = resolve_choice(p, free, ev.get('description'), placeholder=result_area)
                 if res:
                     st.session_state.messages.append({"role": "user", "content": free})
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": res.get('result_story')
                     })
-
-                    grow_stats = res.get("grow_stats", {})
-                    base_intensity = safe_float(res.get("base", 0.0))
-                    performance = safe_float(res.get("performance", 0.8))
-                    if base_intensity <= 0:
-                        base_intensity = 0.05
-
-                    target_ca_gain = p.compute_daily_growth_ca(
-                        base_intensity,
-                        performance
-                    )
-
-                    raw_gain = 0.0
-                    if grow_stats:
-                        tmp_attrs = p.attributes.copy()
-                        for k, v in grow_stats.items():
-                            if k in tmp_attrs:
-                                tmp_attrs[k] = min(
-                                    20.0,
-                                    tmp_attrs[k] + safe_float(v)
-                                )
-                        tmp_total = sum(
-                            tmp_attrs[key] * game_data.WEIGHTS[key]
-                            for key in game_data.WEIGHTS.keys()
-                        )
-                        tmp_ca = (tmp_total / game_data.THEORETICAL_MAX_SCORE) * 200
-                        raw_gain = max(0.0, tmp_ca - p.ca)
-
-                    scale = 1.0
-                    if target_ca_gain > 0 and raw_gain > 0:
-                        scale = target_ca_gain / raw_gain
-
-                    for k, v in grow_stats.items():
-                        p.grow_attribute(k, safe_float(v) * scale)
-
-                    p.hp -= safe_int(res.get("hp_cost", 0))
-                    p.mp -= safe_int(res.get("mp_cost", 0))
-                    p.advance_day(1)
-                    offer = maybe_generate_transfer_offer(p)
-                    if offer:
-                        st.session_state.transfer_notice = offer
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": f"📩 新しいオファー\n{offer_summary_text(offer)}"
-                        })
-                    st.session_state.current_event = None
-                    game_data.save_game(p)
+                    play_day(p, ev, free, res)
                     st.rerun()
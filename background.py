@@ -0,0 +1,183 @@
+"""Shared thread pool and a small dependency-aware task graph.
+
+LLM generations are network bound, so running independent ones on threads
+lets a phase simply wait on a future that is usually already finished.  The
+executor is process-wide (this module is imported once per Streamlit server
+process), while each session keeps its own :class:`TaskGraph` in
+``st.session_state``.  :class:`SingleFlight` lets concurrent sessions that
+ask for the same thing share one in-flight computation.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix="llm-bg"
+            )
+        return _executor
+
+
+def submit(fn: Callable[..., Any], *args: Any) -> Future:
+    """Submit to the shared pool, carrying the caller's context variables.
+
+    Worker threads otherwise start with an empty context, which would lose
+    the session and priority that ``rate_limit`` reads for scheduling.
+    """
+    ctx = contextvars.copy_context()
+    return get_executor().submit(ctx.run, fn, *args)
+
+
+class TaskGraph:
+    """Named futures where a task may start only after the tasks it depends on.
+
+    Dependent tasks are scheduled from done-callbacks instead of blocking a
+    worker on ``Future.result()``, so a small pool can never deadlock on a
+    chain of waiting tasks.
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None):
+        self._executor = executor or get_executor()
+        self._futures: Dict[str, Future] = {}
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        after: Iterable[str] = (),
+    ) -> Future:
+        """Run ``fn(*args, *results_of_after)`` once every dependency is done."""
+        deps = [self._futures[d] for d in after]
+        if not deps:
+            fut = self._executor.submit(contextvars.copy_context().run, fn, *args)
+            self._futures[name] = fut
+            return fut
+
+        outer: Future = Future()
+        ctx = contextvars.copy_context()
+        remaining = [len(deps)]
+        lock = threading.Lock()
+
+        def _run() -> None:
+            if not outer.set_running_or_notify_cancel():
+                return
+            try:
+                dep_results = [d.result() for d in deps]
+                outer.set_result(fn(*args, *dep_results))
+            except BaseException as exc:  # noqa: BLE001 - 呼び出し側に伝搬させる
+                outer.set_exception(exc)
+
+        def _on_dep_done(_: Future) -> None:
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self._executor.submit(ctx.run, _run)
+
+        for d in deps:
+            d.add_done_callback(_on_dep_done)
+        self._futures[name] = outer
+        return outer
+
+    def has(self, name: str) -> bool:
+        return name in self._futures
+
+    def done(self, name: str) -> bool:
+        fut = self._futures.get(name)
+        return bool(fut and fut.done())
+
+    def result(self, name: str, default: Any = None, timeout: Optional[float] = None) -> Any:
+        """Wait for ``name`` and return its value, or ``default`` on failure."""
+        fut = self._futures.get(name)
+        if fut is None:
+            return default
+        try:
+            return fut.result(timeout=timeout)
+        except Exception as exc:
+            logger.warning("background task %s failed: %s", name, exc)
+            return default
+
+    def pop(self, name: str, default: Any = None, timeout: Optional[float] = None) -> Any:
+        value = self.result(name, default=default, timeout=timeout)
+        self._futures.pop(name, None)
+        return value
+
+    def discard(self, name: str) -> None:
+        fut = self._futures.pop(name, None)
+        if fut is not None:
+            fut.cancel()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving
+    while it is still running wait on the same future instead of starting
+    their own.  Nothing is remembered once the call finishes; persistence is
+    the job of the caches in front of this.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Tuple[Any, bool]:
+        """Return ``(value, shared)``; ``shared`` is True for waiting followers."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                fut.set_running_or_notify_cancel()
+                self._inflight[key] = fut
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return fut.result(), True
+        try:
+            value = fn(*args)
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(value)
+            return value, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide :class:`SingleFlight` shared by every Streamlit session."""
+    global _flight
+    with _executor_lock:
+        if _flight is None:
+            _flight = SingleFlight()
+        return _flight
@@ -0,0 +1,196 @@
+"""Rolling long-term memory of a career with a bounded prompt slice.
+
+Every resolved day appends a short entry to ``pending`` and may add a
+structured fact (a match day, a relationship shift, an injury scare, a
+transfer).  Every few days the pending entries are folded into a fixed-size
+rolling summary — by the model in the background when available, locally
+otherwise — so the stored state stays bounded however long the career runs.
+:meth:`CareerMemory.context` returns the slice injected into event prompts:
+the summary, the most important facts and the last few days, cut to a
+constant number of characters whether it is day 10 or day 1000.
+
+The state is a plain dict kept on ``Player.memory`` so it is saved with the
+rest of the player.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+SUMMARY_CHARS = 800
+MAX_FACTS = 40
+MAX_PENDING = 60
+GIST_CHARS = 160
+COMPACT_EVERY_DAYS = 7
+INJECT_FACTS = 6
+INJECT_RECENT = 3
+CONTEXT_CHARS = 1000
+
+RELATION_FACT_MIN = 3
+INJURY_HP_COST = 25
+INJURY_WORDS = ("怪我", "負傷", "痛め", "離脱", "捻挫", "骨折", "肉離れ")
+
+# 種別ごとの重み（注入時はこの順で残す）
+FACT_WEIGHTS: Dict[str, int] = {
+    "transfer": 5,
+    "injury": 4,
+    "match": 3,
+    "relation": 2,
+    "milestone": 2,
+}
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def _clip_head(text: str, limit: int) -> str:
+    """Keep the most recent end of a running summary."""
+    text = (text or "").strip()
+    return text if len(text) <= limit else "…" + text[-(limit - 1):]
+
+
+class CareerMemory:
+    def __init__(self, state: Optional[Dict] = None):
+        self.state = state if state is not None else {}
+        self.state.setdefault("summary", "")
+        self.state.setdefault("facts", [])
+        self.state.setdefault("pending", [])
+        self.state.setdefault("compacted_through", None)
+
+    @property
+    def summary(self) -> str:
+        return self.state["summary"]
+
+    @property
+    def facts(self) -> List[Dict]:
+        return self.state["facts"]
+
+    @property
+    def pending(self) -> List[Dict]:
+        return self.state["pending"]
+
+    # --- Recording -----------------------------------------------------
+    def record_day(
+        self,
+        date: str,
+        title: str,
+        choice: str,
+        story: str,
+        result: Optional[Dict] = None,
+        match: Optional[Dict] = None,
+    ) -> None:
+        """Log one resolved day and pull structured facts out of it."""
+        result = result or {}
+        self.pending.append({
+            "date": date,
+            "title": _clip(title, 40),
+            "choice": _clip(choice, 40),
+            "gist": _clip(story, GIST_CHARS),
+        })
+        if match:
+            score = f" {match['score']}" if match.get("score") else ""
+            self.add_fact(date, "match", f"vs {match.get('opponent', '未定')}{score}の試合日「{_clip(title, 30)}」")
+        rel = result.get("relation_change") or {}
+        try:
+            val = int(rel.get("val", 0))
+        except (TypeError, ValueError):
+            val = 0
+        if abs(val) >= RELATION_FACT_MIN:
+            self.add_fact(date, "relation", f"{rel.get('role', '誰か')}との関係 {val:+d}（{_clip(title, 30)}）")
+        try:
+            hp_cost = int(result.get("hp_cost", 0))
+        except (TypeError, ValueError):
+            hp_cost = 0
+        if hp_cost >= INJURY_HP_COST or any(w in (story or "") for w in INJURY_WORDS):
+            self.add_fact(date, "injury", f"体を痛めた/大きく消耗した（{_clip(title, 30)}）")
+        if len(self.pending) > MAX_PENDING:
+            # 要約が長く失敗し続けても溜め込まない
+            self.compact_locally(len(self.pending) - MAX_PENDING)
+
+    def record_transfer(self, date: str, from_team: str, to_team: str) -> None:
+        self.add_fact(date, "transfer", f"{from_team} から {to_team} へ移籍")
+
+    def add_fact(self, date: str, kind: str, text: str) -> None:
+        if any(f["date"] == date and f["type"] == kind for f in self.facts):
+            return
+        self.facts.append({"date": date, "type": kind, "text": text, "weight": FACT_WEIGHTS.get(kind, 1)})
+        if len(self.facts) > MAX_FACTS:
+            # 重みが低く古いものから捨てる
+            drop = min(range(len(self.facts)), key=lambda i: (self.facts[i]["weight"], self.facts[i]["date"]))
+            del self.facts[drop]
+
+    # --- Compaction ----------------------------------------------------
+    def due(self, every_days: int = COMPACT_EVERY_DAYS) -> bool:
+        return len(self.pending) >= every_days
+
+    def compaction_input(self) -> Tuple[str, List[Dict]]:
+        """Copy of what a compaction run needs (safe to hand to a worker)."""
+        return self.summary, [dict(p) for p in self.pending]
+
+    def apply_summary(self, summary: str, through: str) -> None:
+        """Install a new summary covering every pending day up to ``through``."""
+        self.state["summary"] = _clip_head(summary, SUMMARY_CHARS)
+        self.state["pending"] = [p for p in self.pending if p["date"] > through]
+        self.state["compacted_through"] = through
+
+    def compact_locally(self, count: Optional[int] = None) -> None:
+        """Fallback without the model: fold the oldest entries in as title lines."""
+        items = self.pending[: count or len(self.pending)]
+        if not items:
+            return
+        lines = "\n".join(f"{p['date']} {p['title']}（{p['choice']}）" for p in items)
+        merged = f"{self.summary}\n{lines}" if self.summary else lines
+        self.apply_summary(merged, items[-1]["date"])
+
+    # --- Injection -----------------------------------------------------
+    def _top_facts(self, k: int) -> List[Dict]:
+        """Latest fact of each type first, then the rest by weight and recency."""
+        ranked = sorted(self.facts, key=lambda f: (f["weight"], f["date"]), reverse=True)
+        latest: Dict[str, Dict] = {}
+        for f in sorted(self.facts, key=lambda f: f["date"], reverse=True):
+            latest.setdefault(f["type"], f)
+        picked = sorted(latest.values(), key=lambda f: f["weight"], reverse=True)[:k]
+        for f in ranked:
+            if len(picked) >= k:
+                break
+            if f not in picked:
+                picked.append(f)
+        return picked
+
+    def context(self, max_chars: int = CONTEXT_CHARS) -> str:
+        """Bounded slice for prompts: summary, top facts, last few days."""
+        parts = []
+        if self.summary:
+            parts.append("これまで: " + _clip_head(self.summary, max_chars // 2))
+        facts = self._top_facts(INJECT_FACTS)
+        if facts:
+            parts.append("重要な出来事:\n" + "\n".join(
+                f"- {f['date']} {f['text']}" for f in sorted(facts, key=lambda f: f["date"])
+            ))
+        recent = self.pending[-INJECT_RECENT:]
+        if recent:
+            parts.append("直近:\n" + "\n".join(f"- {p['date']} {p['title']} → {p['choice']}" for p in recent))
+        text = "\n".join(parts)
+        return text[:max_chars] if text else "まだ大きな出来事はない"
+
+
+def summary_prompt(name: str, summary: str, pending: List[Dict]) -> str:
+    """Request to fold ``pending`` into ``summary`` (output ``{"summary": ...}``)."""
+    days = "\n".join(f"- {p['date']} {p['title']} / 選択: {p['choice']} / {p['gist']}" for p in pending)
+    return f"""
+    あなたはサッカー選手 {name} のキャリア記録係です。
+    [これまでの要約] に [新しい日々] を統合し、{SUMMARY_CHARS}字以内の新しい要約を書いてください。
+    - 時系列を保ち、古い細部は大胆に省き、転機（試合・人間関係の変化・怪我・移籍）を優先する。
+    - 事実だけを三人称で簡潔に。創作で補わない。
+
+    [これまでの要約]
+    {summary or "（まだない）"}
+
+    [新しい日々]
+    {days}
+
+    Output JSON ONLY:
+    {{"summary": "..."}}
+    """
@@ -0,0 +1,666 @@
+"""Headless career engine: the daily loop without Streamlit.
+
+One day of a career is: pick an event, choose an action, resolve it, then
+apply the result to the :class:`game_data.Player` (growth scaled to the
+day's target CA gain, HP/MP costs, ``advance_day`` with its upkeep and
+rollovers, a possible transfer offer, the career memory).  ``app.py``
+calls :meth:`CareerEngine.step` with the result the player picked in the
+UI; :meth:`CareerEngine.run` drives the whole loop with a pluggable
+:class:`Resolver`:
+
+* :class:`RuleResolver` — local events and outcomes from a small action
+  table, no model calls at all (thousands of days per second).
+* :class:`LLMResolver` — the same prompts as the UI (:mod:`event_prompts`)
+  sent straight to an :mod:`llm_backends` backend, so ``stub`` and
+  ``replay`` cassettes run whole careers offline.
+* :class:`CachedResolver` — memoises another resolver's outcomes per
+  ``(event, action, category)`` for batch runs where events repeat.
+
+:func:`fast_forward` resolves routine days locally (the weekly plan via
+:class:`RoutineResolver`) up to the next match, birthday, 3/31 or a chosen
+date, so a quiet week costs milliseconds instead of seven model calls.
+
+Run ``python engine.py --days 365`` to simulate a career and stream one
+JSON line of state per day.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import datetime
+import json
+import random
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import career_memory
+import event_prompts
+import game_data
+import llm_backends
+import match_engine
+import routing
+import schemas
+import season_calendar
+import standings
+
+safe_float = schemas.safe_float
+safe_int = schemas.safe_int
+
+# --- Transfer offers -------------------------------------------------------
+OFFER_BUCKETS: Tuple[Tuple[float, str], ...] = (
+    (37, "大学下位チームベンチ"),
+    (40, "大学Dスタメン"),
+    (45, "大学Cベンチ"),
+    (50, "大学Cスタメン"),
+    (55, "大学Bベンチ"),
+    (60, "大学Bスタメン可"),
+    (70, "大学Aスタメン争い"),
+    (80, "大学Aスタメン / JFL特指クラス"),
+    (90, "J1練習参加・特指レベル"),
+    (100, "J1正規メンバー"),
+    (110, "海外挑戦可能な若手"),
+    (130, "J1エース級"),
+    (140, "日本代表入りレベル"),
+    (150, "日本代表主力"),
+    (160, "欧州主要リーグスタメン級"),
+    (170, "欧州トップクラブ主力候補"),
+    (180, "世界的ビッグクラブ争奪戦"),
+    (200, "歴史的レジェンド"),
+)
+OFFER_LEAGUES = (
+    "明治安田J1リーグ", "明治安田J2リーグ", "関東大学サッカーリーグ1部", "関西学生リーグ1部",
+    "プレミアリーグ", "セリエA", "リーガ・エスパニョーラ", "ブンデスリーガ",
+)
+OFFER_CLUB_PREFIX = ("FC", "SC", "AC", "ユナイテッド", "シティ", "ヴィレッジ", "カレッジ")
+OFFER_CLUB_SUFFIX = ("東京", "大阪", "名古屋", "札幌", "マドリード", "ロンドン", "デュッセルドルフ", "フィレンツェ")
+
+
+def ca_offer_bucket(ca: float) -> str:
+    for bound, label in OFFER_BUCKETS:
+        if ca <= bound:
+            return label
+    return "特級"  # safety
+
+
+def offer_chance(ca: float) -> float:
+    if ca >= 80:
+        return 0.12
+    if ca >= 60:
+        return 0.08
+    if ca >= 45:
+        return 0.05
+    if ca >= 37:
+        return 0.03
+    return 0.0
+
+
+def maybe_generate_transfer_offer(player, rng=random) -> Optional[Dict]:
+    """Create a transfer offer based on CA buckets and return it if triggered."""
+    ca = player.ca
+    if rng.random() > offer_chance(ca):
+        return None
+    category = "Professional" if ca >= 70 else player.team_category
+    offer = {
+        "club": f"{rng.choice(OFFER_CLUB_SUFFIX)}{rng.choice(OFFER_CLUB_PREFIX)}",
+        "league": rng.choice(OFFER_LEAGUES),
+        "category": category,
+        "status": "new",
+        "bucket": ca_offer_bucket(ca),
+        "created": player.current_date.isoformat(),
+        "salary": max(player.salary, int(500000 + ca * 10_000)),
+    }
+    player.transfer_offers.append(offer)
+    return offer
+
+
+# --- Growth ----------------------------------------------------------------
+def growth_scale(player, grow_stats: Dict[str, float], target_ca_gain: float) -> float:
+    """Factor that makes ``grow_stats`` add up to ``target_ca_gain`` CA."""
+    raw_gain = player.attributes.preview_gain(grow_stats)
+    if target_ca_gain > 0 and raw_gain > 0:
+        return target_ca_gain / raw_gain
+    return 1.0
+
+
+def apply_growth(player, res: Dict) -> float:
+    """Apply a resolution's ``grow_stats``; returns the CA gained."""
+    grow_stats = {k: safe_float(v) for k, v in (res.get("grow_stats") or {}).items()}
+    base_intensity = safe_float(res.get("base", 0.0))
+    performance = safe_float(res.get("performance", 0.8))
+    if base_intensity <= 0:
+        base_intensity = 0.05
+    target_ca_gain = player.compute_daily_growth_ca(base_intensity, performance)
+    return player.grow_attributes(grow_stats, growth_scale(player, grow_stats, target_ca_gain))
+
+
+def match_on(player, date: datetime.date) -> Optional[Dict]:
+    return player.schedule_index.on(date)
+
+
+def match_line(player, outcome, table=None) -> str:
+    """The match summary, with the team's league position when there is a table."""
+    line = outcome.line()
+    rank = table.rank_of(player.team_name) if table is not None else None
+    if rank:
+        line += f" / {table.name} {rank}位"
+    return line
+
+
+# --- Day records -----------------------------------------------------------
+@dataclasses.dataclass
+class DayResult:
+    date: str
+    title: str
+    choice: str
+    story: str
+    ca: float
+    ca_gain: float
+    hp: int
+    mp: int
+    funds: int
+    age: int
+    grade: str
+    team: str
+    offer: Optional[Dict] = None
+    match: Optional[str] = None
+
+    def to_dict(self, story_chars: Optional[int] = None) -> Dict:
+        data = dataclasses.asdict(self)
+        data["ca"] = round(self.ca, 3)
+        data["ca_gain"] = round(self.ca_gain, 4)
+        if story_chars is not None:
+            data["story"] = self.story[:story_chars]
+        return data
+
+
+# --- Resolvers -------------------------------------------------------------
+class Resolver:
+    """Interface: an event for today, the action to take, and its outcome."""
+
+    name = "base"
+
+    def next_event(self, player) -> Dict:
+        raise NotImplementedError
+
+    def choose(self, player, event: Dict) -> str:
+        choices = [c.get("text") for c in event.get("choices", []) if c.get("text")]
+        return choices[0] if choices else "いつも通り過ごす"
+
+    def resolve(self, player, event: Dict, choice: str) -> Dict:
+        raise NotImplementedError
+
+
+# 行動テーブル（grow_stats は WEIGHTS のキー、hp_cost/mp_cost が負なら回復）
+RULE_ACTIONS: Tuple[Dict, ...] = (
+    {"text": "全体練習に全力で取り組む", "hint": "総合的に成長",
+     "grow_stats": {"WorkRate": 0.08, "Teamwork": 0.06, "Stamina": 0.05, "Decisions": 0.04},
+     "hp_cost": 12, "mp_cost": 4, "base": 0.15},
+    {"text": "居残りでシュート練習", "hint": "決定力が伸びる",
+     "grow_stats": {"Finishing": 0.1, "FirstTouch": 0.05, "Composure": 0.04},
+     "hp_cost": 15, "mp_cost": 3, "base": 0.18},
+    {"text": "映像で戦術を学ぶ", "hint": "判断力が伸びる",
+     "grow_stats": {"Positioning": 0.06, "Anticipation": 0.06, "Vision": 0.05, "Decisions": 0.05},
+     "hp_cost": 2, "mp_cost": 6, "base": 0.08},
+    {"text": "フィジカルを追い込む", "hint": "身体が強くなるが消耗",
+     "grow_stats": {"Strength": 0.08, "Acceleration": 0.06, "Pace": 0.05, "Stamina": 0.06},
+     "hp_cost": 20, "mp_cost": 6, "base": 0.2},
+    {"text": "しっかり休養する", "hint": "回復",
+     "grow_stats": {"Determination": 0.01},
+     "hp_cost": -25, "mp_cost": -15, "base": 0.02},
+)
+RULE_MATCH_ACTION = {
+    "text": "試合に集中する", "hint": "結果次第で大きく成長",
+    "grow_stats": {"Composure": 0.06, "ImportantMatches": 0.05, "Decisions": 0.05, "OffTheBall": 0.04},
+    "hp_cost": 20, "mp_cost": 10, "base": 0.25,
+}
+RULE_EVENT_TITLES = (
+    "朝練のグラウンド", "ロッカールームの噂", "監督の視線", "寮の夜", "雨の日の練習",
+    "紅白戦のメンバー", "先輩からの一言", "オフの過ごし方",
+)
+REST_BELOW_HP = 35
+
+
+class RuleResolver(Resolver):
+    """Model-free resolver: fixed action table, seeded randomness."""
+
+    name = "rule"
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+
+    def next_event(self, player) -> Dict:
+        match = match_on(player, player.current_date)
+        if match:
+            return {
+                "title": f"vs {match.get('opponent', '未定')}",
+                "description": "試合当日。",
+                "choices": [{"text": RULE_MATCH_ACTION["text"], "hint": RULE_MATCH_ACTION["hint"]}],
+            }
+        actions = self.rng.sample(RULE_ACTIONS[:-1], 2) + [RULE_ACTIONS[-1]]
+        return {
+            "title": self.rng.choice(RULE_EVENT_TITLES),
+            "description": "",
+            "choices": [{"text": a["text"], "hint": a["hint"]} for a in actions],
+        }
+
+    def choose(self, player, event: Dict) -> str:
+        texts = [c["text"] for c in event.get("choices", [])]
+        rest = RULE_ACTIONS[-1]["text"]
+        if rest in texts and (player.hp < REST_BELOW_HP or len(texts) == 1):
+            return rest
+        active = [t for t in texts if t != rest] or texts
+        return self.rng.choice(active)
+
+    def resolve(self, player, event: Dict, choice: str) -> Dict:
+        action = next((a for a in RULE_ACTIONS + (RULE_MATCH_ACTION,) if a["text"] == choice), RULE_ACTIONS[0])
+        # 疲れているほど出来が落ちる
+        fatigue = min(1.0, max(0.4, player.hp / 80))
+        res = {
+            "result_story": f"{event.get('title', '')}: {choice}",
+            "grow_stats": dict(action["grow_stats"]),
+            "hp_cost": action["hp_cost"],
+            "mp_cost": action["mp_cost"],
+            "base": action["base"],
+            "performance": round(self.rng.uniform(0.7, 1.2) * fatigue, 3),
+        }
+        if res["hp_cost"] < 0:
+            res["hp_cost"] = -min(-res["hp_cost"], max(0, 100 - player.hp))
+        if res["mp_cost"] < 0:
+            res["mp_cost"] = -min(-res["mp_cost"], max(0, 100 - player.mp))
+        return res
+
+
+# 週間予定の練習の主眼 → 行動テーブルの行動
+FOCUS_ACTIONS: Dict[int, str] = {
+    season_calendar.FOCUS_GENERAL: RULE_ACTIONS[0]["text"],
+    season_calendar.FOCUS_PHYSICAL: "フィジカルを追い込む",
+    season_calendar.FOCUS_TACTICAL: "映像で戦術を学ぶ",
+    season_calendar.FOCUS_SHOOTING: "居残りでシュート練習",
+}
+
+
+def routine_action(player, date: datetime.date) -> str:
+    """The action a normal day of the team's weekly plan amounts to."""
+    focus = player.calendar.focus_on(date)
+    return FOCUS_ACTIONS.get(focus, RULE_ACTIONS[-1]["text"])
+
+
+class RoutineResolver(RuleResolver):
+    """Days with nothing special: follow the weekly plan, rest when drained."""
+
+    name = "routine"
+
+    def next_event(self, player) -> Dict:
+        action = routine_action(player, player.current_date)
+        return {"title": "いつもの一日", "description": "", "choices": [{"text": action, "hint": ""}]}
+
+    def choose(self, player, event: Dict) -> str:
+        if player.hp < REST_BELOW_HP:
+            return RULE_ACTIONS[-1]["text"]
+        return event["choices"][0]["text"]
+
+
+class LLMResolver(Resolver):
+    """The UI's prompts sent directly to a backend (no cache, no retries)."""
+
+    name = "llm"
+
+    def __init__(self, backend: llm_backends.LLMBackend, model: str = routing.FAST_MODEL,
+                 seed: Optional[int] = None):
+        self.backend = backend
+        self.model = model
+        self.rng = random.Random(seed)
+        self.errors = 0
+
+    def _call(self, kind: str, prompt: str) -> Optional[Dict]:
+        config = {"response_mime_type": "application/json"}
+        schema = schemas.response_schema_for(kind, self.model)
+        if schema:
+            config["response_schema"] = schema
+        try:
+            text = self.backend.generate(self.model, config, prompt, kind)
+            data, errors = schemas.load(kind, text)
+            if errors:
+                text = self.backend.generate(self.model, config, schemas.repair_prompt(kind, text, errors), kind)
+                data, errors = schemas.load(kind, text)
+        except Exception:
+            self.errors += 1
+            return None
+        if errors:
+            self.errors += 1
+            return None
+        return data
+
+    def next_event(self, player) -> Dict:
+        return self._call("next_event", event_prompts.next_event_prompt(player)) or event_prompts.fallback_event()
+
+    def choose(self, player, event: Dict) -> str:
+        texts = [c.get("text") for c in event.get("choices", []) if c.get("text")]
+        return self.rng.choice(texts) if texts else super().choose(player, event)
+
+    def resolve(self, player, event: Dict, choice: str) -> Dict:
+        prompt = event_prompts.resolve_action_prompt(player, choice, event.get("description", ""))
+        return self._call("resolve_action", prompt) or event_prompts.fallback_resolution(choice)
+
+
+class CachedResolver(Resolver):
+    """Memoise another resolver's outcomes per ``(event title, action, category)``."""
+
+    name = "cached"
+
+    def __init__(self, inner: Resolver, maxsize: int = 1024):
+        self.inner = inner
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def next_event(self, player) -> Dict:
+        return self.inner.next_event(player)
+
+    def choose(self, player, event: Dict) -> str:
+        return self.inner.choose(player, event)
+
+    def resolve(self, player, event: Dict, choice: str) -> Dict:
+        key = (event.get("title", ""), choice, player.team_category)
+        with self._lock:
+            res = self._results.get(key)
+            if res is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return json.loads(json.dumps(res))
+        res = self.inner.resolve(player, event, choice)
+        with self._lock:
+            self.misses += 1
+            self._results[key] = res
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return json.loads(json.dumps(res))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._results), "hits": self.hits, "misses": self.misses}
+
+
+# --- Engine ----------------------------------------------------------------
+class CareerEngine:
+    """Applies resolved days to one player.
+
+    ``compact_memory`` folds the career memory locally when it is due; the
+    UI turns it off because it summarises with the model in the background.
+    """
+
+    def __init__(
+        self,
+        player,
+        resolver: Optional[Resolver] = None,
+        rng=None,
+        save_path: Optional[Path] = None,
+        compact_memory: bool = True,
+    ):
+        self.player = player
+        self.resolver = resolver
+        self.rng = rng if rng is not None else random
+        self.save_path = save_path
+        self.compact_memory = compact_memory
+
+    def step(
+        self,
+        action_result: Dict,
+        event: Optional[Dict] = None,
+        choice: str = "",
+        remember: bool = True,
+    ) -> DayResult:
+        """Apply one resolved day and move the calendar forward.
+
+        ``remember=False`` skips the career memory and episode index (used
+        for routine days that :func:`fast_forward` summarises as one entry).
+        """
+        p = self.player
+        event = event or {}
+        res = action_result or {}
+        today = p.current_date
+        title = event.get("title", "")
+        story = res.get("result_story", "")
+
+        # 試合日は結果をローカルで決めて日程に書き込み、成長の入力も試合から取る
+        fixture = match_on(p, today)
+        outcome = table = None
+        if fixture is not None and not match_engine.is_played(fixture):
+            outcome = match_engine.play_fixture(p, fixture)
+            match_engine.record(fixture, outcome)
+            res = match_engine.apply_to_resolution(res, outcome)
+            table = standings.record_fixture(p, fixture, outcome)
+
+        if remember:
+            memory = career_memory.CareerMemory(p.memory)
+            memory.record_day(today.isoformat(), title, choice, story, result=res, match=match_on(p, today))
+            p.episodes.add(today.isoformat(), f"{title} / {choice} / {story}")
+            if self.compact_memory and memory.due():
+                memory.compact_locally()
+
+        ca_gain = apply_growth(p, res)
+        p.hp -= safe_int(res.get("hp_cost", 0))
+        p.mp -= safe_int(res.get("mp_cost", 0))
+        p.advance_day(1)
+        offer = maybe_generate_transfer_offer(p, self.rng)
+        if self.save_path is not None:
+            game_data.save_game(p, self.save_path)
+
+        return DayResult(
+            date=today.isoformat(),
+            title=title,
+            choice=choice,
+            story=story,
+            ca=p.ca,
+            ca_gain=ca_gain,
+            hp=p.hp,
+            mp=p.mp,
+            funds=p.funds,
+            age=p.age,
+            grade=p.grade,
+            team=p.team_name,
+            offer=offer,
+            match=match_line(p, outcome, table) if outcome else None,
+        )
+
+    def run(self, days: int, resolver: Optional[Resolver] = None) -> Iterator[DayResult]:
+        """Simulate ``days`` days, yielding each day's result as it is applied."""
+        resolver = resolver or self.resolver
+        if resolver is None:
+            raise ValueError("run() needs a resolver")
+        for _ in range(days):
+            event = resolver.next_event(self.player)
+            choice = resolver.choose(self.player, event)
+            res = resolver.resolve(self.player, event, choice)
+            yield self.step(res, event, choice)
+
+
+# --- Fast-forward ----------------------------------------------------------
+STOP_MATCH = "match"
+STOP_BIRTHDAY = "birthday"
+STOP_CUTOFF = "cutoff"
+STOP_DATE = "date"
+STOP_OFFER = "offer"
+DEFAULT_STOPS = (STOP_MATCH, STOP_BIRTHDAY, STOP_CUTOFF)
+MAX_FAST_FORWARD_DAYS = 366
+
+
+def next_stops(player, after: Optional[datetime.date] = None) -> Dict[str, datetime.date]:
+    """Next match, birthday and (for school teams) 3/31 strictly after ``after``."""
+    after = after or player.current_date
+    stops: Dict[str, datetime.date] = {}
+    match = player.schedule_index.next_date(after, inclusive=False)
+    if match is not None:
+        stops[STOP_MATCH] = match
+    if player.birthday:
+        stops[STOP_BIRTHDAY] = game_data.next_anniversary(player.birthday.month, player.birthday.day, after)
+    if player.team_category in ("HighSchool", "University"):
+        stops[STOP_CUTOFF] = game_data.next_anniversary(3, 31, after)
+    return stops
+
+
+@dataclasses.dataclass
+class FastForward:
+    start: str
+    end: str
+    reason: str
+    days: int
+    ca_gain: float
+    hp: int
+    funds: int
+    actions: Dict[str, int]
+    offers: List[Dict]
+
+    def summary(self) -> str:
+        if not self.days:
+            return f"{self.start} から進めなかった"
+        acts = "、".join(f"{k}×{v}" for k, v in sorted(self.actions.items(), key=lambda kv: -kv[1]))
+        return f"{self.start}〜{self.end} の{self.days}日間を通常どおり過ごした（{acts}）。CA {self.ca_gain:+.2f}"
+
+
+def fast_forward(
+    player,
+    until: Optional[datetime.date] = None,
+    stops: Tuple[str, ...] = DEFAULT_STOPS,
+    resolver: Optional[Resolver] = None,
+    rng=None,
+    max_days: int = MAX_FAST_FORWARD_DAYS,
+) -> FastForward:
+    """Resolve routine days locally until the next stop and land on it.
+
+    The player ends on the stop date itself (the match, the birthday, 3/31
+    or ``until``) with that day still to play; a transfer offer on the way
+    ends the run early.  Each skipped day goes through the normal
+    :meth:`CareerEngine.step`, so growth, HP/MP, upkeep, age and grade
+    follow exactly the same rules as a played day, and the whole stretch is
+    written to the career memory as one entry.
+    """
+    start = player.current_date
+    targets = {k: v for k, v in next_stops(player, start).items() if k in stops}
+    if until is not None and until > start:
+        targets[STOP_DATE] = until
+    limit = start + datetime.timedelta(days=max_days)
+    reason, target = min(((k, v) for k, v in targets.items()), key=lambda kv: kv[1], default=(STOP_DATE, limit))
+    if target > limit:
+        reason, target = STOP_DATE, limit
+
+    resolver = resolver or RoutineResolver(seed=None if rng is None else rng.getrandbits(32))
+    runner = CareerEngine(player, rng=rng)
+    before = player.ca
+    actions: Dict[str, int] = {}
+    offers: List[Dict] = []
+    while player.current_date < target:
+        if STOP_MATCH in stops and match_on(player, player.current_date):
+            # 試合日は早送りで消化しない（今日が試合日なら進めない）
+            reason = STOP_MATCH
+            break
+        event = resolver.next_event(player)
+        choice = resolver.choose(player, event)
+        day = runner.step(resolver.resolve(player, event, choice), event, choice, remember=False)
+        actions[choice] = actions.get(choice, 0) + 1
+        if day.offer:
+            offers.append(day.offer)
+            reason = STOP_OFFER
+            break
+
+    days = (player.current_date - start).days
+    result = FastForward(
+        start=start.isoformat(),
+        # 最後に消化した日（1日も進めなければ開始日のまま）
+        end=(player.current_date - datetime.timedelta(days=1 if days else 0)).isoformat(),
+        reason=reason,
+        days=days,
+        ca_gain=player.ca - before,
+        hp=player.hp,
+        funds=player.funds,
+        actions=actions,
+        offers=offers,
+    )
+    if result.days:
+        memory = career_memory.CareerMemory(player.memory)
+        memory.record_day(result.start, "早送り", f"{result.days}日", result.summary())
+        player.episodes.add(result.start, result.summary())
+    return result
+
+
+def new_player(
+    rng: random.Random,
+    category: str = "HighSchool",
+    start: datetime.date = datetime.date(2025, 4, 1),
+    age: int = 15,
+) -> game_data.Player:
+    """A plausible fresh player for headless runs (no model calls)."""
+    attrs = {k: round(rng.uniform(6.0, 12.0), 1) for k in game_data.WEIGHTS}
+    player = game_data.Player(
+        name=f"選手{rng.randint(1, 9999):04d}",
+        position=rng.choice(game_data.TeamGenerator.POSITIONS_POOL),
+        age=age,
+        attributes=attrs,
+        funds=300_000,
+        team_name="架空高校" if category == "HighSchool" else "架空FC",
+        team_category=category,
+        start_date=start,
+        birthday=start.replace(month=rng.randint(1, 12), day=rng.randint(1, 28)),
+        pa=round(rng.uniform(100.0, 180.0), 1),
+    )
+    members, formation = game_data.TeamGenerator.generate_teammates(category, "", [])
+    player.team_members = members
+    player.formation = formation
+    player.update_hierarchy()
+    return player
+
+
+def make_resolver(kind: str, seed: Optional[int] = None, cassette: str = "default",
+                  api_key: Optional[str] = None, model: str = routing.FAST_MODEL) -> Resolver:
+    if kind == "rule":
+        return RuleResolver(seed)
+    backend = llm_backends.make_backend(kind, api_key=api_key, cassette=cassette)
+    if backend is None:
+        raise SystemExit(f"resolver {kind!r} needs an API key")
+    return LLMResolver(backend, model=model, seed=seed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate a career headlessly and stream JSONL.")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--resolver", choices=("rule", "stub", "replay", "gemini", "record"), default="rule")
+    parser.add_argument("--cached", action="store_true", help="memoise outcomes per (event, action)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--load", type=Path, help="start from a save file instead of a fresh player")
+    parser.add_argument("--save", type=Path, help="write the final state here")
+    parser.add_argument("--cassette", default="default")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--model", default=routing.FAST_MODEL)
+    parser.add_argument("--category", default="HighSchool")
+    parser.add_argument("--story-chars", type=int, default=80)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.load:
+        player = game_data.load_game(args.load)
+        if player is None:
+            parser.error(f"could not load {args.load}")
+    else:
+        player = new_player(rng, category=args.category)
+    resolver = make_resolver(args.resolver, args.seed, args.cassette, args.api_key, args.model)
+    if args.cached:
+        resolver = CachedResolver(resolver)
+
+    engine = CareerEngine(player, resolver, rng=rng)
+    out = sys.stdout
+    for day in engine.run(args.days):
+        out.write(json.dumps(day.to_dict(args.story_chars), ensure_ascii=False) + "\n")
+    out.flush()
+    if args.save:
+        game_data.save_game(player, args.save)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
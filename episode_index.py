@@ -0,0 +1,213 @@
+"""Local BM25 index over past episodes of a career.
+
+Each resolved day is added as one short document (event title, the chosen
+action and the start of the result story).  Japanese text is tokenised
+without a dictionary: ASCII words plus character bigrams that contain at
+least one kanji or katakana, which keeps the vocabulary small and skips
+particle-only pairs.  Postings are ``array`` pairs of doc ids and term
+frequencies, so thousands of days stay compact, and only the document texts
+are persisted with the save; postings are rebuilt on load.
+
+Queries score with NumPy views over those arrays (no copies), using the
+rarest terms of the new event first and stopping after a fixed postings
+budget, so the top-k lookup stays well under a millisecond as the log
+grows.  Run ``python episode_index.py`` for a latency benchmark
+against log size.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+DOC_CHARS = 200
+MAX_QUERY_TERMS = 16
+# 1クエリで読む posting の上限（よくある語は寄与が小さいので打ち切る）
+POSTINGS_BUDGET = 6000
+DEFAULT_TOP_K = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-鿿ｦ-ﾟ]+")
+_CONTENT_RE = re.compile(r"[゠-ヿ㐀-鿿]")
+
+
+def tokenize(text: str) -> List[str]:
+    """ASCII words plus kanji/katakana-bearing character bigrams."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens: List[str] = []
+    for run in _WORD_RE.findall(text):
+        if run.isascii():
+            if len(run) > 1:
+                tokens.append(run)
+            continue
+        if len(run) == 1:
+            if _CONTENT_RE.match(run):
+                tokens.append(run)
+            continue
+        for i in range(len(run) - 1):
+            pair = run[i:i + 2]
+            if _CONTENT_RE.search(pair):
+                tokens.append(pair)
+    return tokens
+
+
+class EpisodeIndex:
+    """Append-only BM25 index; safe to query from worker threads."""
+
+    def __init__(self):
+        self.docs: List[Tuple[str, str]] = []  # (date, text)
+        self._dates: List[str] = []
+        self._ids: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._lengths = array("I")
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # 投機実行のスナップショット（deepcopy）でも索引は共有する（追記のみでロック付き）
+    def __deepcopy__(self, memo) -> "EpisodeIndex":
+        return self
+
+    def add(self, date: str, text: str) -> int:
+        """Index one episode; returns its doc id."""
+        text = " ".join((text or "").split())[:DOC_CHARS]
+        counts: Dict[str, int] = {}
+        for tok in tokenize(text):
+            counts[tok] = counts.get(tok, 0) + 1
+        with self._lock:
+            doc_id = len(self.docs)
+            self.docs.append((date, text))
+            self._dates.append(date)
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._total_length += length
+            for tok, tf in counts.items():
+                ids = self._ids.get(tok)
+                if ids is None:
+                    ids = self._ids[tok] = array("I")
+                    self._tfs[tok] = array("H")
+                ids.append(doc_id)
+                self._tfs[tok].append(min(tf, 65535))
+            return doc_id
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K, before: Optional[str] = None) -> List[Dict]:
+        """Top-``k`` episodes for ``query`` (optionally only those dated before ``before``)."""
+        with self._lock:
+            n = len(self.docs)
+            if not n:
+                return []
+            # 日付順に追記されるので、before より前の文書は先頭からの連続区間になる
+            limit = bisect.bisect_left(self._dates, before) if before is not None else n
+            if not limit:
+                return []
+            terms = [t for t in set(tokenize(query)) if t in self._ids]
+            # 希少な語から使う（長い posting を読まずに済む）
+            terms.sort(key=lambda t: len(self._ids[t]))
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            norm = K1 * (1.0 - B + B * lengths / (self._total_length / n))
+            scores = np.zeros(n)
+            budget = POSTINGS_BUDGET
+            for tok in terms[:MAX_QUERY_TERMS]:
+                ids = np.frombuffer(self._ids[tok], dtype=np.uint32)
+                if budget < len(ids) and budget < POSTINGS_BUDGET:
+                    break
+                budget -= len(ids)
+                tfs = np.frombuffer(self._tfs[tok], dtype=np.uint16).astype(np.float64)
+                df = len(ids)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                # 1語の posting 内で doc id は重複しないので単純な加算でよい
+                scores[ids] += idf * tfs * (K1 + 1.0) / (tfs + norm[ids])
+            scores = scores[:limit]
+            k = min(k, limit)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {"date": self.docs[d][0], "text": self.docs[d][1], "score": round(float(scores[d]), 3)}
+                for d in top
+                if scores[d] > 0
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "docs": len(self.docs),
+                "terms": len(self._ids),
+                "postings": sum(len(a) for a in self._ids.values()),
+            }
+
+    # --- Persistence ---------------------------------------------------
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {"docs": [list(doc) for doc in self.docs]}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "EpisodeIndex":
+        index = cls()
+        for date, text in (data or {}).get("docs", []):
+            index.add(date, text)
+        return index
+
+
+def format_episodes(hits: List[Dict]) -> str:
+    return "\n".join(f"- {h['date']} {h['text']}" for h in hits) or "関連する過去の出来事はない"
+
+
+# --- Benchmark -------------------------------------------------------------
+_BENCH_WORDS = (
+    "監督 キャプテン 先輩 同級生 恋人 父親 代理人 スカウト 紅白戦 居残り練習 フィジカル "
+    "ロッカー 寮 遠征 メンバー発表 ベンチ スタメン 途中出場 決勝点 PK ミス 怪我 リハビリ "
+    "面談 移籍 オファー 契約 試験 授業 レポート 戦術 セットプレー ゴール アシスト 雨 夜"
+).split()
+# 固有名詞（対戦相手・人名）の代わりにランダムな漢字2〜3文字を混ぜて語彙を現実的な大きさにする
+_BENCH_KANJI = "山田中川本井上木村林森高橋佐藤鈴伊渡辺小松竹梅東西南北大京阪神戸浦和柏鹿島清水磐田札幌仙台新潟甲府長野金沢福岡熊鳥栖"
+
+
+def _fake_episode(rng: random.Random) -> str:
+    words = rng.sample(_BENCH_WORDS, 6)
+    names = ["".join(rng.choices(_BENCH_KANJI, k=rng.randint(2, 3))) for _ in range(3)]
+    parts = [f"{w}のことで{rng.choice(names)}と話した" for w in words]
+    return "。".join(parts)
+
+
+def benchmark(sizes=(100, 1000, 3000, 10000), queries: int = 200, seed: int = 0) -> List[Dict]:
+    """Median/p95 query latency (ms) and index size for growing logs."""
+    rng = random.Random(seed)
+    rows = []
+    for size in sizes:
+        index = EpisodeIndex()
+        start = time.perf_counter()
+        for i in range(size):
+            index.add(f"D{i:05d}", _fake_episode(rng))
+        build_ms = (time.perf_counter() - start) * 1000
+        samples = []
+        for _ in range(queries):
+            q = _fake_episode(rng)
+            t0 = time.perf_counter()
+            index.search(q)
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        rows.append({
+            "docs": size,
+            "build_ms": round(build_ms, 1),
+            "p50_ms": round(samples[len(samples) // 2], 3),
+            "p95_ms": round(samples[int(len(samples) * 0.95)], 3),
+            **{k: v for k, v in index.stats().items() if k != "docs"},
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
@@ -0,0 +1,224 @@
+"""Prompts for the daily event loop, shared by the UI and the headless engine.
+
+``app.py`` sends these through ``call_gemini`` (cache, resilience, rate
+limiting, streaming) and :mod:`engine` sends them straight to a backend, so
+both paths see the same instruction prefixes and context sections.  The
+fallbacks are what a day resolves to when the model cannot answer.
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import Dict, Tuple
+
+import career_memory
+import episode_index
+import match_engine
+import prompt_builder
+
+NEXT_EVENT_INSTRUCTIONS = """
+    あなたはリアル志向のサッカー小説家兼ゲームマスターです。
+
+    【タスク】
+    - 【プレイヤー】と【文脈】を踏まえ、「今このタイミングで起こりうる、等身大のイベント」を1つ作りなさい。
+      - 例: 練習後のロッカーでの会話 / 寮での夜の独り時間 / 恋人とのすれ違い /
+            監督との面談 / 次戦メンバー発表 など。
+      - サッカー要素と生活要素が両方少しずつ絡むのが理想。
+
+    【表現ルール】
+    - title: 20文字以内の短いイベント名。
+    - description: 400〜900字程度の本文。
+      - 一人称の地の文＋会話文。
+      - 感情・身体感覚・空気感を丁寧に描写。
+      - 直近の試合・序列・練習への不安や期待なども自然に織り込んでよい。
+
+    【選択肢】
+    - choices は必ず3つ。
+    - text: プレイヤーが即座に選べる行動（短文）。
+    - hint: その行動がプレイヤーのキャリアに与えそうな影響のニュアンスを一言で。
+
+    Output JSON ONLY:
+    {
+      "title": "短いイベント名",
+      "description": "本文テキスト。改行は \\n を使う。",
+      "choices": [
+        {"text":"...", "hint":"..." },
+        {"text":"...", "hint":"..." },
+        {"text":"...", "hint":"..." }
+      ]
+    }
+    """
+
+EVENT_BATCH_INSTRUCTIONS = """
+    あなたはリアル志向のサッカー小説家兼ゲームマスターです。
+
+    【タスク】
+    - 【対象日】の各日について、1日1つずつ
+      「その日に起こりうる、等身大のイベント」を作りなさい。
+    - 日付順に並べ、前の日の出来事を自然に引き継いでよいが、
+      選択の結果はまだ決まっていないので、特定の選択を前提にしないこと。
+    - 試合日が含まれる場合、その日のイベントは試合当日の内容にすること。
+
+    【表現ルール】
+    - title: 20文字以内の短いイベント名。
+    - description: 300〜600字程度の本文（一人称の地の文＋会話文）。
+    - choices は必ず3つ。text は短い行動、hint は影響のニュアンスを一言で。
+    - date には対象日を "YYYY-MM-DD" で入れること。
+
+    Output JSON ONLY:
+    {
+      "events": [
+        {
+          "date": "YYYY-MM-DD",
+          "title": "短いイベント名",
+          "description": "本文テキスト。改行は \\n を使う。",
+          "choices": [
+            {"text":"...", "hint":"..." },
+            {"text":"...", "hint":"..." },
+            {"text":"...", "hint":"..." }
+          ]
+        }
+      ]
+    }
+    """
+
+RESOLVE_ACTION_INSTRUCTIONS = """
+    あなたはリアル志向のサッカーコーチ兼ストーリーテラーです。
+
+    【タスク】
+    1. 【イベント】で【プレイヤーの選択】をした結果、その日の出来事がどう展開したかを
+       一人称視点で 400〜800字程度のストーリー(result_story)にまとめること。
+       - 練習・試合内容、周囲の反応、自分の感情や身体感覚、
+         帰り道や夜のベッドの中での反芻までを描いてよい。
+       - 「成功した／失敗した」だけでなく、モヤモヤや学びも描写すること。
+
+    2. その日のサッカー活動強度(Base)と、体感採点に対応するPerformanceを決めること。
+       - Base: TRや試合、自主練の合計。だいたい 0.01〜0.30 の範囲。
+       - Performance: 0.6〜1.5（標準は0.8〜1.0）
+
+    3. 成長させるべき能力(grow_stats)を2〜6個程度選び、
+       それぞれ 0.01〜0.30 程度の微小な成長値を割り当てること。
+       - 行動内容に整合的な能力のみを上げること
+         （例: ハードなフィジカルトレ → Stamina, Strength など）。
+       - JSONのキーは game_data.WEIGHTS にある能力名と一致させること。
+
+    4. 【試合結果】がある日は、スコア・出場の有無と時間・評価・得点はその通りに描写し、変更しないこと。
+       結果はすでに確定しているので、あなたは描写だけを担当する。
+
+    5. 必要に応じて人間関係relation_changeも1件だけ指定してよい。
+       - role: 関係性のラベル（例: "監督", "チームメイト", "恋人" など）
+       - val: -10〜+10の整数。
+
+    【出力フォーマット】
+    以下のJSONだけを出力してください:
+
+    {
+      "result_story": "本文。改行は \\n を使う。",
+      "grow_stats": {
+         "Decisions": 0.05,
+         "Acceleration": 0.10
+      },
+      "hp_cost": 10,
+      "mp_cost": 5,
+      "relation_change": {
+         "role": "監督",
+         "val": 3
+      },
+      "base": 0.12,
+      "performance": 0.9
+    }
+    """
+
+
+def event_context(player) -> Tuple[str, str]:
+    """イベント生成プロンプト共通の文脈（関係の濃いNPC上位・今日の予定・次戦だけ）を返す。"""
+    npcs_txt = prompt_builder.top_npcs(player.npcs)
+
+    next_match = player.schedule_index.next_fixture(player.current_date)
+    today = player.calendar.day(player.current_date)
+    return npcs_txt, f"今日: {today.line()}\n{prompt_builder.next_match_line(next_match)}"
+
+
+def related_episodes(player, query: str, k: int = episode_index.DEFAULT_TOP_K) -> str:
+    """ローカル索引から、今の状況に近い過去のエピソードを k 件だけ返す（プロンプト用の文字列）。"""
+    hits = player.episodes.search(query, k=k, before=player.current_date.isoformat())
+    return episode_index.format_episodes(hits)
+
+
+def next_event_prompt(player) -> prompt_builder.Prompt:
+    npcs_txt, schedule_info = event_context(player)
+    return (
+        prompt_builder.PromptBuilder("next_event")
+        .instructions(NEXT_EVENT_INSTRUCTIONS)
+        .section("プレイヤー", prompt_builder.player_line(player))
+        .section("文脈", schedule_info)
+        .section("関係性が強い/こじれているNPC", npcs_txt, priority=1)
+        .section("これまでのキャリア", career_memory.CareerMemory(player.memory).context(), priority=2)
+        .section("関連する過去の出来事", related_episodes(player, f"{schedule_info} {npcs_txt}"), priority=3)
+        .build()
+    )
+
+
+def event_batch_prompt(player, days: int) -> prompt_builder.Prompt:
+    npcs_txt, schedule_info = event_context(player)
+    dates = [str(player.current_date + datetime.timedelta(days=i)) for i in range(days)]
+    return (
+        prompt_builder.PromptBuilder("event_batch")
+        .instructions(EVENT_BATCH_INSTRUCTIONS)
+        .section("対象日", f"次の {days} 日間（{', '.join(dates)}）")
+        .section("プレイヤー", prompt_builder.player_line(player))
+        .section("文脈", schedule_info)
+        .section("関係性が強い/こじれているNPC", npcs_txt, priority=1)
+        .section("これまでのキャリア", career_memory.CareerMemory(player.memory).context(), priority=2)
+        .section("関連する過去の出来事", related_episodes(player, f"{schedule_info} {npcs_txt}"), priority=3)
+        .build()
+    )
+
+
+def match_result_line(player) -> str:
+    """今日が試合日なら、ローカルで確定した結果の1行（なければ空文字）。"""
+    fixture = player.schedule_index.on(player.current_date)
+    if fixture is None:
+        return ""
+    return match_engine.play_fixture(player, fixture).line()
+
+
+def resolve_action_prompt(player, choice_text: str, event_desc: str) -> prompt_builder.Prompt:
+    return (
+        prompt_builder.PromptBuilder("resolve_action")
+        .instructions(RESOLVE_ACTION_INSTRUCTIONS)
+        .section("プレイヤー", prompt_builder.player_line(player))
+        .section("試合結果", match_result_line(player))
+        .section("これまでのキャリア", career_memory.CareerMemory(player.memory).context(), priority=2)
+        .section("関連する過去の出来事", related_episodes(player, f"{event_desc} {choice_text}"), priority=3)
+        .section("プレイヤーの選択", choice_text)
+        .section(
+            "イベント",
+            prompt_builder.truncate(event_desc, prompt_builder.PREVIOUS_EVENT_CHARS),
+            raw=event_desc or "",
+            priority=1,
+            floor=200,
+        )
+        .build()
+    )
+
+
+# --- Fallbacks -------------------------------------------------------------
+def fallback_event() -> Dict:
+    return {
+        "title": "静かな一日",
+        "description": "今日は大きな出来事はなかった。\\n\\n寮の部屋で一人、次の練習と試合のことを考えながらストレッチをしている。",
+        "choices": [{"text": "軽く自主練に出る", "hint": "わずかに成長"}]
+    }
+
+
+def fallback_resolution(choice_text: str) -> Dict:
+    """API不調時でも1日を進められるよう、控えめな結果を返す。"""
+    return {
+        "result_story": f"「{choice_text}」と決めて、今日はできることを淡々とこなした。\n\n大きな手応えはないが、積み重ねは無駄にはならないはずだ。",
+        "grow_stats": {"WorkRate": 0.03, "Determination": 0.02},
+        "hp_cost": 5,
+        "mp_cost": 3,
+        "base": 0.05,
+        "performance": 0.8
+    }
@@ -0,0 +1,102 @@
+"""Per-player queue of pre-generated daily events.
+
+Instead of one ``generate_next_event`` round trip per game day, the model
+can be asked for the next N days of events in one structured call.  The
+events are stored here together with the context they were written for
+(team, HP/MP, the next fixture) and served one per day.  The queue drops
+itself as soon as that context no longer holds: a transfer, a large HP/MP
+swing between two served days, or a match having been played since the
+batch was generated.
+"""
+
+from __future__ import annotations
+
+import datetime
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+DEFAULT_BATCH_DAYS = 5
+MAX_HP_SWING = 25
+MAX_MP_SWING = 25
+
+
+def next_match_date(player, after: datetime.date) -> Optional[str]:
+    """ISO date of the first fixture on or after ``after`` (``None`` if none)."""
+    day = player.schedule_index.next_date(after)
+    return day.isoformat() if day else None
+
+
+class EventQueue:
+    def __init__(self, max_hp_swing: int = MAX_HP_SWING, max_mp_swing: int = MAX_MP_SWING):
+        self.max_hp_swing = max_hp_swing
+        self.max_mp_swing = max_mp_swing
+        self.events: Deque[Dict] = deque()
+        self.context: Dict = {}
+        self.served = 0
+        self.invalidations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def fill(self, player, events: List[Dict]) -> int:
+        """Queue ``events`` as consecutive days starting at ``player.current_date``."""
+        self.events.clear()
+        start = player.current_date
+        for offset, ev in enumerate(events):
+            if not isinstance(ev, dict) or not ev.get("description"):
+                continue
+            day = start + datetime.timedelta(days=offset)
+            self.events.append({"date": day.isoformat(), "event": ev})
+        self.context = {
+            "team_name": player.team_name,
+            "generated_on": start.isoformat(),
+            "next_match": next_match_date(player, start),
+            "hp": player.hp,
+            "mp": player.mp,
+        }
+        return len(self.events)
+
+    def pop_for(self, player) -> Optional[Dict]:
+        """Return the queued event for ``player.current_date`` if still valid."""
+        if not self.events:
+            return None
+        reason = self._stale_reason(player)
+        if reason:
+            self.invalidate(reason)
+            return None
+        today = player.current_date.isoformat()
+        while self.events and self.events[0]["date"] < today:
+            self.events.popleft()
+        if not self.events or self.events[0]["date"] != today:
+            return None
+        item = self.events.popleft()
+        self.context["hp"] = player.hp
+        self.context["mp"] = player.mp
+        self.served += 1
+        return item["event"]
+
+    def has_event_for(self, player) -> bool:
+        today = player.current_date.isoformat()
+        return any(item["date"] == today for item in self.events) and not self._stale_reason(player)
+
+    def invalidate(self, reason: str) -> None:
+        if self.events:
+            self.invalidations[reason] = self.invalidations.get(reason, 0) + 1
+        self.events.clear()
+        self.context = {}
+
+    def _stale_reason(self, player) -> Optional[str]:
+        ctx = self.context
+        if not ctx:
+            return "empty"
+        if ctx.get("team_name") != player.team_name:
+            return "transfer"
+        if abs(player.hp - ctx.get("hp", player.hp)) > self.max_hp_swing:
+            return "hp_swing"
+        if abs(player.mp - ctx.get("mp", player.mp)) > self.max_mp_swing:
+            return "mp_swing"
+        # 生成時点の次戦を消化していたら、試合結果を踏まえていないので破棄する
+        nm = ctx.get("next_match")
+        if nm and player.current_date.isoformat() > nm:
+            return "match_result"
+        return None
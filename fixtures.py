@@ -0,0 +1,365 @@
+"""Local fixture generator and schedule repair.
+
+The model only describes the competitions a team plays in (metadata plus
+opponent names); the dated fixtures are built here:
+
+* leagues are a round robin by the circle method over ``team_count`` clubs,
+  ``rounds`` legs with the second leg mirrored, one matchday per round on
+  the competition's ``match_days`` inside ``season_start``..``season_end``;
+* knockout competitions get ``rounds`` dates spread over their window, on
+  days that keep the minimum spacing from fixtures already booked;
+* :func:`repair` takes any proposed schedule (older templates and cassettes
+  still carry one) and enforces the same constraints in one sorted pass,
+  O(n log n): dates clamped into the season, moved forward to the next
+  allowed weekday at least :data:`MIN_GAP_DAYS` after the previous fixture,
+  and dropped if that runs past the season end.
+
+Everything is seeded from the team, competition and year, so the same
+metadata always yields the same calendar.
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime
+import logging
+import random
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+MIN_GAP_DAYS = 3
+WEEKDAY_CODES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+DEFAULT_MATCH_DAYS = ("Sat", "Sun")
+# 週末だけで日程が収まらないときに足す平日
+MIDWEEK = "Wed"
+MAX_TEAMS = 40
+MAX_CUP_ROUNDS = 8
+
+logger = logging.getLogger(__name__)
+
+
+def _parse(value) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value, default: int, lo: int, hi: int) -> int:
+    try:
+        return max(lo, min(hi, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(zlib.crc32("|".join(str(p) for p in parts).encode("utf-8")))
+
+
+# --- Competition metadata --------------------------------------------------
+def normalise_competition(comp: Dict, year: int) -> Dict:
+    """Fill defaults and clamp the fields the generator relies on."""
+    comp = dict(comp)
+    code = comp.get("code") or "LEAGUE"
+    comp["code"] = code
+    comp["name"] = comp.get("name") or code
+    kind = comp.get("type") if comp.get("type") in ("league", "knockout") else ""
+    if not kind:
+        kind = "league" if "LEAGUE" in code.upper() or code.upper() == "REGIONAL" else "knockout"
+    comp["type"] = kind
+    opponents = [str(o) for o in comp.get("opponents") or [] if o]
+    comp["opponents"] = list(dict.fromkeys(opponents))
+
+    start = _parse(comp.get("season_start"))
+    end = _parse(comp.get("season_end"))
+    if start is None or start.year != year:
+        start = datetime.date(year, 2 if kind == "league" else 4, 1)
+    if end is None or end.year != year or end <= start:
+        end = datetime.date(year, 12, 10)
+    comp["season_start"], comp["season_end"] = start.isoformat(), end.isoformat()
+
+    days = [d for d in comp.get("match_days") or [] if d in WEEKDAY_CODES]
+    comp["match_days"] = days or list(DEFAULT_MATCH_DAYS)
+    if kind == "league":
+        comp["team_count"] = _int(comp.get("team_count"), max(len(opponents) + 1, 18), 2, MAX_TEAMS)
+        comp["rounds"] = _int(comp.get("rounds"), 2, 1, 4)
+    else:
+        comp["team_count"] = _int(comp.get("team_count"), 0, 0, 1000)
+        comp["rounds"] = _int(comp.get("rounds"), 3, 1, MAX_CUP_ROUNDS)
+    comp["priority"] = _int(comp.get("priority"), 1 if kind == "league" else 2, 1, 99)
+    comp.setdefault("include_for_player", True)
+    return comp
+
+
+def default_competitions(category: str, year: int) -> List[Dict]:
+    """Competitions to use when the model returned nothing."""
+    if category == "Professional":
+        league = {"code": "LEAGUE", "name": "リーグ戦", "team_count": 18,
+                  "season_start": f"{year}-02-20", "season_end": f"{year}-12-05"}
+        cup = {"code": "CUP", "name": "カップ戦", "rounds": 4, "match_days": ["Wed"],
+               "season_start": f"{year}-05-01", "season_end": f"{year}-11-30"}
+    else:
+        league = {"code": "REGIONAL", "name": "地域リーグ", "team_count": 10,
+                  "season_start": f"{year}-04-05", "season_end": f"{year}-11-30"}
+        cup = {"code": "CUP", "name": "選手権予選", "rounds": 4, "match_days": ["Sat", "Sun"],
+               "season_start": f"{year}-08-20", "season_end": f"{year}-11-20"}
+    league.update({"type": "league", "priority": 1, "rounds": 2, "match_days": ["Sat", "Sun"]})
+    cup.update({"type": "knockout", "priority": 2})
+    return [normalise_competition(c, year) for c in (league, cup)]
+
+
+# --- Round robin -----------------------------------------------------------
+def circle_rounds(teams: Sequence[str]) -> List[List[Tuple[str, str]]]:
+    """Single round robin by the circle method; each round is a list of (home, away).
+
+    With an odd number of teams one club has a bye each round.
+    """
+    line: List[Optional[str]] = list(teams)
+    if len(line) % 2:
+        line.append(None)
+    n = len(line)
+    fixed, rest = line[0], line[1:]
+    rounds = []
+    for r in range(n - 1):
+        order = [fixed] + rest
+        pairs = []
+        for i in range(n // 2):
+            a, b = order[i], order[n - 1 - i]
+            if a is None or b is None:
+                continue
+            # 固定チームは毎節ホーム/アウェーを入れ替える。他は回転で自然に入れ替わる
+            if (i == 0 and r % 2) or (i and i % 2):
+                a, b = b, a
+            pairs.append((a, b))
+        rounds.append(pairs)
+        rest = rest[-1:] + rest[:-1]
+    return rounds
+
+
+def league_rounds(teams: Sequence[str], legs: int) -> List[List[Tuple[str, str]]]:
+    first = circle_rounds(teams)
+    rounds = []
+    for leg in range(legs):
+        for pairs in first:
+            rounds.append(pairs if leg % 2 == 0 else [(b, a) for a, b in pairs])
+    return rounds
+
+
+# --- Dates -----------------------------------------------------------------
+def _too_close(day: datetime.date, booked: Sequence[datetime.date], gap: int) -> bool:
+    """``booked`` must be sorted; only the neighbours either side need checking."""
+    i = bisect.bisect_left(booked, day)
+    return any(abs((day - b).days) < gap for b in booked[max(i - 1, 0): i + 1])
+
+
+def candidate_dates(
+    start: datetime.date,
+    end: datetime.date,
+    match_days: Iterable[str],
+    booked: Sequence[datetime.date] = (),
+    gap: int = MIN_GAP_DAYS,
+) -> List[datetime.date]:
+    """Allowed days in the window, greedily ``gap`` apart and clear of ``booked``."""
+    allowed = {WEEKDAY_CODES.index(d) for d in match_days}
+    booked = sorted(booked)
+    out: List[datetime.date] = []
+    day = start
+    while day <= end:
+        if day.weekday() in allowed and (not out or (day - out[-1]).days >= gap) and not _too_close(day, booked, gap):
+            out.append(day)
+        day += datetime.timedelta(days=1)
+    return out
+
+
+def spread(dates: Sequence[datetime.date], count: int) -> List[datetime.date]:
+    """``count`` dates picked evenly from ``dates`` (all of them if there are fewer)."""
+    if count >= len(dates):
+        return list(dates)
+    if count == 1:
+        return [dates[len(dates) // 2]]
+    return [dates[round(i * (len(dates) - 1) / (count - 1))] for i in range(count)]
+
+
+def matchday_dates(
+    comp: Dict, count: int, booked: Sequence[datetime.date] = ()
+) -> Tuple[List[datetime.date], List[str]]:
+    """Dates for ``count`` matchdays and the weekday pool they were drawn from.
+
+    A midweek slot and then any day are added if the window is too tight for
+    the competition's own ``match_days``.
+    """
+    start, end = _parse(comp["season_start"]), _parse(comp["season_end"])
+    days = list(comp["match_days"])
+    for pool in (days, days + [MIDWEEK], list(WEEKDAY_CODES)):
+        dates = candidate_dates(start, end, pool, booked)
+        if len(dates) >= count:
+            break
+    if len(dates) < count:
+        logger.warning(
+            "%s: %d matchdays do not fit in %s..%s at %d-day spacing; keeping %d",
+            comp["code"], count, comp["season_start"], comp["season_end"], MIN_GAP_DAYS, len(dates),
+        )
+    return spread(dates, count), pool
+
+
+# --- Generation ------------------------------------------------------------
+def league_fixtures(team_name: str, comp: Dict, year: int) -> Tuple[List[Dict], List[str]]:
+    opponents = [o for o in comp["opponents"] if o != team_name][: comp["team_count"] - 1]
+    filler = 1
+    while len(opponents) < comp["team_count"] - 1:
+        name = f"クラブ{filler}"
+        filler += 1
+        if name not in opponents and name != team_name:
+            opponents.append(name)
+    teams = [team_name] + opponents
+    _rng(team_name, comp["code"], year).shuffle(teams)
+
+    rounds = league_rounds(teams, comp["rounds"])
+    dates, pool = matchday_dates(comp, len(rounds))
+    rows = []
+    for md, (pairs, day) in enumerate(zip(rounds, dates), start=1):
+        for home, away in pairs:
+            if team_name in (home, away):
+                rows.append({
+                    "date": day.isoformat(),
+                    "opponent": away if home == team_name else home,
+                    "home": home == team_name,
+                    "competition_code": comp["code"],
+                    "round": f"MD{md}",
+                })
+    return rows, pool
+
+
+def cup_round_label(r: int, total: int) -> str:
+    if r == total:
+        return "決勝"
+    if r == total - 1:
+        return "準決勝"
+    return f"{r}回戦"
+
+
+def cup_fixtures(team_name: str, comp: Dict, year: int, booked: Sequence[datetime.date],
+                 fallback_opponents: Sequence[str] = ()) -> Tuple[List[Dict], List[str]]:
+    rng = _rng(team_name, comp["code"], year)
+    pool = [o for o in comp["opponents"] or fallback_opponents if o != team_name]
+    if not pool:
+        pool = [f"{comp['name']} 対戦相手{i}" for i in range(1, comp["rounds"] + 1)]
+    pool = rng.sample(pool, len(pool))
+    total = comp["rounds"]
+    dates, pool_days = matchday_dates(comp, total, booked)
+    rows = [
+        {
+            "date": day.isoformat(),
+            "opponent": pool[i % len(pool)],
+            "home": rng.random() < 0.5,
+            "competition_code": comp["code"],
+            "round": cup_round_label(i + 1, total),
+        }
+        for i, day in enumerate(dates)
+    ]
+    return rows, pool_days
+
+
+def generate(team_name: str, competitions: Sequence[Dict], year: int) -> List[Dict]:
+    """The team's dated fixtures for every competition it takes part in."""
+    rows: List[Dict] = []
+    league_opponents: List[str] = []
+    # 実際に日付を引いた曜日。repair はこれを守る（大会の match_days に戻すと溢れた節が消える）
+    used_days: Dict[str, List[str]] = {}
+    # 優先度の高い大会（通常はリーグ）から日程を確保する
+    for comp in sorted(competitions, key=lambda c: (c["priority"], c["type"] != "league")):
+        if comp.get("include_for_player") is False:
+            continue
+        if comp["type"] == "league":
+            new, used_days[comp["code"]] = league_fixtures(team_name, comp, year)
+            league_opponents.extend(r["opponent"] for r in new)
+        else:
+            booked = [_parse(r["date"]) for r in rows]
+            new, used_days[comp["code"]] = cup_fixtures(
+                team_name, comp, year, booked, list(dict.fromkeys(league_opponents))
+            )
+        rows.extend(new)
+    return repair(rows, competitions, year, match_days=used_days)
+
+
+# --- Repair ----------------------------------------------------------------
+def _next_allowed(day: datetime.date, weekdays: set, end: datetime.date) -> Optional[datetime.date]:
+    for _ in range(7):
+        if day > end:
+            return None
+        if day.weekday() in weekdays:
+            return day
+        day += datetime.timedelta(days=1)
+    return None
+
+
+def repair(schedule: Sequence[Dict], competitions: Sequence[Dict], year: int,
+           gap: int = MIN_GAP_DAYS, match_days: Optional[Dict[str, Sequence[str]]] = None) -> List[Dict]:
+    """Make a proposed schedule satisfy the constraints (see module docstring).
+
+    ``match_days`` overrides a competition's weekdays by code; :func:`generate`
+    passes the pools it actually drew dates from.
+    """
+    match_days = match_days or {}
+    meta = {c["code"]: c for c in competitions}
+    year_start, year_end = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    rows = []
+    for row in schedule:
+        day = _parse(row.get("date"))
+        if day is None or not row.get("opponent"):
+            continue
+        comp = meta.get(row.get("competition_code") or "")
+        lo = _parse(comp["season_start"]) if comp else year_start
+        hi = _parse(comp["season_end"]) if comp else year_end
+        days = match_days.get(comp["code"], comp["match_days"]) if comp else WEEKDAY_CODES
+        weekdays = {WEEKDAY_CODES.index(d) for d in days}
+        priority = comp["priority"] if comp else 99
+        rows.append((min(max(day, lo), hi), priority, hi, weekdays, row))
+    rows.sort(key=lambda t: (t[0], t[1]))
+
+    out: List[Dict] = []
+    last: Optional[datetime.date] = None
+    for day, _, hi, weekdays, row in rows:
+        earliest = day if last is None else max(day, last + datetime.timedelta(days=gap))
+        # 指定曜日で見つからなければ、間隔だけ守って大会期間内に置く
+        moved = _next_allowed(earliest, weekdays, hi) or (earliest if earliest <= hi else None)
+        if moved is None:
+            continue
+        out.append({
+            **row,
+            "date": moved.isoformat(),
+            "home": bool(row.get("home", True)),
+            "competition_code": row.get("competition_code") or "",
+            "round": row.get("round") or "",
+        })
+        last = moved
+    return out
+
+
+def build_schedule(team_name: str, competitions: Sequence[Dict], year: int,
+                   proposed: Optional[Sequence[Dict]] = None) -> Dict:
+    """``{"competitions", "schedule"}`` from model metadata, repairing ``proposed`` if given."""
+    comps = [normalise_competition(c, year) for c in competitions if isinstance(c, dict)]
+    if proposed:
+        schedule = repair(proposed, comps, year)
+    else:
+        schedule = generate(team_name, comps, year)
+    return {"competitions": comps, "schedule": schedule}
+
+
+def check_tight_league() -> None:
+    """A league squeezed into a short window keeps every fixture."""
+    comp = {"code": "LEAGUE", "type": "league", "team_count": 20, "rounds": 2,
+            "season_start": "2026-03-01", "season_end": "2026-06-30"}
+    schedule = build_schedule("架空FC", [comp], 2026)["schedule"]
+    expected = comp["rounds"] * (comp["team_count"] - 1)
+    assert len(schedule) == expected, (len(schedule), expected)
+    assert [r["round"] for r in schedule] == [f"MD{i}" for i in range(1, expected + 1)]
+    days = [_parse(r["date"]) for r in schedule]
+    assert all((b - a).days >= MIN_GAP_DAYS for a, b in zip(days, days[1:]))
+    assert days[0] >= datetime.date(2026, 3, 1) and days[-1] <= datetime.date(2026, 6, 30)
+
+
+if __name__ == "__main__":
+    check_tight_league()
+    print("ok")
@@ -14,7 +14,14 @@ import datetime
 import json
 import random
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Mapping, MutableMapping, Optional, Tuple
+
+import numpy as np
+
+from episode_index import EpisodeIndex
+from schedule_index import ScheduleIndex
+from season_calendar import SeasonCalendar
+from standings import LeagueTable, tables_from_dict, tables_to_dict
 
 # --- Ability weights (FM-like attributes) ---------------------------------
 # The weights are intentionally modest and balanced; they are only used for
@@ -66,6 +73,142 @@ WEIGHTS: Dict[str, float] = {
 
 THEORETICAL_MAX_SCORE = sum(20 * w for w in WEIGHTS.values())
 
+# 能力値ベクトルのキー順は WEIGHTS の定義順で固定する
+ATTRIBUTE_KEYS: Tuple[str, ...] = tuple(WEIGHTS)
+ATTRIBUTE_INDEX: Dict[str, int] = {k: i for i, k in enumerate(ATTRIBUTE_KEYS)}
+# CA = values @ CA_WEIGHTS（重みを理論最大で割り 200 倍した正規化済みベクトル）
+CA_WEIGHTS = np.array([WEIGHTS[k] for k in ATTRIBUTE_KEYS]) * (200 / THEORETICAL_MAX_SCORE)
+ATTRIBUTE_MIN = 1.0
+ATTRIBUTE_MAX = 20.0
+DEFAULT_ATTRIBUTE = 10.0
+
+
+class Attributes(MutableMapping):
+    """Array-backed attribute store with an incrementally maintained CA.
+
+    Values live in one float vector in ``ATTRIBUTE_KEYS`` order; every write
+    adjusts ``ca`` by ``delta * weight`` instead of re-summing all weights.
+    It still behaves like the old ``Dict[str, float]`` for the UI, pandas and
+    JSON (``dict(attrs)``); the key set is fixed, so unknown keys raise
+    ``KeyError`` and keys cannot be deleted.
+    """
+
+    __slots__ = ("values", "ca")
+
+    def __init__(self, attrs: Optional[Mapping[str, float]] = None):
+        self.values = np.full(len(ATTRIBUTE_KEYS), DEFAULT_ATTRIBUTE)
+        for k, v in (attrs or {}).items():
+            i = ATTRIBUTE_INDEX.get(k)
+            if i is None or v is None:
+                continue
+            try:
+                self.values[i] = float(v)
+            except Exception:
+                self.values[i] = DEFAULT_ATTRIBUTE
+        self.ca = float(self.values @ CA_WEIGHTS)
+
+    def __getitem__(self, key: str) -> float:
+        return float(self.values[ATTRIBUTE_INDEX[key]])
+
+    def __setitem__(self, key: str, value: float) -> None:
+        i = ATTRIBUTE_INDEX[key]
+        value = float(value)
+        self.ca += (value - self.values[i]) * CA_WEIGHTS[i]
+        self.values[i] = value
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("attribute keys are fixed")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(ATTRIBUTE_KEYS)
+
+    def __len__(self) -> int:
+        return len(ATTRIBUTE_KEYS)
+
+    def __contains__(self, key: object) -> bool:
+        return key in ATTRIBUTE_INDEX
+
+    def __repr__(self) -> str:
+        return f"Attributes({dict(self)!r})"
+
+    def copy(self) -> Dict[str, float]:
+        return dict(self)
+
+    def _indexed(self, gains: Mapping[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        pairs = [(ATTRIBUTE_INDEX[k], v) for k, v in gains.items() if k in ATTRIBUTE_INDEX]
+        if not pairs:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        idx, amounts = zip(*pairs)
+        return np.fromiter(idx, dtype=np.intp, count=len(idx)), np.array(amounts, dtype=np.float64)
+
+    def grow(self, gains: Mapping[str, float], scale: float = 1.0) -> float:
+        """Add ``gains * scale``, clamped to 1–20, in one vector op; returns the CA delta."""
+        idx, amounts = self._indexed(gains)
+        if not len(idx):
+            return 0.0
+        old = self.values[idx]
+        new = np.clip(old + amounts * scale, ATTRIBUTE_MIN, ATTRIBUTE_MAX)
+        self.values[idx] = new
+        delta = float((new - old) @ CA_WEIGHTS[idx])
+        self.ca += delta
+        return delta
+
+    def preview_gain(self, gains: Mapping[str, float]) -> float:
+        """CA gained if ``gains`` were added (capped at 20), without applying them."""
+        idx, amounts = self._indexed(gains)
+        if not len(idx):
+            return 0.0
+        old = self.values[idx]
+        return max(0.0, float((np.minimum(ATTRIBUTE_MAX, old + amounts) - old) @ CA_WEIGHTS[idx]))
+
+    def recompute_ca(self) -> float:
+        """Full re-sum (drops accumulated floating-point drift)."""
+        self.ca = float(self.values @ CA_WEIGHTS)
+        return self.ca
+
+
+# --- Daily growth ---------------------------------------------------------
+GROWTH_CA_PER_INTENSITY = 5.0
+
+
+def daily_growth_ca(base_intensity, performance):
+    """Target CA gain for a day: intensity (0-1) scaled by performance (0-1.5).
+
+    Works on scalars and on NumPy arrays alike (the Monte Carlo runs it over
+    every simulated player at once).
+    """
+    return np.maximum(0.0, np.multiply(base_intensity, performance) * GROWTH_CA_PER_INTENSITY)
+
+
+# --- Daily upkeep ---------------------------------------------------------
+# 生活水準ごとの1日あたりの生活費と、HP消耗への補正
+LIVING_COSTS: Dict[str, int] = {"節約": 1000, "標準": 3000, "充実": 8000}
+LIVING_DRAIN_ADJUST: Dict[str, float] = {"節約": 2.0, "標準": 0.0, "充実": -1.0}
+BASE_HP_DRAIN = 8.0
+
+
+def _on_or_before(year: int, month: int, day: int) -> datetime.date:
+    # 2/29 生まれは平年なら 2/28 に祝う
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return datetime.date(year, month, 28)
+
+
+def count_anniversaries(month: int, day: int, old_date: datetime.date, new_date: datetime.date) -> int:
+    """How many times ``month/day`` falls in ``(old_date, new_date]``."""
+    if new_date <= old_date:
+        return 0
+    first = old_date.year if _on_or_before(old_date.year, month, day) > old_date else old_date.year + 1
+    last = new_date.year if _on_or_before(new_date.year, month, day) <= new_date else new_date.year - 1
+    return max(0, last - first + 1)
+
+
+def next_anniversary(month: int, day: int, after: datetime.date) -> datetime.date:
+    """First ``month/day`` strictly after ``after``."""
+    this_year = _on_or_before(after.year, month, day)
+    return this_year if this_year > after else _on_or_before(after.year + 1, month, day)
+
 
 # --- Data classes ---------------------------------------------------------
 @dataclasses.dataclass
@@ -102,7 +245,7 @@ class Player:
     name: str
     position: str
     age: int
-    attributes: Dict[str, float]
+    attributes: Attributes
     funds: int = 0
     salary: int = 0
     team_name: str = ""
@@ -124,6 +267,11 @@ class Player:
     living_standard: str = "標準"
     school_timetable: List[Dict] = dataclasses.field(default_factory=list)
     transfer_offers: List[Dict] = dataclasses.field(default_factory=list)
+    memory: Dict = dataclasses.field(default_factory=dict)
+    episodes: EpisodeIndex = dataclasses.field(default_factory=EpisodeIndex)
+    standings: Dict[str, LeagueTable] = dataclasses.field(default_factory=dict)
+    _schedule_index: Optional[ScheduleIndex] = dataclasses.field(default=None, init=False, repr=False, compare=False)
+    _calendar: Optional[SeasonCalendar] = dataclasses.field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         self.current_date = self.start_date or datetime.date.today()
@@ -132,23 +280,40 @@ class Player:
             self.birthday = self.start_date
         if not self.grade:
             self.grade = TeamGenerator._grade_label(self.team_category, self.age)
-        self.attributes = self._fill_missing_attributes(self.attributes)
-        self.ca = self._compute_ca()
+        self.attributes = Attributes(self.attributes)
 
     # --- Core helpers --------------------------------------------------
-    def _fill_missing_attributes(self, attrs: Dict[str, float]) -> Dict[str, float]:
-        merged = {k: 10.0 for k in WEIGHTS.keys()}
-        for k, v in (attrs or {}).items():
-            if k in merged and v is not None:
-                try:
-                    merged[k] = float(v)
-                except Exception:
-                    merged[k] = 10.0
-        return merged
+    @property
+    def ca(self) -> float:
+        return self.attributes.ca
+
+    @property
+    def schedule_index(self) -> ScheduleIndex:
+        """Date index over ``schedule``, rebuilt when the list is replaced or resized."""
+        index = self._schedule_index
+        if index is None or not index.covers(self.schedule):
+            index = self._schedule_index = ScheduleIndex(self.schedule)
+        return index
+
+    def invalidate_schedule(self) -> None:
+        """Call after editing rows of ``schedule`` in place."""
+        self._schedule_index = None
+
+    @property
+    def calendar(self) -> SeasonCalendar:
+        """Per-day calendar covering today and the coming week, refreshed from its source tables."""
+        cal = self._calendar
+        if cal is None or not cal.covers(self.current_date, days=7):
+            cal = self._calendar = SeasonCalendar.for_player(self)
+        return cal.refresh(self)
+
+    def invalidate_calendar(self, source: Optional[str] = None) -> None:
+        """Call after editing ``team_weekly_plan`` / ``school_timetable`` rows in place."""
+        if self._calendar is not None:
+            self._calendar.invalidate(source)
 
     def _compute_ca(self) -> float:
-        total = sum(self.attributes[k] * WEIGHTS[k] for k in WEIGHTS.keys())
-        return (total / THEORETICAL_MAX_SCORE) * 200
+        return self.attributes.recompute_ca()
 
     def compute_pap(self) -> float:
         """Return PAP (汎用性) score based on vision/decision-making attributes."""
@@ -171,14 +336,14 @@ class Player:
         self.npcs.append(npc)
 
     def grow_attribute(self, key: str, amount: float) -> None:
-        if key not in self.attributes:
-            return
-        self.attributes[key] = max(1.0, min(20.0, self.attributes[key] + amount))
-        self.ca = self._compute_ca()
+        self.attributes.grow({key: amount})
+
+    def grow_attributes(self, gains: Dict[str, float], scale: float = 1.0) -> float:
+        """Apply several gains at once (each clamped to 1–20); returns the CA delta."""
+        return self.attributes.grow(gains, scale)
 
     def compute_daily_growth_ca(self, base_intensity: float, performance: float) -> float:
-        # A simple heuristic: base intensity (0-1) scaled by performance (0-1.5)
-        return max(0.0, base_intensity * performance * 5)
+        return float(daily_growth_ca(base_intensity, performance))
 
     def advance_day(self, days: int = 1) -> None:
         self.apply_daily_upkeep(days)
@@ -188,20 +353,16 @@ class Player:
 
     def apply_daily_upkeep(self, days: int = 1) -> None:
         """Reduce HP/MP and funds based on stamina/adaptability and living standard."""
-        level_cost = {"節約": 1000, "標準": 3000, "充実": 8000}
-        cost_per_day = level_cost.get(self.living_standard, 3000)
+        cost_per_day = LIVING_COSTS.get(self.living_standard, LIVING_COSTS["標準"])
         if hasattr(self, "funds"):
             self.funds = max(0, self.funds - cost_per_day * max(1, days))
 
         stamina = self.attributes.get("Stamina", 10.0)
         adapt = self.attributes.get("Adaptability", 10.0)
-        base_drain = 8.0
+        base_drain = BASE_HP_DRAIN
         base_drain -= stamina / 3.0
         base_drain -= adapt / 4.0
-        if self.living_standard == "節約":
-            base_drain += 2.0
-        elif self.living_standard == "充実":
-            base_drain -= 1.0
+        base_drain += LIVING_DRAIN_ADJUST.get(self.living_standard, 0.0)
         per_day = max(1.0, base_drain)
         total = int(per_day * max(1, days))
         self.hp = max(0, self.hp - total)
@@ -236,22 +397,17 @@ class Player:
 
     def _handle_age_and_grade_rollover(self, old_date: datetime.date, new_date: datetime.date) -> None:
         """Advance age on birthday and promote school grades at fiscal year end."""
-        # 誕生日: old_date < birthday <= new_date なら年齢を加算
+        # 誕生日: old_date < birthday <= new_date の回数だけ年齢を加算
         if self.birthday:
-            for year in range(old_date.year, new_date.year + 1):
-                bday = self.birthday.replace(year=year)
-                if old_date < bday <= new_date:
-                    self.age += 1
+            self.age += count_anniversaries(self.birthday.month, self.birthday.day, old_date, new_date)
 
         # 学年進級: 3/31を跨いだら昇級（高校3→卒業、大学4→卒業で据え置き）
         if self.team_category in ("HighSchool", "University"):
-            for year in range(old_date.year, new_date.year + 1):
-                cutoff = datetime.date(year, 3, 31)
-                if old_date < cutoff <= new_date:
-                    self._promote_grade()
-                    for m in self.team_members:
-                        m.grade = self._promote_grade_label(m.grade)
-                        m.age = max(m.age, 0) + 1
+            for _ in range(count_anniversaries(3, 31, old_date, new_date)):
+                self._promote_grade()
+                for m in self.team_members:
+                    m.grade = self._promote_grade_label(m.grade)
+                    m.age = max(m.age, 0) + 1
 
     def _promote_grade(self) -> None:
         self.grade = self._promote_grade_label(self.grade)
@@ -279,7 +435,7 @@ class Player:
             "name": self.name,
             "position": self.position,
             "age": self.age,
-            "attributes": self.attributes,
+            "attributes": dict(self.attributes),
             "funds": self.funds,
             "salary": self.salary,
             "team_name": self.team_name,
@@ -302,6 +458,9 @@ class Player:
             "living_standard": self.living_standard,
             "school_timetable": self.school_timetable,
             "transfer_offers": self.transfer_offers,
+            "memory": self.memory,
+            "episodes": self.episodes.to_dict(),
+            "standings": tables_to_dict(self.standings),
         }
 
     @classmethod
@@ -345,6 +504,9 @@ class Player:
         player.living_standard = data.get("living_standard", "標準")
         player.school_timetable = data.get("school_timetable", [])
         player.transfer_offers = data.get("transfer_offers", [])
+        player.memory = data.get("memory", {})
+        player.episodes = EpisodeIndex.from_dict(data.get("episodes"))
+        player.standings = tables_from_dict(data.get("standings"))
         player.update_hierarchy()
         return player
 
@@ -0,0 +1,108 @@
+"""Incremental extraction of one string field from a streamed JSON object.
+
+Story prompts return a JSON object whose bulk is a single long string
+(``story`` / ``description`` / ``result_story``).  When the response is
+streamed, :class:`StreamingFieldExtractor` pulls the decoded prefix of that
+string out of the partial text so the UI can show it as it grows; the rest
+of the object is parsed normally once the stream has finished.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+def _hex4(text: str) -> Optional[int]:
+    """``"00e9"`` → 0xE9; anything that is not exactly four hex digits → None."""
+    if len(text) != 4:
+        return None
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+
+class StreamingFieldExtractor:
+    """Feed raw chunks with :meth:`feed`; ``text`` holds the decoded value so far."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.text = ""
+        self.done = False
+        self._buf = ""
+        self._pos: Optional[int] = None  # 値文字列の中で次にデコードする位置
+        self._key_re = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+
+    def feed(self, chunk: str) -> str:
+        """Consume ``chunk`` and return the newly decoded part of the value."""
+        self._buf += chunk or ""
+        if self.done:
+            return ""
+        if self._pos is None:
+            m = self._key_re.search(self._buf)
+            if not m:
+                return ""
+            self._pos = m.end()
+        start_len = len(self.text)
+        self._decode()
+        return self.text[start_len:]
+
+    def _decode(self) -> None:
+        buf = self._buf
+        i = self._pos
+        out = []
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # エスケープ途中でチャンクが切れていたら次の feed まで待つ
+            if i + 1 >= n:
+                break
+            esc = buf[i + 1]
+            if esc == "u":
+                if i + 6 > n:
+                    break
+                code = _hex4(buf[i + 2:i + 6])
+                if code is None or 0xDC00 <= code < 0xE000:
+                    # 壊れたエスケープや単独の後半サロゲートは、そのままの文字で出す
+                    out.append(buf[i:i + 2])
+                    i += 2
+                    continue
+                if 0xD800 <= code < 0xDC00:
+                    # サロゲートペアは後半が揃うまで待つ
+                    if i + 12 > n:
+                        break
+                    low = _hex4(buf[i + 8:i + 12]) if buf[i + 6:i + 8] == "\\u" else None
+                    if low is None or not 0xDC00 <= low < 0xE000:
+                        out.append(buf[i:i + 6])
+                        i += 6
+                        continue
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+                out.append(chr(code))
+                i += 6
+                continue
+            out.append(_ESCAPES.get(esc, esc))
+            i += 2
+        self._pos = i
+        self.text += "".join(out)
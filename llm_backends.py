@@ -0,0 +1,432 @@
+"""Pluggable text-generation backends for ``call_gemini``.
+
+* :class:`GeminiBackend` talks to the real API through the pooled models
+  from :mod:`llm_clients`.
+* :class:`StubBackend` is a deterministic local stand-in that returns
+  schema-valid JSON for every prompt kind with configurable synthetic
+  latency, so whole careers can run offline.
+* :class:`RecordingBackend` wraps another backend and appends every
+  response to a cassette file; :class:`ReplayBackend` serves a cassette
+  back without touching the network.
+
+Backends return raw response text; parsing stays in ``app.py``.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional
+
+import game_data
+import llm_cache
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_DIR = Path("cassettes")
+STREAM_CHUNK_CHARS = 32
+
+
+class CassetteMiss(LookupError):
+    """Raised by :class:`ReplayBackend` when no recorded response matches."""
+
+
+class LLMBackend:
+    """Interface: ``generate`` returns the full text, ``stream`` yields chunks.
+
+    When a ``usage`` dict is passed, backends that know their token counts
+    fill ``prompt_tokens`` / ``output_tokens`` / ``total_tokens`` into it.
+    """
+
+    name = "base"
+    # ディスクキャッシュに載せてよい応答か（ローカル生成はキャッシュを汚さない）
+    cacheable = False
+    # プロバイダのレート制限を受けるか（rate_limit のトークンを取ってから呼ぶ）
+    rate_limited = False
+
+    def generate(self, model: str, config: Dict, prompt: str, kind: str,
+                 timeout: Optional[float] = None, usage: Optional[Dict] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, model: str, config: Dict, prompt: str, kind: str,
+               timeout: Optional[float] = None, usage: Optional[Dict] = None) -> Iterator[str]:
+        text = self.generate(model, config, prompt, kind, timeout, usage)
+        for i in range(0, len(text), STREAM_CHUNK_CHARS):
+            yield text[i:i + STREAM_CHUNK_CHARS]
+
+    @property
+    def scope(self) -> str:
+        """Circuit-breaker scope; one backend instance should not trip another."""
+        return self.name
+
+
+def client_pool_stats() -> Optional[Dict]:
+    """Gemini client pool counters, or ``None`` before any Gemini call loaded the SDK."""
+    clients = sys.modules.get("llm_clients")
+    return clients.get_pool().stats() if clients is not None else None
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    cacheable = True
+    rate_limited = True
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    # llm_clients は SDK を import するので、スタブ/再生だけで動かす場合に備えて遅延 import する
+    @property
+    def scope(self) -> str:
+        import llm_clients
+        return llm_clients.key_fingerprint(self.api_key)
+
+    def _model(self, model: str, config: Dict):
+        import llm_clients
+        return llm_clients.get_pool().get_model(self.api_key, model, config)
+
+    def generate(self, model, config, prompt, kind, timeout=None, usage=None):
+        options = {"timeout": timeout} if timeout else None
+        res = self._model(model, config).generate_content(prompt, request_options=options)
+        if usage is not None:
+            usage.update(telemetry.usage_from_metadata(getattr(res, "usage_metadata", None)))
+        return res.text
+
+    def stream(self, model, config, prompt, kind, timeout=None, usage=None):
+        options = {"timeout": timeout} if timeout else None
+        for chunk in self._model(model, config).generate_content(prompt, stream=True, request_options=options):
+            # 使用量は最後のチャンクに載るので、来るたびに上書きする
+            meta = getattr(chunk, "usage_metadata", None)
+            if usage is not None and meta is not None:
+                usage.update(telemetry.usage_from_metadata(meta))
+            try:
+                yield chunk.text
+            except ValueError:
+                # セーフティ等でテキストを持たないチャンクは読み飛ばす
+                continue
+
+
+# --- Local stand-in -------------------------------------------------------
+_WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class StubBackend(LLMBackend):
+    """Deterministic stand-in: the same prompt always yields the same JSON."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+
+    def generate(self, model, config, prompt, kind, timeout=None, usage=None):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub {kind} exceeded {timeout:.1f}s")
+        if delay:
+            time.sleep(delay)
+        builder = getattr(self, f"_build_{kind}", self._build_default)
+        return json.dumps(builder(prompt, rng), ensure_ascii=False)
+
+    def stream(self, model, config, prompt, kind, timeout=None, usage=None):
+        # 合成レイテンシを最初のチャンクまでの時間とみなす
+        text = self.generate(model, config, prompt, kind, timeout, usage)
+        for i in range(0, len(text), STREAM_CHUNK_CHARS):
+            yield text[i:i + STREAM_CHUNK_CHARS]
+
+    # --- builders ------------------------------------------------------
+    @staticmethod
+    def _year(prompt: str) -> int:
+        m = re.search(r"(\d{4})\s*年", prompt) or re.search(r"(\d{4})-\d{2}-\d{2}", prompt)
+        return int(m.group(1)) if m else datetime.date.today().year
+
+    def _build_default(self, prompt, rng):
+        return {}
+
+    def _build_initial_data(self, prompt, rng):
+        return {
+            "attributes": {k: round(rng.uniform(6.0, 14.0), 1) for k in game_data.WEIGHTS},
+            "funds": rng.randrange(50_000, 1_000_000, 10_000),
+            "salary": 0,
+            "npcs": [
+                {"role": "父親", "name": rng.choice(game_data.TeamGenerator.LAST_NAMES) + " 父", "relation": -5, "description": "進路を心配している"},
+                {"role": "監督", "name": rng.choice(game_data.TeamGenerator.LAST_NAMES) + " 監督", "relation": 0, "description": "まだ様子見"},
+            ],
+        }
+
+    def _build_team_data(self, prompt, rng):
+        pools = game_data.TeamGenerator
+        players = []
+        for i in range(25):
+            pos = rng.choice(pools.POSITIONS_POOL)
+            players.append({
+                "name": f"{rng.choice(pools.LAST_NAMES)} {rng.choice(pools.FIRST_NAMES)}",
+                "position": pos,
+                "value": rng.randrange(50_000, 5_000_000, 50_000),
+                "number": i + 1,
+                "age": rng.randint(18, 33),
+                "foot": rng.choice(["右", "右", "左"]),
+                "height": rng.randint(165, 192),
+            })
+        return {"formation": rng.choice(["4-3-3", "4-4-2", "3-4-2-1"]), "real_players": players}
+
+    def _build_weekly_plan(self, prompt, rng):
+        plan = []
+        for wd in _WEEKDAYS:
+            if wd == "Sun":
+                plan.append({"weekday": wd, "morning": "OFF", "afternoon": "OFF", "evening": "自由"})
+            elif wd == "Sat":
+                plan.append({"weekday": wd, "morning": "試合前調整", "afternoon": "試合", "evening": "リカバリー"})
+            else:
+                plan.append({
+                    "weekday": wd,
+                    "morning": rng.choice(["OFF", "ジム", "ミーティング"]),
+                    "afternoon": rng.choice(["チームトレーニング", "戦術トレーニング", "フィジカル"]),
+                    "evening": rng.choice(["自由", "映像分析", "自習"]),
+                })
+        return {"plan": plan}
+
+    def _build_schedule(self, prompt, rng):
+        # 日程そのものは fixtures が組むので、大会メタ情報と対戦相手だけ返す
+        year = self._year(prompt)
+        clubs = [f"クラブ{i}" for i in range(1, 18)]
+        competitions = [{
+            "code": "LEAGUE",
+            "name": "ローカルリーグ",
+            "type": "league",
+            "priority": 1,
+            "season_start": f"{year}-03-01",
+            "season_end": f"{year}-11-30",
+            "match_days": ["Sat"],
+            "team_count": 18,
+            "rounds": 2,
+            "include_for_player": True,
+            "opponents": clubs,
+        }, {
+            "code": "CUP",
+            "name": "ローカルカップ",
+            "type": "knockout",
+            "priority": 2,
+            "season_start": f"{year}-05-01",
+            "season_end": f"{year}-10-31",
+            "match_days": ["Wed"],
+            "rounds": rng.randint(2, 5),
+            "include_for_player": True,
+            "opponents": rng.sample(clubs, 5),
+        }]
+        return {"competitions": competitions}
+
+    def _build_timetable(self, prompt, rng):
+        univ = "履修" in prompt
+        subjects = ["現代文", "数学I", "英語", "世界史", "化学基礎", "体育", "古典", "情報"]
+        rows = []
+        for wd in _WEEKDAYS[:5]:
+            row = {"weekday": wd}
+            for p in range(1, 6 if univ else 7):
+                row[f"p{p}"] = rng.choice(subjects + (["空きコマ"] if univ else []))
+                if univ:
+                    row[f"p{p}_required"] = rng.choice(["必修", "選択"])
+                    row[f"p{p}_delivery"] = rng.choice(["オンライン", "オンデマンド", "オフライン"])
+            rows.append(row)
+        return {"timetable": rows}
+
+    def _build_story(self, prompt, rng):
+        return {"story": "スタブ生成の物語。\n" + "ボールを蹴る音が響く。" * rng.randint(10, 20)}
+
+    def _build_next_event(self, prompt, rng):
+        return {
+            "title": rng.choice(["居残り練習", "監督との面談", "寮の夜", "メンバー発表"]),
+            "description": "スタブ生成のイベント本文。\n" + "グラウンドに風が吹く。" * rng.randint(10, 20),
+            "choices": [
+                {"text": "全力で取り組む", "hint": "成長大・疲労大"},
+                {"text": "いつも通りこなす", "hint": "安定"},
+                {"text": "休養に充てる", "hint": "回復"},
+            ],
+        }
+
+    def _build_event_batch(self, prompt, rng):
+        days = re.search(r"次の (\d+) 日間", prompt)
+        dates = re.findall(r"\d{4}-\d{2}-\d{2}", prompt)
+        events = []
+        for i in range(int(days.group(1)) if days else 3):
+            ev = self._build_next_event(prompt + str(i), random.Random(rng.random()))
+            ev["date"] = dates[i] if i < len(dates) else ""
+            events.append(ev)
+        return {"events": events}
+
+    def _build_memory(self, prompt, rng):
+        days = re.findall(r"^\s*- (\d{4}-\d{2}-\d{2}) ([^/]+)/", prompt, flags=re.M)
+        lines = [f"{d} {t.strip()}" for d, t in days]
+        return {"summary": "スタブ要約: " + "、".join(lines)}
+
+    def _build_resolve_action(self, prompt, rng):
+        keys = rng.sample(list(game_data.WEIGHTS), rng.randint(2, 6))
+        return {
+            "result_story": "スタブ生成の結果本文。\n" + "汗が額を伝う。" * rng.randint(10, 20),
+            "grow_stats": {k: round(rng.uniform(0.01, 0.3), 2) for k in keys},
+            "hp_cost": rng.randint(0, 20),
+            "mp_cost": rng.randint(0, 10),
+            "relation_change": {"role": "監督", "val": rng.randint(-3, 3)},
+            "base": round(rng.uniform(0.01, 0.3), 3),
+            "performance": round(rng.uniform(0.6, 1.5), 2),
+        }
+
+
+# --- Cassettes ------------------------------------------------------------
+class Cassette:
+    """Append-only JSONL file of ``{key, kind, model, text}`` records."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, str] = {}
+        self._by_kind: Dict[str, List[str]] = defaultdict(list)
+        # 記録が途中で切れたファイルは、次の追記の前に改行を補う
+        self._needs_newline = False
+        if self.path.exists():
+            content = self.path.read_text(encoding="utf-8")
+            self._needs_newline = bool(content) and not content.endswith("\n")
+            for n, line in enumerate(content.splitlines(), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                    self._index(rec)
+                except (ValueError, KeyError, TypeError) as exc:
+                    logger.warning("skipping unreadable line %d of %s: %s", n, self.path, exc)
+
+    def _index(self, rec: Dict) -> None:
+        self._by_key[rec["key"]] = rec["text"]
+        self._by_kind[rec.get("kind", "default")].append(rec["text"])
+
+    def append(self, key: str, kind: str, model: str, text: str) -> None:
+        rec = {"key": key, "kind": kind, "model": model, "text": text}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fh:
+                if self._needs_newline:
+                    fh.write("\n")
+                    self._needs_newline = False
+                fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._index(rec)
+
+    def lookup(self, key: str) -> Optional[str]:
+        return self._by_key.get(key)
+
+    def by_kind(self, kind: str) -> List[str]:
+        return list(self._by_kind.get(kind, ()))
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+
+class RecordingBackend(LLMBackend):
+    name = "record"
+    cacheable = True
+
+    def __init__(self, inner: LLMBackend, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    @property
+    def scope(self) -> str:
+        return self.inner.scope
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.inner.rate_limited
+
+    def generate(self, model, config, prompt, kind, timeout=None, usage=None):
+        text = self.inner.generate(model, config, prompt, kind, timeout, usage)
+        self.cassette.append(llm_cache.make_key(model, config, prompt), kind, model, text)
+        return text
+
+    def stream(self, model, config, prompt, kind, timeout=None, usage=None):
+        parts = []
+        for piece in self.inner.stream(model, config, prompt, kind, timeout, usage):
+            parts.append(piece)
+            yield piece
+        self.cassette.append(llm_cache.make_key(model, config, prompt), kind, model, "".join(parts))
+
+
+class ReplayBackend(LLMBackend):
+    """Serve recorded responses; unmatched prompts fall back to the same kind in order.
+
+    With ``strict=True`` an unmatched prompt raises :class:`CassetteMiss`
+    instead, which is what reproducible benchmarks want.
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette: Cassette, strict: bool = False):
+        self.cassette = cassette
+        self.strict = strict
+        self._cursors: Dict[str, Deque[str]] = {}
+        self._lock = threading.Lock()
+
+    def generate(self, model, config, prompt, kind, timeout=None, usage=None):
+        text = self.cassette.lookup(llm_cache.make_key(model, config, prompt))
+        if text is not None:
+            return text
+        if self.strict:
+            raise CassetteMiss(f"no recorded {kind} response for this prompt")
+        with self._lock:
+            queue = self._cursors.get(kind)
+            if not queue:
+                queue = self._cursors[kind] = deque(self.cassette.by_kind(kind))
+            if not queue:
+                raise CassetteMiss(f"cassette has no {kind} responses")
+            text = queue.popleft()
+        return text
+
+
+_cassettes: Dict[Path, Cassette] = {}
+_cassettes_lock = threading.Lock()
+# カセット名は英数字・かな漢字・-・_ だけ（パス区切りや拡張子は受け付けない）
+_CASSETTE_NAME = re.compile(r"[\w\-]+")
+
+
+def cassette_path(name: str) -> Path:
+    """``CASSETTE_DIR/<name>.jsonl``; names that are paths or carry a suffix raise ``ValueError``."""
+    name = (name or "").strip()
+    if Path(name).name != name or not _CASSETTE_NAME.fullmatch(name):
+        raise ValueError(f"invalid cassette name: {name!r}")
+    return CASSETTE_DIR / f"{name}.jsonl"
+
+
+def get_cassette(name: str) -> Cassette:
+    """Process-wide cassette registry so sessions share one file handle/index."""
+    path = cassette_path(name)
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def make_backend(mode: str, api_key: Optional[str] = None, cassette: str = "default",
+                 latency: float = 0.0) -> Optional[LLMBackend]:
+    """Build a backend from the sidebar settings (``None`` if it cannot run).
+
+    An invalid cassette name raises ``ValueError`` (see :func:`cassette_path`).
+    """
+    if mode == "stub":
+        return StubBackend(latency=latency, jitter=latency / 2)
+    if mode == "replay":
+        return ReplayBackend(get_cassette(cassette))
+    if not api_key:
+        return None
+    gemini = GeminiBackend(api_key)
+    if mode == "record":
+        return RecordingBackend(gemini, get_cassette(cassette))
+    return gemini
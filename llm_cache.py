@@ -0,0 +1,200 @@
+"""Persistent, content-addressed cache for Gemini responses.
+
+``call_gemini`` in ``app.py`` sends many byte-identical prompts (team data
+for popular clubs, weekly plans, schedules, timetables, reruns of the same
+phase).  This module stores the raw response text on disk keyed by
+``(model, generation_config, normalized prompt)`` so that those prompts are
+served locally after the first hit.  The directory is bounded in size and
+evicted in LRU order; every prompt kind has its own TTL and kinds that are
+expected to vary (``next_event`` / ``resolve_action`` / ``memory``) are never cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+CACHE_DIR = Path(".llm_cache")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_DAY = 24 * 3600
+
+# プロンプト種別ごとのTTL（秒）。None はキャッシュ対象外。
+PROMPT_KIND_TTLS: Dict[str, Optional[float]] = {
+    "initial_data": 1 * _DAY,
+    "team_data": 30 * _DAY,
+    "weekly_plan": 30 * _DAY,
+    "schedule": 30 * _DAY,
+    "timetable": 30 * _DAY,
+    "story": 1 * 3600,
+    "next_event": None,
+    "event_batch": None,
+    "resolve_action": None,
+    "memory": None,
+}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Drop indentation and blank lines so cosmetic f-string changes do not miss."""
+    lines = (line.strip() for line in (prompt or "").strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_key(model: str, generation_config: Optional[Dict], prompt: str) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "config": generation_config or {},
+            "prompt": normalize_prompt(prompt),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of response texts stored one file per key."""
+
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttls: Optional[Dict[str, Optional[float]]] = None,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttls = dict(PROMPT_KIND_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (size, last_access)。初回アクセス時にディレクトリから再構築する
+        self._index: Optional[Dict[str, Tuple[int, float]]] = None
+        self._total_bytes = 0
+
+    # --- Public API ----------------------------------------------------
+    def ttl_for(self, kind: str) -> Optional[float]:
+        return self.ttls.get(kind)
+
+    def is_cacheable(self, kind: str) -> bool:
+        return self.ttl_for(kind) is not None
+
+    def get(self, key: str, kind: str) -> Optional[str]:
+        ttl = self.ttl_for(kind)
+        if ttl is None:
+            return None
+        path = self._path(key)
+        with self._lock:
+            self._ensure_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except Exception:
+                self._drop(key)
+                self.misses += 1
+                return None
+            if time.time() - float(entry.get("created", 0)) > ttl:
+                self._drop(key)
+                self.misses += 1
+                return None
+            now = time.time()
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            size, _ = self._index[key]
+            self._index[key] = (size, now)
+            self.hits += 1
+            return entry.get("text")
+
+    def put(self, key: str, kind: str, text: str, model: str = "") -> None:
+        if not self.is_cacheable(kind) or not text:
+            return
+        body = json.dumps(
+            {"kind": kind, "model": model, "created": time.time(), "text": text},
+            ensure_ascii=False,
+        )
+        path = self._path(key)
+        with self._lock:
+            self._ensure_index()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(body, encoding="utf-8")
+            os.replace(tmp, path)
+            if key in self._index:
+                self._total_bytes -= self._index[key][0]
+            size = path.stat().st_size
+            self._index[key] = (size, time.time())
+            self._total_bytes += size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ensure_index()
+            for key in list(self._index):
+                self._drop(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._ensure_index()
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # --- Internals -----------------------------------------------------
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _ensure_index(self) -> None:
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        if not self.root.exists():
+            return
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            self._index[path.stem] = (st.st_size, st.st_mtime)
+            self._total_bytes += st.st_size
+
+    def _drop(self, key: str) -> None:
+        size, _ = self._index.pop(key, (0, 0.0))
+        self._total_bytes -= size
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._drop(key)
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide cache shared by every Streamlit session."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,172 @@
+"""Process-wide pool of Gemini clients and models.
+
+``call_gemini`` used to run ``genai.configure`` and build a fresh
+``GenerativeModel`` on every call, which repeats client setup and connection
+establishment on the hottest path of the app.  :class:`ClientPool` keeps one
+transport client per API key and one model per
+``(api key fingerprint, model name, generation config)``, shared by every
+Streamlit session in the server process.  ``genai.configure`` mutates a
+global default client, so each pooled model is bound to its own per-key
+transport instead; idle entries are evicted after ``idle_ttl`` seconds.
+
+The SDK has no public way to hand a model its client, so the per-key
+transport is set on ``GenerativeModel._client``.  requirements.txt pins the
+SDK to the releases that have that attribute (and support
+``response_mime_type`` / ``response_schema``), and :func:`bind_transport`
+checks for it.  If a release drops it the pool raises
+:class:`UnsupportedSDKError` rather than falling back to the global
+``genai.configure``, which would let concurrent sessions send requests
+with each other's API keys.  :meth:`ClientPool.stats` reports ``avg_build_ms`` (what
+every call paid before pooling) next to ``avg_acquire_ms`` (what a call pays
+now); the ``?admin=1`` panel shows both.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+try:
+    import google.ai.generativelanguage as glm
+except ImportError:  # 古い SDK: キー単位のクライアントが作れない
+    glm = None
+
+DEFAULT_IDLE_TTL = 15 * 60
+DEFAULT_MAX_MODELS = 64
+
+logger = logging.getLogger(__name__)
+
+
+class UnsupportedSDKError(RuntimeError):
+    """The installed SDK cannot give a model its own per-key client."""
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable, non-reversible identifier so raw keys never become dict keys."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def bind_transport(model, transport) -> bool:
+    """Point ``model`` at a per-key transport; False if this SDK has no slot for it."""
+    # GenerativeModel は __init__ で _client = None を持ち、初回呼び出しで既定クライアントを入れる
+    if transport is None or not hasattr(model, "_client"):
+        return False
+    model._client = transport
+    return True
+
+
+class ClientPool:
+    def __init__(self, idle_ttl: float = DEFAULT_IDLE_TTL, max_models: int = DEFAULT_MAX_MODELS):
+        self.idle_ttl = idle_ttl
+        self.max_models = max_models
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self._lock = threading.Lock()
+        # fingerprint -> [transport client, last_used]
+        self._transports: Dict[str, list] = {}
+        # (fingerprint, model, config) -> [GenerativeModel, last_used]
+        self._models: "OrderedDict[Tuple[str, str, str], list]" = OrderedDict()
+
+    def get_model(self, api_key: str, model_name: str, generation_config: Optional[Dict] = None):
+        fp = key_fingerprint(api_key)
+        config_key = json.dumps(generation_config or {}, sort_keys=True)
+        key = (fp, model_name, config_key)
+        now = time.monotonic()
+        started = time.perf_counter()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._models.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._models.move_to_end(key)
+                self._touch_transport(fp, now)
+                self.hits += 1
+                self.acquire_seconds += time.perf_counter() - started
+                return entry[0]
+            self.misses += 1
+            model = genai.GenerativeModel(model_name, generation_config=generation_config)
+            transport = self._transport_for(api_key, fp, now)
+            if not bind_transport(model, transport):
+                # genai.configure はプロセス全体の既定キーを書き換えるので、他のセッションのキーと混ざる
+                logger.error("GenerativeModel has no _client slot; refusing to use genai.configure")
+                raise UnsupportedSDKError(
+                    "this google-generativeai release cannot bind a per-key client; "
+                    "install a version allowed by requirements.txt"
+                )
+            elapsed = time.perf_counter() - started
+            self.build_seconds += elapsed
+            self.acquire_seconds += elapsed
+            self._models[key] = [model, now]
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self.evictions += 1
+            return model
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.hits + self.misses
+            return {
+                "models": len(self._models),
+                "transports": len(self._transports),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / calls) if calls else 0.0,
+                "avg_build_ms": (self.build_seconds / self.misses * 1000) if self.misses else 0.0,
+                "avg_acquire_ms": (self.acquire_seconds / calls * 1000) if calls else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._transports.clear()
+
+    # --- Internals -----------------------------------------------------
+    def _transport_for(self, api_key: str, fp: str, now: float):
+        entry = self._transports.get(fp)
+        if entry is not None:
+            entry[1] = now
+            return entry[0]
+        if glm is None:
+            raise UnsupportedSDKError("google.ai.generativelanguage is not available")
+        transport = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        self._transports[fp] = [transport, now]
+        return transport
+
+    def _touch_transport(self, fp: str, now: float) -> None:
+        entry = self._transports.get(fp)
+        if entry is not None:
+            entry[1] = now
+
+    def _evict_idle(self, now: float) -> None:
+        idle = [k for k, (_, used) in self._models.items() if now - used > self.idle_ttl]
+        for k in idle:
+            del self._models[k]
+            self.evictions += 1
+        live_fps = {k[0] for k in self._models}
+        for fp in [fp for fp, (_, used) in self._transports.items()
+                   if fp not in live_fps and now - used > self.idle_ttl]:
+            del self._transports[fp]
+
+
+_default_pool: Optional[ClientPool] = None
+_default_lock = threading.Lock()
+
+
+def get_pool() -> ClientPool:
+    """Return the pool shared by every session in this server process."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool()
+        return _default_pool
@@ -0,0 +1,295 @@
+"""Vectorised Monte Carlo careers for balance tuning.
+
+Simulates N players at once as NumPy arrays — an attribute matrix (only
+the columns some action grows are updated daily, in float32; the rest stay
+fixed and are folded into a per-player CA constant) plus per-player vectors
+for PA, HP/MP, funds, age, grade and living standard — and advances all of
+them one day per step with the same rules as the single-player loop:
+
+* actions come from :data:`engine.RULE_ACTIONS` as :class:`engine.RuleResolver`
+  picks them (rest below ``REST_BELOW_HP``, the match action on match days);
+* growth is scaled to :func:`game_data.daily_growth_ca` (the formula behind
+  ``Player.compute_daily_growth_ca``) exactly like :func:`engine.apply_growth`,
+  clamped to 1–20;
+* upkeep drains HP and funds like ``Player.apply_daily_upkeep``;
+* birthdays add a year and 3/31 promotes school grades like
+  ``Player._handle_age_and_grade_rollover``.
+
+There is no schedule, so every ``match_weekday`` is a match day.  Players
+are simulated in fixed chunks, each with its own ``SeedSequence`` child, so
+results for a seed are identical with or without the process pool.
+
+With the game's own rules there is no income, so every living standard
+eventually goes broke; ``median_day`` (days until funds first hit zero)
+is what separates the standards.  ``--monthly-income`` adds a what-if
+allowance on the 1st of each month.
+
+Run ``python monte_carlo.py --players 10000 --seasons 5`` for a summary
+(a few seconds on one core; ``--workers`` spreads the chunks over a
+process pool).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import engine
+import game_data
+
+CHUNK_PLAYERS = 5000
+SAMPLE_EVERY_DAYS = 7
+PERCENTILES = (10, 50, 90)
+LIVING_STANDARDS = tuple(game_data.LIVING_COSTS)
+SCHOOL_CATEGORIES = ("HighSchool", "University")
+# 既定は本編と同じ: new_player の初期資金だけで、収入は無い（apply_daily_upkeep は減らすだけ）
+DEFAULT_FUNDS = 300_000
+
+_ACTIONS = tuple(engine.RULE_ACTIONS) + (engine.RULE_MATCH_ACTION,)
+_REST = len(engine.RULE_ACTIONS) - 1
+_MATCH = len(_ACTIONS) - 1
+
+
+def _action_tables():
+    """Gains per action over the columns any action grows, plus costs."""
+    touched = sorted({game_data.ATTRIBUTE_INDEX[k] for a in _ACTIONS for k in a["grow_stats"]})
+    position = {col: j for j, col in enumerate(touched)}
+    gains = np.zeros((len(_ACTIONS), len(touched)))
+    for a, action in enumerate(_ACTIONS):
+        for k, v in action["grow_stats"].items():
+            gains[a, position[game_data.ATTRIBUTE_INDEX[k]]] = v
+    hp_cost = np.array([a["hp_cost"] for a in _ACTIONS], dtype=np.int64)
+    mp_cost = np.array([a["mp_cost"] for a in _ACTIONS], dtype=np.int64)
+    base = np.array([a["base"] for a in _ACTIONS])
+    return np.array(touched, dtype=np.intp), gains, hp_cost, mp_cost, base
+
+
+def _grade_number(label: str) -> int:
+    """``"2年"`` → 2, ``"卒業"`` → 0, no grade → -1."""
+    if label == "卒業":
+        return 0
+    return int(label[0]) if label and label[0].isdigit() else -1
+
+
+def _simulate_chunk(
+    n: int,
+    days: int,
+    seed: np.random.SeedSequence,
+    start: datetime.date,
+    category: str,
+    age: int,
+    initial_funds: int,
+    monthly_income: int,
+    match_weekday: int,
+    sample_every: int,
+) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    cols, gains, hp_cost, mp_cost, base = _action_tables()
+    w = game_data.CA_WEIGHTS
+
+    # 初期集団（engine.new_player と同じ分布）
+    attrs = rng.uniform(6.0, 12.0, (n, len(game_data.ATTRIBUTE_KEYS))).round(1)
+    # 行動で伸びる列だけを float32 の別行列で持ち、毎日の成長はこの列だけで計算する
+    grown = attrs[:, cols].astype(np.float32)
+    wc = w[cols].astype(np.float32)
+    gains = gains.astype(np.float32)
+    ca_fixed = attrs @ w - grown @ wc
+    ca = ca_fixed + grown @ wc
+    g = np.empty_like(grown)
+    tmp = np.empty_like(grown)
+
+    def column(key):
+        i = game_data.ATTRIBUTE_INDEX[key]
+        j = np.flatnonzero(cols == i)
+        if j.size:
+            return lambda: grown[:, j[0]]
+        return lambda: attrs[:, i]
+
+    stamina, adapt = column("Stamina"), column("Adaptability")
+    pa = rng.uniform(100.0, 180.0, n).round(1)
+    ages = np.full(n, age, dtype=np.int64)
+    grade = np.full(n, _grade_number(game_data.TeamGenerator._grade_label(category, age)), dtype=np.int64)
+    school = category in SCHOOL_CATEGORIES
+    hp = np.full(n, 100, dtype=np.int64)
+    mp = np.full(n, 100, dtype=np.int64)
+    funds = np.full(n, initial_funds, dtype=np.int64)
+    living = rng.integers(0, len(LIVING_STANDARDS), n)
+    cost = np.array([game_data.LIVING_COSTS[s] for s in LIVING_STANDARDS], dtype=np.int64)[living]
+    drain_adjust = np.array([game_data.LIVING_DRAIN_ADJUST.get(s, 0.0) for s in LIVING_STANDARDS])[living]
+    birthday = rng.integers(1, 13, n) * 100 + rng.integers(1, 29, n)
+    bankrupt_day = np.full(n, -1, dtype=np.int64)
+
+    samples = days // sample_every + 1
+    snap_age = np.empty((samples, n), dtype=np.int16)
+    snap_ca = np.empty((samples, n), dtype=np.float32)
+    snap_pa = np.empty((samples, n), dtype=np.float32)
+    s = 0
+
+    date = start
+    for day in range(days):
+        if day % sample_every == 0:
+            snap_age[s], snap_ca[s], snap_pa[s] = ages, ca, pa
+            s += 1
+
+        # 行動選択（RuleResolver と同じ: 試合日は試合、HP が低ければ休養、それ以外は練習から一様）
+        if date.weekday() == match_weekday:
+            action = np.full(n, _MATCH)
+        else:
+            action = rng.integers(0, _REST, n)
+            action[hp < engine.REST_BELOW_HP] = _REST
+        fatigue = np.clip(hp / 80, 0.4, 1.0)
+        performance = rng.uniform(0.7, 1.2, n) * fatigue
+
+        # 成長: 目標CA増分に合わせてスケールし、1〜20 に収める（一時行列を使い回して確保を避ける）
+        np.take(gains, action, axis=0, out=g)
+        np.add(grown, g, out=tmp)
+        np.minimum(tmp, game_data.ATTRIBUTE_MAX, out=tmp)
+        tmp -= grown
+        raw = tmp @ wc
+        target = game_data.daily_growth_ca(base[action], performance)
+        scale = np.where((target > 0) & (raw > 0), target / np.where(raw > 0, raw, 1.0), 1.0)
+        g *= scale[:, None].astype(np.float32)
+        grown += g
+        np.clip(grown, game_data.ATTRIBUTE_MIN, game_data.ATTRIBUTE_MAX, out=grown)
+        ca = ca_fixed + grown @ wc
+
+        # 消耗（休養の回復は 100 まで）
+        hc, mc = hp_cost[action], mp_cost[action]
+        hp -= np.where(hc < 0, -np.minimum(-hc, np.maximum(0, 100 - hp)), hc)
+        mp -= np.where(mc < 0, -np.minimum(-mc, np.maximum(0, 100 - mp)), mc)
+
+        # 日々の生活費と HP 消耗（apply_daily_upkeep）
+        funds = np.maximum(0, funds - cost)
+        per_day = np.maximum(
+            1.0,
+            game_data.BASE_HP_DRAIN - stamina() / 3.0 - adapt() / 4.0 + drain_adjust,
+        )
+        hp = np.maximum(0, hp - per_day.astype(np.int64))
+        bankrupt_day[(funds == 0) & (bankrupt_day < 0)] = day
+
+        # 日付と誕生日・年度末の進級
+        date += datetime.timedelta(days=1)
+        if monthly_income and date.day == 1:
+            funds += monthly_income
+        ages += birthday == date.month * 100 + date.day
+        if school and (date.month, date.day) == (3, 31):
+            promoted = grade > 0
+            grade[promoted] = np.where(grade[promoted] + 1 >= 4, 0, grade[promoted] + 1)
+
+    return {
+        "age": snap_age[:s].ravel(),
+        "ca": snap_ca[:s].ravel(),
+        "pa": snap_pa[:s].ravel(),
+        "living": living,
+        "bankrupt_day": bankrupt_day,
+        "final_funds": funds,
+        "final_ca": ca,
+        "final_pa": pa,
+        "final_age": ages,
+        "final_grade": grade,
+    }
+
+
+def _merge(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def summarize(data: Dict[str, np.ndarray], days: int) -> Dict:
+    by_age = {}
+    for a in np.unique(data["age"]):
+        mask = data["age"] == a
+        ca = data["ca"][mask]
+        ratio = ca / data["pa"][mask]
+        by_age[int(a)] = {
+            "samples": int(mask.sum()),
+            **{f"ca_p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, np.percentile(ca, PERCENTILES))},
+            "ca_over_pa_p50": round(float(np.median(ratio)), 3),
+        }
+    bankruptcy = {}
+    for i, name in enumerate(LIVING_STANDARDS):
+        mask = data["living"] == i
+        days_to_zero = data["bankrupt_day"][mask]
+        broke = days_to_zero >= 0
+        bankruptcy[name] = {
+            "players": int(mask.sum()),
+            "bankrupt_rate": round(float(broke.mean()), 4) if mask.any() else 0.0,
+            "median_day": int(np.median(days_to_zero[broke])) if broke.any() else None,
+            "final_funds_p50": int(np.median(data["final_funds"][mask])) if mask.any() else 0,
+        }
+    final_ca = data["final_ca"]
+    return {
+        "players": int(len(final_ca)),
+        "days": days,
+        "ca_by_age": by_age,
+        "bankruptcy_by_living_standard": bankruptcy,
+        "final": {
+            **{f"ca_p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, np.percentile(final_ca, PERCENTILES))},
+            "reached_pa_rate": round(float((final_ca >= data["final_pa"]).mean()), 4),
+            "graduated_rate": round(float((data["final_grade"] == 0).mean()), 4),
+        },
+    }
+
+
+def simulate(
+    players: int = 10_000,
+    seasons: int = 5,
+    seed: Optional[int] = 0,
+    workers: int = 1,
+    start: datetime.date = datetime.date(2025, 4, 1),
+    category: str = "HighSchool",
+    age: int = 15,
+    initial_funds: int = DEFAULT_FUNDS,
+    monthly_income: int = 0,
+    match_weekday: int = 6,
+    sample_every: int = SAMPLE_EVERY_DAYS,
+) -> Dict:
+    """Simulate ``players`` careers for ``seasons`` years and summarise them."""
+    days = (start.replace(year=start.year + seasons) - start).days
+    sizes = [min(CHUNK_PLAYERS, players - i) for i in range(0, players, CHUNK_PLAYERS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [
+        (size, days, ss, start, category, age, initial_funds, monthly_income, match_weekday, sample_every)
+        for size, ss in zip(sizes, seeds)
+    ]
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_chunk, *zip(*args)))
+    else:
+        parts = [_simulate_chunk(*a) for a in args]
+    return summarize(_merge(parts), days)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vectorised Monte Carlo careers.")
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--seasons", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--category", default="HighSchool")
+    parser.add_argument("--age", type=int, default=15)
+    parser.add_argument("--funds", type=int, default=DEFAULT_FUNDS)
+    parser.add_argument(
+        "--monthly-income", type=int, default=0,
+        help="what-if: allowance added on the 1st of each month (the game itself has no income)",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    summary = simulate(
+        args.players, args.seasons, args.seed, args.workers,
+        category=args.category, age=args.age,
+        initial_funds=args.funds, monthly_income=args.monthly_income,
+    )
+    summary["elapsed_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+"""Bounded prompt assembly with local token estimates.
+
+Prompts used to embed raw ``json.dumps`` of the weekly plan, whole event
+descriptions and an ever growing player state, so input size (and latency)
+rose as a career went on.  :class:`PromptBuilder` puts the static
+instruction block first — byte-identical across calls, so provider-side
+prefix caching can reuse it — followed by compact context sections.  Each
+prompt kind has an input budget; when the estimate exceeds it, the lowest
+priority sections are truncated first.  The result is a :class:`Prompt`,
+a ``str`` that also carries its token estimate and the tokens saved
+against the uncompressed context, which ``call_gemini`` reports to
+telemetry.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 種別ごとの入力トークン上限（見積もり）
+INPUT_BUDGETS: Dict[str, int] = {
+    "timetable": 1400,
+    "next_event": 1600,
+    "event_batch": 2000,
+    "resolve_action": 2200,
+    "story": 1200,
+}
+DEFAULT_BUDGET = 2000
+
+WEEKDAY_SLOTS = (("morning", "朝"), ("afternoon", "午後"), ("evening", "夜"))
+SLOT_CHARS = 12
+PREVIOUS_EVENT_CHARS = 600
+TOP_NPCS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Close local estimate of Gemini input tokens.
+
+    Japanese text runs at roughly one token per character, ASCII at about
+    four characters per token; counting the two separately keeps the error
+    within a few percent for these prompts without a network round trip.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+@functools.lru_cache(maxsize=64)
+def _static_tokens(text: str) -> int:
+    # 固定の指示文は毎回同じなので見積もりも使い回す
+    return estimate_tokens(text)
+
+
+def dedent(text: str) -> str:
+    """Strip the f-string indentation the prompts are written with."""
+    lines = [line.strip() for line in (text or "").strip().splitlines()]
+    return "\n".join(lines)
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Keep the head and a short tail of ``text`` within ``max_chars``."""
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 20:
+        return text[:max_chars]
+    tail = max_chars // 5
+    return text[: max_chars - tail - 1] + "…" + text[-tail:]
+
+
+# --- Compact encoders ------------------------------------------------------
+def compact_weekly_plan(plan: Optional[Iterable[Dict]], slot_chars: int = SLOT_CHARS) -> str:
+    """One short line per weekday instead of the raw JSON list."""
+    lines = []
+    for entry in plan or []:
+        if not isinstance(entry, dict):
+            continue
+        slots = []
+        for key, label in WEEKDAY_SLOTS:
+            val = str(entry.get(key, "") or "").strip()
+            if val:
+                slots.append(f"{label}{truncate(val, slot_chars)}")
+        lines.append(f"{entry.get('weekday', '?')}: " + " / ".join(slots or ["-"]))
+    return "\n".join(lines) or "未設定"
+
+
+def top_npcs(npcs: Iterable, k: int = TOP_NPCS) -> str:
+    """The ``k`` relationships furthest from neutral, as ``role:name(relation)``."""
+    ranked = sorted(npcs or [], key=lambda n: abs(float(getattr(n, "relation", 0) or 0)), reverse=True)[:k]
+    return ", ".join(f"{n.role}:{n.name}({n.relation})" for n in ranked) or "重要な人間関係はまだ少ない"
+
+
+def next_match_line(match: Optional[Dict]) -> str:
+    if not match:
+        return "次戦予定なし"
+    venue = "H" if match.get("home") else "A"
+    return f"次戦: {match.get('date')} vs {match.get('opponent', '未定')} ({venue})"
+
+
+def player_line(player) -> str:
+    """The player state every event prompt needs, on two lines."""
+    return (
+        f"{player.name} / {player.team_name}({player.team_category}) / {player.position} / "
+        f"{player.age}歳 / {player.current_date}\n"
+        f"CA {player.ca:.1f} PA {player.pa:.1f} HP {player.hp} MP {player.mp}"
+    )
+
+
+# --- Builder ---------------------------------------------------------------
+class Prompt(str):
+    """Prompt text plus its accounting; usable anywhere a ``str`` is."""
+
+    kind: str = ""
+    prefix: str = ""
+    estimated_tokens: int = 0
+    raw_tokens: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.estimated_tokens)
+
+
+class PromptBuilder:
+    def __init__(self, kind: str, budget: Optional[int] = None):
+        self.kind = kind
+        self.budget = budget or INPUT_BUDGETS.get(kind, DEFAULT_BUDGET)
+        self._instructions = ""
+        # (label, text, raw, priority, floor)。priority が大きいものから削る
+        self._sections: List[Tuple[str, str, str, int, int]] = []
+
+    def instructions(self, text: str) -> "PromptBuilder":
+        """Static prefix: role, task, rules and output format (no per-player data)."""
+        self._instructions = dedent(text)
+        return self
+
+    def section(
+        self,
+        label: str,
+        text: str,
+        raw: Optional[str] = None,
+        priority: int = 0,
+        floor: int = 80,
+    ) -> "PromptBuilder":
+        """Add a context block; ``raw`` is what the uncompressed prompt would have sent."""
+        text = (text or "").strip()
+        self._sections.append((label, text, raw if raw is not None else text, priority, floor))
+        return self
+
+    def build(self) -> Prompt:
+        prefix = self._instructions
+        fixed = _static_tokens(prefix)
+        texts = [s[1] for s in self._sections]
+
+        def total() -> int:
+            return fixed + sum(estimate_tokens(f"[{s[0]}]\n{t}\n") for s, t in zip(self._sections, texts))
+
+        # 予算超過なら優先度の低い（数字の大きい）セクションから下限まで削る
+        order = sorted(range(len(texts)), key=lambda i: -self._sections[i][3])
+        for i in order:
+            over = total() - self.budget
+            if over <= 0:
+                break
+            floor = self._sections[i][4]
+            keep = max(floor, len(texts[i]) - over)
+            texts[i] = truncate(texts[i], keep)
+        if total() > self.budget:
+            logger.info("%s prompt is %d tokens over its budget", self.kind, total() - self.budget)
+
+        body = "\n".join(f"[{label}]\n{t}" for (label, *_), t in zip(self._sections, texts) if t)
+        prompt = Prompt(f"{prefix}\n\n{body}" if body else prefix)
+        prompt.kind = self.kind
+        prompt.prefix = prefix
+        prompt.estimated_tokens = total()
+        prompt.raw_tokens = fixed + sum(estimate_tokens(f"[{s[0]}]\n{s[2]}\n") for s in self._sections)
+        return prompt
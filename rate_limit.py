@@ -0,0 +1,288 @@
+"""Per-key, per-model token buckets with a priority and fair-share queue.
+
+One Streamlit server serves many players, all of whom may share one API
+key.  Every attempt that reaches the provider first takes a token from the
+bucket for ``(key scope, model)``.  When the bucket is empty, callers wait
+in a queue ordered by priority class (an interactive ``resolve_action``
+before onboarding generations, speculative work last) and, within a class,
+round-robin across sessions so one busy session cannot starve the others.
+A 429 from the provider drains the bucket so the queue backs off instead
+of retrying into the limit.
+
+The session and priority of the current call travel in context variables;
+``background.submit`` copies them into worker threads.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 優先度クラス（小さいほど先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_FOREGROUND = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_SPECULATIVE = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_FOREGROUND: "foreground",
+    PRIORITY_BACKGROUND: "background",
+    PRIORITY_SPECULATIVE: "speculative",
+}
+
+KIND_PRIORITY: Dict[str, int] = {
+    "initial_data": PRIORITY_INTERACTIVE,
+    "next_event": PRIORITY_INTERACTIVE,
+    "resolve_action": PRIORITY_INTERACTIVE,
+    "story": PRIORITY_FOREGROUND,
+    "event_batch": PRIORITY_FOREGROUND,
+    "team_data": PRIORITY_FOREGROUND,
+    "schedule": PRIORITY_FOREGROUND,
+    "weekly_plan": PRIORITY_FOREGROUND,
+    "timetable": PRIORITY_BACKGROUND,
+    "memory": PRIORITY_BACKGROUND,
+}
+
+# モデルごとの1分あたりリクエスト上限（1つのAPIキーあたり）
+MODEL_RPM: Dict[str, float] = {
+    "gemini-2.0-flash": 60.0,
+    "gemini-1.5-pro": 30.0,
+    "gemini-3-pro-preview": 20.0,
+}
+DEFAULT_RPM = 30.0
+# バケット容量 = RPM × この割合（短いバーストだけ許す）
+BURST_FRACTION = 0.1
+
+session_var: contextvars.ContextVar[str] = contextvars.ContextVar("llm_session", default="")
+priority_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("llm_priority", default=None)
+
+
+class RateLimited(RuntimeError):
+    """Raised when no token became available before the caller's deadline."""
+
+
+def bind_session(session_id: str) -> None:
+    session_var.set(session_id or "")
+
+
+def with_priority(level: int, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``fn`` so every call it makes is scheduled at ``level``."""
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = priority_var.set(level)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            priority_var.reset(token)
+    return wrapper
+
+
+def priority_for(kind: str, background: bool = False) -> int:
+    """Explicit priority if one is bound, else the kind's default.
+
+    Calls made off the script thread (prefetches, onboarding pipeline) are
+    never scheduled above ``PRIORITY_BACKGROUND``.
+    """
+    level = priority_var.get()
+    if level is None:
+        level = KIND_PRIORITY.get(kind, PRIORITY_FOREGROUND)
+    if background:
+        level = max(level, PRIORITY_BACKGROUND)
+    return level
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+    def drain(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Lane:
+    """Waiters for one bucket: priority classes of per-session FIFOs."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queues: Dict[int, "OrderedDict[str, Deque[object]]"] = {}
+        self.granted = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.wait_s = 0.0
+        self.max_depth = 0
+
+    def push(self, priority: int, session: str, ticket: object) -> None:
+        sessions = self.queues.setdefault(priority, OrderedDict())
+        sessions.setdefault(session, deque()).append(ticket)
+        self.max_depth = max(self.max_depth, self.depth())
+
+    def head(self) -> Optional[object]:
+        for priority in sorted(self.queues):
+            sessions = self.queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def pop_head(self) -> None:
+        for priority in sorted(self.queues):
+            sessions = self.queues[priority]
+            if not sessions:
+                continue
+            session, fifo = sessions.popitem(last=False)
+            fifo.popleft()
+            if fifo:
+                # 同じクラスの他セッションに順番を回す
+                sessions[session] = fifo
+            return
+
+    def remove(self, priority: int, session: str, ticket: object) -> None:
+        sessions = self.queues.get(priority, {})
+        fifo = sessions.get(session)
+        if fifo is None:
+            return
+        try:
+            fifo.remove(ticket)
+        except ValueError:
+            return
+        if not fifo:
+            del sessions[session]
+
+    def depth(self, priority: Optional[int] = None) -> int:
+        classes = [priority] if priority is not None else list(self.queues)
+        return sum(len(f) for p in classes for f in self.queues.get(p, {}).values())
+
+
+class RateLimiter:
+    def __init__(self, limits: Optional[Dict[str, float]] = None, burst_fraction: float = BURST_FRACTION):
+        self.limits = dict(MODEL_RPM if limits is None else limits)
+        self.burst_fraction = burst_fraction
+        self._cond = threading.Condition()
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+
+    def _lane(self, scope: str, model: str) -> _Lane:
+        key = (scope, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            rpm = self.limits.get(model.split("/")[-1], DEFAULT_RPM)
+            lane = _Lane(TokenBucket(rpm / 60.0, max(1.0, round(rpm * self.burst_fraction))))
+            self._lanes[key] = lane
+        return lane
+
+    def acquire(
+        self,
+        scope: str,
+        model: str,
+        priority: int = PRIORITY_FOREGROUND,
+        session: str = "",
+        timeout: Optional[float] = None,
+    ) -> float:
+        """Block until this caller may send one request; returns seconds waited."""
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        ticket = object()
+        with self._cond:
+            lane = self._lane(scope, model)
+            lane.push(priority, session, ticket)
+            while True:
+                now = time.monotonic()
+                is_head = lane.head() is ticket
+                if is_head and lane.bucket.try_take(now):
+                    lane.pop_head()
+                    waited = now - started
+                    lane.granted += 1
+                    lane.wait_s += waited
+                    self._cond.notify_all()
+                    return waited
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    lane.remove(priority, session, ticket)
+                    lane.timed_out += 1
+                    self._cond.notify_all()
+                    raise RateLimited(f"no {model} request slot within {timeout:.1f}s")
+                # 先頭だけが次のトークンまで眠り、他は先頭の交代を待つ
+                waits = [w for w in (lane.bucket.wait_time(now) if is_head else None, remaining) if w is not None]
+                self._cond.wait(min(waits) if waits else None)
+
+    def penalize(self, scope: str, model: str) -> None:
+        """The provider answered 429: empty the bucket so queued calls back off."""
+        with self._cond:
+            lane = self._lane(scope, model)
+            lane.bucket.drain()
+            lane.throttled += 1
+
+    def stats(self) -> List[Dict]:
+        with self._cond:
+            rows = []
+            for (scope, model), lane in sorted(self._lanes.items()):
+                row = {
+                    "scope": scope,
+                    "model": model,
+                    "granted": lane.granted,
+                    "timed_out": lane.timed_out,
+                    "throttled": lane.throttled,
+                    "avg_wait_ms": round(lane.wait_s * 1000 / lane.granted, 1) if lane.granted else 0.0,
+                    "max_depth": lane.max_depth,
+                }
+                for level, name in PRIORITY_NAMES.items():
+                    row[f"depth_{name}"] = lane.depth(level)
+                rows.append(row)
+            return rows
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [
+            "# HELP llm_ratelimit_queue_depth Calls waiting for a request slot.",
+            "# TYPE llm_ratelimit_queue_depth gauge",
+        ]
+        rows = self.stats()
+        for row in rows:
+            for name in PRIORITY_NAMES.values():
+                lines.append(
+                    f'llm_ratelimit_queue_depth{{scope="{row["scope"]}",model="{row["model"]}",priority="{name}"}} '
+                    f'{row["depth_" + name]}'
+                )
+        for metric, key, help_text in (
+            ("llm_ratelimit_granted_total", "granted", "Request slots granted."),
+            ("llm_ratelimit_timeouts_total", "timed_out", "Callers that gave up waiting."),
+            ("llm_ratelimit_throttled_total", "throttled", "429 responses that drained the bucket."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for row in rows:
+                lines.append(f'{metric}{{scope="{row["scope"]}",model="{row["model"]}"}} {row[key]}')
+        return lines
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Return the process-wide limiter shared by every Streamlit session."""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
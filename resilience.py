@@ -0,0 +1,284 @@
+"""Deadlines, retries, hedged requests and a circuit breaker for LLM calls.
+
+Every Gemini call goes through :meth:`ResilientCaller.call`, which
+
+* gives each prompt kind its own total deadline and passes the remaining
+  budget down as the per-attempt transport timeout,
+* retries transient failures (rate limits, 5xx, timeouts) with full-jitter
+  exponential backoff,
+* fires a hedged second attempt on a faster model when the first one is
+  slower than the observed latency percentile for that kind on that model,
+  and
+* opens a per ``(key, model)`` circuit after repeated transient failures so
+  callers drop straight to their local fallbacks while the API is degraded.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+import rate_limit
+
+try:
+    from google.api_core import exceptions as gexc
+except ImportError:  # SDK 未導入環境ではクラス名で判定する
+    gexc = None
+
+logger = logging.getLogger(__name__)
+
+# プロンプト種別ごとの1呼び出しあたりの総デッドライン（秒）
+DEADLINES: Dict[str, float] = {
+    "initial_data": 60.0,
+    "team_data": 60.0,
+    "weekly_plan": 30.0,
+    "schedule": 45.0,
+    "timetable": 30.0,
+    "story": 45.0,
+    "next_event": 40.0,
+    "event_batch": 90.0,
+    "resolve_action": 40.0,
+    "memory": 30.0,
+}
+DEFAULT_DEADLINE = 45.0
+
+HEDGE_MODEL = "models/gemini-2.0-flash"
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 10
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+_RETRYABLE_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "Aborted",
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the circuit is open."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if gexc is not None and isinstance(exc, gexc.RetryError):
+        return True
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+
+def is_throttled(exc: BaseException) -> bool:
+    """The provider rejected the call for exceeding its rate limit (HTTP 429)."""
+    return any(cls.__name__ in ("ResourceExhausted", "TooManyRequests") for cls in type(exc).__mro__)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for ``attempt`` (0-based)."""
+    return random.uniform(0.0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per ``(kind, model)``."""
+
+    def __init__(self, window: int = 200):
+        # モデルを混ぜると、flash の速い標本で pro のヘッジ閾値が下がってしまう
+        self._samples: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[(kind, model)].append(seconds)
+
+    def percentile(self, kind: str, model: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get((kind, model), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        idx = min(len(samples) - 1, int(q * len(samples)))
+        return samples[idx]
+
+
+class CircuitBreaker:
+    """Closed → open after ``threshold`` transient failures → half-open after cooldown."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                # 半開状態では試行を1本だけ通す
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open trial that never reached the API (no success, no failure)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+Attempt = Callable[[str, float], str]
+# (応答テキスト, 実際に答えたモデル)
+Answer = Tuple[str, str]
+
+
+class ResilientCaller:
+    def __init__(self):
+        self.latency = LatencyTracker()
+        # ヘッジ用の試行は専用プールで走らせる（background のワーカーから呼ばれても詰まらない）
+        self._attempts = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, scope: str, model: str) -> CircuitBreaker:
+        with self._lock:
+            key = (scope, model)
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker()
+            return self._breakers[key]
+
+    def call(
+        self,
+        kind: str,
+        attempt: Attempt,
+        model: str,
+        scope: str = "",
+        hedge: bool = True,
+        on_retry: Optional[Callable[[int, BaseException], None]] = None,
+    ) -> Answer:
+        """Run ``attempt(model, timeout)`` under the policy for ``kind``.
+
+        Returns ``(text, answered_by)``: when the hedge wins, ``answered_by``
+        is :data:`HEDGE_MODEL`, so callers can cache and time the response
+        against the model that produced it.  ``scope`` separates breakers per
+        API key so one user's bad key cannot trip the circuit for everyone
+        sharing the server process.
+        """
+        breaker = self.breaker(scope, model)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {model}")
+
+        deadline = time.monotonic() + DEADLINES.get(kind, DEFAULT_DEADLINE)
+        last_exc: Optional[BaseException] = None
+        for n in range(MAX_ATTEMPTS):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                if hedge and model != HEDGE_MODEL:
+                    answer = self._hedged(kind, attempt, model, remaining)
+                else:
+                    answer = self._timed(kind, attempt, model, remaining)
+                breaker.record_success()
+                return answer
+            except rate_limit.RateLimited:
+                # ローカルの枠待ちで時間切れになっただけで、API には届いていない
+                breaker.release()
+                raise
+            except Exception as exc:
+                last_exc = exc
+                if not is_retryable(exc):
+                    breaker.record_success()  # 入力起因のエラーは障害とみなさない
+                    raise
+                breaker.record_failure()
+                if n + 1 >= MAX_ATTEMPTS or not breaker.allow():
+                    break
+                if on_retry:
+                    on_retry(n + 1, exc)
+                delay = min(backoff_delay(n), max(0.0, deadline - time.monotonic()))
+                logger.info("retrying %s after %.2fs: %s", kind, delay, exc)
+                time.sleep(delay)
+        if last_exc is None:
+            last_exc = TimeoutError(f"{kind} exceeded its deadline")
+        raise last_exc
+
+    # --- Internals -----------------------------------------------------
+    def _timed(self, kind: str, attempt: Attempt, model: str, timeout: float) -> Answer:
+        started = time.monotonic()
+        text = attempt(model, timeout)
+        self.latency.record(kind, model, time.monotonic() - started)
+        return text, model
+
+    def _hedged(self, kind: str, attempt: Attempt, model: str, timeout: float) -> Answer:
+        hedge_after = self.latency.percentile(kind, model, HEDGE_PERCENTILE)
+        if hedge_after is None or hedge_after >= timeout:
+            return self._timed(kind, attempt, model, timeout)
+
+        executor = self._attempts
+        started = time.monotonic()
+        primary = executor.submit(self._timed, kind, attempt, model, timeout)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        logger.info("hedging %s on %s after %.2fs", kind, HEDGE_MODEL, hedge_after)
+        remaining = max(0.1, timeout - (time.monotonic() - started))
+        secondary = executor.submit(self._timed, kind, attempt, HEDGE_MODEL, remaining)
+        pending = {primary, secondary}
+        first_exc: Optional[BaseException] = None
+        end = started + timeout
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                if fut.exception() is None:
+                    return fut.result()
+                first_exc = first_exc or fut.exception()
+        raise first_exc or TimeoutError(f"{kind} hedged attempts timed out")
+
+
+_default_caller: Optional[ResilientCaller] = None
+_default_lock = threading.Lock()
+
+
+def get_caller() -> ResilientCaller:
+    global _default_caller
+    with _default_lock:
+        if _default_caller is None:
+            _default_caller = ResilientCaller()
+        return _default_caller
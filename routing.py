@@ -0,0 +1,134 @@
+"""Per-kind model routing with latency SLOs.
+
+The sidebar model used to apply to every call, so choosing a pro model
+made weekly plans and timetables as slow as the key story scenes.  Each
+prompt kind now maps to a tier: ``fast`` always uses the flash model, and
+``user`` uses the model picked in the sidebar.  A ``user``-tier kind whose
+observed p95 on the chosen model exceeds its SLO falls back to the fast
+tier, with an occasional probe call so it can return once the model
+recovers: a probe that comes in under the SLO drops the stale window, so
+the kind goes back to the user's model on the next call.  Calls marked critical (story scenes such as the contract
+negotiation) always honour the user's choice.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+FAST_MODEL = "models/gemini-2.0-flash"
+
+TIER_FAST = "fast"
+TIER_USER = "user"
+
+KIND_TIERS: Dict[str, str] = {
+    "initial_data": TIER_USER,
+    "team_data": TIER_USER,
+    "story": TIER_USER,
+    "resolve_action": TIER_USER,
+    "schedule": TIER_FAST,
+    "weekly_plan": TIER_FAST,
+    "timetable": TIER_FAST,
+    "next_event": TIER_FAST,
+    "event_batch": TIER_FAST,
+    "memory": TIER_FAST,
+}
+
+# 種別ごとのレイテンシ目標（p95, 秒）
+SLO_SECONDS: Dict[str, float] = {
+    "initial_data": 20.0,
+    "team_data": 25.0,
+    "story": 15.0,
+    "resolve_action": 8.0,
+    "schedule": 15.0,
+    "weekly_plan": 10.0,
+    "timetable": 10.0,
+    "next_event": 8.0,
+    "event_batch": 30.0,
+    "memory": 20.0,
+}
+DEFAULT_SLO = 15.0
+
+WINDOW = 50
+MIN_SAMPLES = 5
+# 降格中も N 回に1回は元のモデルへ送って、回復を観測できるようにする
+PROBE_EVERY = 10
+
+
+def _p95(samples: Deque[float]) -> Optional[float]:
+    if len(samples) < MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class Router:
+    def __init__(self, fast_model: str = FAST_MODEL):
+        self.fast_model = fast_model
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=WINDOW))
+        self._skipped: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.downgrades = 0
+
+    def route(self, kind: str, user_model: str, critical: bool = False, enabled: bool = True) -> str:
+        """Model to use for one call of ``kind``."""
+        if not enabled or critical:
+            return user_model
+        if KIND_TIERS.get(kind, TIER_USER) == TIER_FAST:
+            return self.fast_model
+        if user_model == self.fast_model:
+            return user_model
+        key = (kind, user_model)
+        with self._lock:
+            p95 = _p95(self._latency[key])
+            if p95 is None or p95 <= SLO_SECONDS.get(kind, DEFAULT_SLO):
+                self._skipped[key] = 0
+                return user_model
+            self._skipped[key] += 1
+            if self._skipped[key] % PROBE_EVERY == 0:
+                return user_model
+            self.downgrades += 1
+            return self.fast_model
+
+    def observe(self, kind: str, model: str, seconds: float) -> None:
+        """Record the wall time of a call that actually reached ``model``."""
+        key = (kind, model)
+        slo = SLO_SECONDS.get(kind, DEFAULT_SLO)
+        with self._lock:
+            samples = self._latency[key]
+            p95 = _p95(samples)
+            if p95 is not None and p95 > slo and seconds <= slo:
+                # 降格中のプローブが目標内に収まった: 古い遅い標本を捨てて測り直す
+                # （窓を入れ替わるまで待つと PROBE_EVERY × WINDOW 回ほどかかる）
+                samples.clear()
+                self._skipped[key] = 0
+            samples.append(seconds)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            rows = []
+            for (kind, model), samples in sorted(self._latency.items()):
+                p95 = _p95(samples)
+                slo = SLO_SECONDS.get(kind, DEFAULT_SLO)
+                rows.append({
+                    "kind": kind,
+                    "model": model,
+                    "samples": len(samples),
+                    "p95_s": round(p95, 2) if p95 is not None else None,
+                    "slo_s": slo,
+                    "over_slo": bool(p95 is not None and p95 > slo),
+                })
+            return rows
+
+
+_default_router: Optional[Router] = None
+_default_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    global _default_router
+    with _default_lock:
+        if _default_router is None:
+            _default_router = Router()
+        return _default_router
@@ -0,0 +1,170 @@
+"""Date index over a player's fixture list.
+
+``Player.schedule`` stays a plain list of dicts (that is what the save, the
+data editor and the model exchange), and :class:`ScheduleIndex` sits beside
+it: every row's date is parsed once into an ordinal, rows are kept in a
+sorted array for ``bisect`` queries (next fixture on/after a date, fixtures
+in a range) and in an ordinal → fixture map for "is there a match today".
+Per-month and per-weekday counts are computed on first use and cached.
+
+``Player.schedule_index`` rebuilds the index when the schedule list is
+replaced or changes length; edits that rewrite rows in place (the data
+editor) call ``Player.invalidate_schedule()``.  Run
+``python schedule_index.py`` to compare per-rerun lookup cost against the
+old linear scans as the schedule grows to many seasons.
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+WEEKDAY_CODES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+class ScheduleIndex:
+    __slots__ = ("source", "size", "ordinals", "fixtures", "by_ordinal", "_months", "_weekdays")
+
+    def __init__(self, schedule: Sequence[Dict]):
+        self.source = schedule
+        self.size = len(schedule)
+        parsed = []
+        for pos, row in enumerate(schedule):
+            day = parse_date(row.get("date"))
+            if day is not None:
+                parsed.append((day.toordinal(), pos, row))
+        # 同じ日に複数行あるときは元の並びで先の行を優先する
+        parsed.sort(key=lambda t: (t[0], t[1]))
+        self.ordinals: List[int] = [o for o, _, _ in parsed]
+        self.fixtures: List[Dict] = [row for _, _, row in parsed]
+        self.by_ordinal: Dict[int, Dict] = {}
+        for o, _, row in parsed:
+            self.by_ordinal.setdefault(o, row)
+        self._months: Optional[Counter] = None
+        self._weekdays: Optional[Counter] = None
+
+    def covers(self, schedule: Sequence[Dict]) -> bool:
+        return schedule is self.source and len(schedule) == self.size
+
+    def __len__(self) -> int:
+        return len(self.fixtures)
+
+    def items(self) -> Iterator[Tuple[datetime.date, Dict]]:
+        """``(date, fixture)`` in date order."""
+        for o, row in zip(self.ordinals, self.fixtures):
+            yield datetime.date.fromordinal(o), row
+
+    # --- Point lookups -------------------------------------------------
+    def on(self, day: datetime.date) -> Optional[Dict]:
+        return self.by_ordinal.get(day.toordinal())
+
+    def first(self) -> Optional[Dict]:
+        return self.fixtures[0] if self.fixtures else None
+
+    def _next_pos(self, day: datetime.date, inclusive: bool) -> int:
+        find = bisect.bisect_left if inclusive else bisect.bisect_right
+        return find(self.ordinals, day.toordinal())
+
+    def next_fixture(self, day: datetime.date, inclusive: bool = True) -> Optional[Dict]:
+        """First fixture on (or, with ``inclusive=False``, strictly after) ``day``."""
+        i = self._next_pos(day, inclusive)
+        return self.fixtures[i] if i < len(self.fixtures) else None
+
+    def next_date(self, day: datetime.date, inclusive: bool = True) -> Optional[datetime.date]:
+        i = self._next_pos(day, inclusive)
+        return datetime.date.fromordinal(self.ordinals[i]) if i < len(self.ordinals) else None
+
+    def between(self, start: datetime.date, end: datetime.date) -> List[Dict]:
+        """Fixtures with ``start <= date <= end`` in date order."""
+        lo = bisect.bisect_left(self.ordinals, start.toordinal())
+        hi = bisect.bisect_right(self.ordinals, end.toordinal())
+        return self.fixtures[lo:hi]
+
+    # --- Aggregates ----------------------------------------------------
+    def month_counts(self, year: int) -> Dict[int, int]:
+        if self._months is None:
+            self._months = Counter(
+                (d.year, d.month) for d in map(datetime.date.fromordinal, self.ordinals)
+            )
+        return {m: self._months.get((year, m), 0) for m in range(1, 13)}
+
+    def weekday_counts(self) -> Counter:
+        if self._weekdays is None:
+            self._weekdays = Counter(WEEKDAY_CODES[(o - 1) % 7] for o in self.ordinals)
+        return self._weekdays
+
+
+# --- Benchmark -------------------------------------------------------------
+def _linear_rerun(schedule: Sequence[Dict], today: datetime.date) -> None:
+    """What one main-screen rerun used to do with the plain list."""
+    iso = today.isoformat()
+    for m in sorted(schedule, key=lambda x: x.get("date", "9999")):
+        if m.get("date", "9999") >= iso:
+            break
+    next((m for m in schedule if m.get("date") == iso), None)
+    [m.get("date", "") for m in schedule if m.get("date", "") > iso]
+    for i in range(7):
+        d = str(today + datetime.timedelta(days=i))
+        next((m for m in schedule if m.get("date") == d), None)
+
+
+def _indexed_rerun(index: ScheduleIndex, today: datetime.date) -> None:
+    index.next_fixture(today)
+    index.on(today)
+    index.next_date(today, inclusive=False)
+    for i in range(7):
+        index.on(today + datetime.timedelta(days=i))
+
+
+def benchmark(seasons=(1, 5, 20, 50), reruns: int = 200) -> List[Dict]:
+    """Per-rerun lookup cost (µs) for the linear scans vs the index."""
+    import fixtures
+
+    rows = []
+    for n in seasons:
+        schedule: List[Dict] = []
+        for year in range(2025, 2025 + n):
+            comps = fixtures.default_competitions("Professional", year)
+            schedule.extend(fixtures.generate("架空FC", comps, year))
+        today = datetime.date(2025 + n // 2, 6, 1)
+
+        t0 = time.perf_counter()
+        for _ in range(reruns):
+            _linear_rerun(schedule, today)
+        linear = (time.perf_counter() - t0) / reruns * 1e6
+
+        t0 = time.perf_counter()
+        index = ScheduleIndex(schedule)
+        build = (time.perf_counter() - t0) * 1e6
+        t0 = time.perf_counter()
+        for _ in range(reruns):
+            index.covers(schedule)
+            _indexed_rerun(index, today)
+        indexed = (time.perf_counter() - t0) / reruns * 1e6
+        rows.append({
+            "seasons": n,
+            "fixtures": len(schedule),
+            "linear_us": round(linear, 1),
+            "indexed_us": round(indexed, 1),
+            "build_us": round(build, 1),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
@@ -0,0 +1,350 @@
+"""Response schemas and a single-pass validator/coercer for every prompt kind.
+
+Each prompt kind has an OpenAPI-style schema that is sent to Gemini as
+``response_schema`` where the model supports it, and that :func:`validate`
+walks once to coerce the parsed JSON into the expected shape: numbers that
+arrive as ``"0.05"`` / ``"500万"`` / ``"178cm"`` become floats/ints, unknown
+ability keys are dropped and costs are clamped.  Missing required fields are
+reported as errors so ``call_gemini`` can issue one targeted repair request
+instead of silently degrading to ``{}``.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import game_data
+
+Schema = Dict[str, Any]
+
+_STR: Schema = {"type": "string"}
+_NUM: Schema = {"type": "number"}
+_INT: Schema = {"type": "integer"}
+_BOOL: Schema = {"type": "boolean"}
+
+
+def _obj(properties: Dict[str, Schema], required: Tuple[str, ...] = ()) -> Schema:
+    schema: Schema = {"type": "object", "properties": properties}
+    if required:
+        schema["required"] = list(required)
+    return schema
+
+
+def _arr(items: Schema) -> Schema:
+    return {"type": "array", "items": items}
+
+
+_ATTRIBUTES = _obj({k: _NUM for k in game_data.WEIGHTS})
+_NPC = _obj({"role": _STR, "name": _STR, "relation": _NUM, "description": _STR}, ("name",))
+_CHOICE = _obj({"text": _STR, "hint": _STR}, ("text",))
+_EVENT_PROPS = {
+    "title": _STR,
+    "description": _STR,
+    "choices": _arr(_CHOICE),
+}
+_PERIOD_KEYS = [f"p{i}" for i in range(1, 7)]
+_TIMETABLE_ROW = _obj(
+    {
+        "weekday": _STR,
+        **{p: _STR for p in _PERIOD_KEYS},
+        **{f"{p}_required": _STR for p in _PERIOD_KEYS[:5]},
+        **{f"{p}_delivery": _STR for p in _PERIOD_KEYS[:5]},
+    },
+    ("weekday",),
+)
+
+SCHEMAS: Dict[str, Schema] = {
+    "initial_data": _obj({
+        "need_questions": _BOOL,
+        "questions": _arr(_STR),
+        "attributes": _ATTRIBUTES,
+        "funds": _INT,
+        "salary": _INT,
+        "npcs": _arr(_NPC),
+    }),
+    "team_data": _obj({
+        "formation": _STR,
+        "real_players": _arr(_obj({
+            "name": _STR,
+            "position": _STR,
+            "value": _INT,
+            "number": _INT,
+            "age": _INT,
+            "foot": _STR,
+            "height": _INT,
+            "height_cm": _INT,
+        }, ("name",))),
+    }, ("real_players",)),
+    "weekly_plan": _obj({
+        "plan": _arr(_obj(
+            {"weekday": _STR, "morning": _STR, "afternoon": _STR, "evening": _STR},
+            ("weekday",),
+        )),
+    }, ("plan",)),
+    "schedule": _obj({
+        "competitions": _arr(_obj({
+            "code": _STR,
+            "name": _STR,
+            "type": _STR,
+            "priority": _INT,
+            "season_start": _STR,
+            "season_end": _STR,
+            "match_days": _arr(_STR),
+            "team_count": _INT,
+            "rounds": _INT,
+            "include_for_player": _BOOL,
+            "opponents": _arr(_STR),
+        }, ("code",))),
+        "schedule": _arr(_obj({
+            "date": _STR,
+            "opponent": _STR,
+            "home": _BOOL,
+            "competition_code": _STR,
+            "round": _STR,
+        }, ("date", "opponent"))),
+    }, ("competitions",)),
+    "timetable": _obj({"timetable": _arr(_TIMETABLE_ROW)}, ("timetable",)),
+    "story": _obj({"story": _STR}, ("story",)),
+    "next_event": _obj(_EVENT_PROPS, ("title", "description", "choices")),
+    "event_batch": _obj({
+        "events": _arr(_obj({"date": _STR, **_EVENT_PROPS}, ("description", "choices"))),
+    }, ("events",)),
+    "memory": _obj({"summary": _STR}, ("summary",)),
+    "resolve_action": _obj({
+        "result_story": _STR,
+        "grow_stats": _ATTRIBUTES,
+        "hp_cost": _INT,
+        "mp_cost": _INT,
+        "relation_change": _obj({"role": _STR, "val": _INT}),
+        "base": _NUM,
+        "performance": _NUM,
+    }, ("result_story",)),
+}
+
+
+def response_schema_for(kind: str, model: str) -> Optional[Schema]:
+    """Schema to send as ``response_schema``; ``None`` for models without support."""
+    if "gemini-1.0" in model:
+        return None
+    return SCHEMAS.get(kind)
+
+
+# --- Scalar coercion -------------------------------------------------------
+def safe_float(val, default=0.0):
+    try:
+        return float(val)
+    except Exception:
+        return default
+
+
+def safe_int(val, default=0):
+    try:
+        if isinstance(val, (int, float)):
+            return int(val)
+        val_str = str(val).lower()
+        multiplier = 1
+        if 'm' in val_str:
+            multiplier = 1_000_000
+        elif 'k' in val_str:
+            multiplier = 1_000
+        elif '億' in val_str:
+            multiplier = 100_000_000
+        elif '万' in val_str:
+            multiplier = 10_000
+        clean_str = re.sub(r'[^\d.]', '', val_str)
+        if not clean_str:
+            return default
+        return int(float(clean_str) * multiplier)
+    except Exception:
+        return default
+
+
+def _to_number(val) -> Optional[float]:
+    if isinstance(val, bool):
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    m = re.search(r"-?\d+(?:\.\d+)?", str(val or ""))
+    return float(m.group()) if m else None
+
+
+def _to_int(val, key: str) -> Optional[int]:
+    if isinstance(val, bool):
+        return None
+    if isinstance(val, (int, float)):
+        return int(val)
+    # 金額は単位（万/億/m/k）を解釈し、それ以外（身長・背番号など）は数字部分だけ読む
+    if key in ("value", "funds", "salary"):
+        return safe_int(val, default=None)
+    num = _to_number(val)
+    return int(num) if num is not None else None
+
+
+def _to_bool(val) -> Optional[bool]:
+    if isinstance(val, bool):
+        return val
+    if isinstance(val, (int, float)):
+        return bool(val)
+    text = str(val).strip().lower()
+    if text in ("true", "yes", "1", "home", "h", "ホーム"):
+        return True
+    if text in ("false", "no", "0", "away", "a", "アウェー", "アウェイ"):
+        return False
+    return None
+
+
+# --- Parsing & validation ------------------------------------------------
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parse_json(text: str) -> Tuple[Any, Optional[str]]:
+    """Parse model output once; returns ``(value, error)``."""
+    if not text:
+        return None, "empty response"
+    body = text.strip()
+    if body.startswith("```"):
+        body = _FENCE_RE.sub("", body).strip()
+    try:
+        return json.loads(body), None
+    except json.JSONDecodeError as exc:
+        return None, f"invalid JSON: {exc.msg} (line {exc.lineno}, col {exc.colno})"
+
+
+def _coerce(value: Any, schema: Schema, path: str, errors: List[str], key: str = "") -> Any:
+    kind = schema.get("type")
+    if kind == "object":
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            value = value[0]
+        if not isinstance(value, dict):
+            errors.append(f"{path or '$'}: expected object")
+            return None
+        out = {}
+        for name, sub in schema.get("properties", {}).items():
+            if name not in value or value[name] is None:
+                continue
+            coerced = _coerce(value[name], sub, f"{path}.{name}", errors, name)
+            if coerced is not None:
+                out[name] = coerced
+        for name in schema.get("required", ()):
+            if name not in out:
+                errors.append(f"{path}.{name}: missing")
+        return out
+    if kind == "array":
+        if not isinstance(value, list):
+            errors.append(f"{path}: expected array")
+            return None
+        item_schema = schema.get("items", {})
+        out = []
+        for i, item in enumerate(value):
+            item_errors: List[str] = []
+            coerced = _coerce(item, item_schema, f"{path}[{i}]", item_errors, key)
+            # 配列要素の不備は要素ごと捨てる（全体のリトライまではしない）
+            if coerced is not None and not item_errors:
+                out.append(coerced)
+        return out
+    if kind == "number":
+        return _to_number(value)
+    if kind == "integer":
+        return _to_int(value, key)
+    if kind == "boolean":
+        return _to_bool(value)
+    if kind == "string":
+        return value if isinstance(value, str) else str(value)
+    return value
+
+
+def _clamp(d: Dict, key: str, lo: float, hi: float) -> None:
+    if key in d:
+        d[key] = type(d[key])(max(lo, min(hi, d[key])))
+
+
+def _post_team_data(data: Dict, errors: List[str]) -> None:
+    for p in data.get("real_players", []):
+        # プロンプトは height を返すが TeamGenerator は height_cm を読む
+        if "height" in p:
+            p.setdefault("height_cm", p.pop("height"))
+        if "height_cm" in p and not 140 <= p["height_cm"] <= 215:
+            del p["height_cm"]
+        _clamp(p, "value", 0, 10**10)
+
+
+def _post_resolve_action(data: Dict, errors: List[str]) -> None:
+    grow = data.get("grow_stats", {})
+    data["grow_stats"] = {k: max(0.0, min(1.0, v)) for k, v in grow.items()}
+    _clamp(data, "hp_cost", -50, 100)
+    _clamp(data, "mp_cost", -50, 100)
+    _clamp(data, "base", 0.0, 1.0)
+    _clamp(data, "performance", 0.3, 2.0)
+    rel = data.get("relation_change")
+    if rel is not None:
+        _clamp(rel, "val", -10, 10)
+
+
+def _post_initial_data(data: Dict, errors: List[str]) -> None:
+    data["attributes"] = {
+        k: max(1.0, min(20.0, v)) for k, v in data.get("attributes", {}).items()
+    }
+    if not data.get("need_questions") and not data["attributes"]:
+        errors.append("$.attributes: missing")
+
+
+def _post_events(data: Dict, errors: List[str]) -> None:
+    events = data["events"] if "events" in data else [data]
+    for ev in events:
+        if "choices" in ev and not ev["choices"]:
+            errors.append("$.choices: empty")
+
+
+_POST: Dict[str, Callable[[Dict, List[str]], None]] = {
+    "team_data": _post_team_data,
+    "resolve_action": _post_resolve_action,
+    "initial_data": _post_initial_data,
+    "next_event": _post_events,
+    "event_batch": _post_events,
+}
+
+
+def validate(kind: str, value: Any) -> Tuple[Dict, List[str]]:
+    """Coerce ``value`` to the schema for ``kind`` in one pass.
+
+    Returns ``(data, errors)``; ``data`` is always a dict (possibly partial).
+    Kinds without a schema are passed through when they are objects.
+    """
+    schema = SCHEMAS.get(kind)
+    if schema is None:
+        if isinstance(value, list):
+            value = value[0] if value else {}
+        return (value if isinstance(value, dict) else {}), []
+    errors: List[str] = []
+    data = _coerce(value, schema, "$", errors) or {}
+    if not errors and kind in _POST:
+        _POST[kind](data, errors)
+    return data, errors
+
+
+def load(kind: str, text: str) -> Tuple[Dict, List[str]]:
+    """Parse and validate raw model output."""
+    value, err = parse_json(text)
+    if err:
+        return {}, [err]
+    return validate(kind, value)
+
+
+def repair_prompt(kind: str, text: str, errors: List[str], limit: int = 6000) -> str:
+    """Targeted follow-up asking the model to fix only what failed validation."""
+    schema = json.dumps(SCHEMAS.get(kind, {}), ensure_ascii=False)
+    return f"""
+    次のJSONは指定スキーマに違反しています。内容はできるだけ保ったまま、
+    エラー箇所だけを修正した完全なJSONを出力してください。JSON以外は出力しないこと。
+
+    [エラー]
+    {chr(10).join(errors[:10])}
+
+    [スキーマ]
+    {schema}
+
+    [修正対象のJSON]
+    {text[:limit]}
+    """
@@ -0,0 +1,261 @@
+"""Dense per-day season calendar compiled from the schedule, weekly plan and timetable.
+
+What a given day holds used to be re-derived by every consumer from three
+tables: ``Player.schedule`` (fixtures), ``team_weekly_plan`` (free text per
+weekday) and ``school_timetable`` (periods per weekday).  :class:`SeasonCalendar`
+joins them once into NumPy columns with one entry per date:
+
+* ``match`` — a fixture is scheduled;
+* ``training`` — load category from the weekly plan (:data:`TRAINING_OFF`
+  … :data:`TRAINING_HARD`, :data:`TRAINING_MATCH` on match days) and
+  ``focus`` — what a routine day of that plan works on;
+* ``classes`` — periods on the timetable for that weekday;
+* ``travel`` — an away fixture that day or the next, ``recovery`` — the day
+  after a fixture;
+* ``intensity`` — a 0–1 figure derived from the above.
+
+Each source is tracked separately: when one of them is replaced or edited
+only its columns are recomputed (the weekday tables are 7 entries broadcast
+over the days), then ``intensity`` is re-derived in one vector pass.
+``Player.calendar`` keeps the calendar current and covering today, so
+lookups are O(1) array reads.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WEEKDAY_CODES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+TRAINING_OFF, TRAINING_LIGHT, TRAINING_NORMAL, TRAINING_HARD, TRAINING_MATCH = range(5)
+TRAINING_LABELS = ("オフ", "軽め", "通常", "高強度", "試合")
+TRAINING_LOAD = np.array([0.0, 0.3, 0.6, 0.85, 1.0], dtype=np.float32)
+CLASS_LOAD = 0.03
+TRAVEL_LOAD = 0.1
+
+FOCUS_NONE, FOCUS_GENERAL, FOCUS_PHYSICAL, FOCUS_TACTICAL, FOCUS_SHOOTING = range(5)
+# 週間予定の文言 → 練習の主眼（上から順に判定）
+FOCUS_KEYWORDS: Tuple[Tuple[Tuple[str, ...], int], ...] = (
+    (("フィジカル", "ジム", "筋トレ", "physical", "gym"), FOCUS_PHYSICAL),
+    (("戦術", "映像", "ミーティング", "分析", "tactic", "video"), FOCUS_TACTICAL),
+    (("シュート", "自主", "個人", "shoot"), FOCUS_SHOOTING),
+)
+OFF_WORDS = ("off", "オフ", "休", "自由", "リカバリー")
+LIGHT_WORDS = ("調整", "軽め", "リカバリー", "recovery", "light")
+HARD_WORDS = ("フィジカル", "ジム", "筋トレ", "2部", "二部", "紅白戦", "ハード")
+NO_CLASS = ("", "-", "なし", "空き", "空きコマ")
+PLAN_SLOTS = ("afternoon", "morning", "evening")
+# 年をまたいだ直後に作り直さなくて済むよう、今日から先はこれだけ持つ
+LOOKAHEAD_DAYS = 60
+
+
+def _text(value) -> str:
+    # data_editor の空セルは NaN / None で返ってくる
+    text = str(value or "").strip()
+    return "" if text.lower() in ("nan", "none") else text
+
+
+def _slot_texts(entry: Dict) -> List[str]:
+    return [_text(entry.get(k)) for k in PLAN_SLOTS]
+
+
+def plan_day(entry: Optional[Dict], weekday: int) -> Tuple[int, int]:
+    """``(training, focus)`` for one weekday of the team plan."""
+    if entry is None:
+        # 予定が無い曜日は平日練習・週末休み
+        return (TRAINING_NORMAL, FOCUS_GENERAL) if weekday < 5 else (TRAINING_OFF, FOCUS_NONE)
+    slots = [s for s in _slot_texts(entry) if s]
+    sessions = [s for s in slots if not any(w in s.lower() for w in OFF_WORDS)]
+    focus = FOCUS_NONE
+    if sessions:
+        text = " ".join(sessions).lower()
+        focus = next((f for words, f in FOCUS_KEYWORDS if any(w in text for w in words)), FOCUS_GENERAL)
+    training = TRAINING_OFF
+    for s in slots:
+        low = s.lower()
+        if any(w in low for w in HARD_WORDS):
+            level = TRAINING_HARD
+        elif any(w in low for w in LIGHT_WORDS):
+            level = TRAINING_LIGHT
+        elif any(w in low for w in OFF_WORDS):
+            level = TRAINING_OFF
+        else:
+            level = TRAINING_NORMAL
+        training = max(training, level)
+    return training, focus
+
+
+def timetable_periods(row: Optional[Dict]) -> int:
+    if not row:
+        return 0
+    return sum(
+        1 for k, v in row.items()
+        if k[:1] == "p" and k[1:].isdigit() and _text(v) not in NO_CLASS
+    )
+
+
+def _by_weekday(rows: Sequence[Dict]) -> Dict[str, Dict]:
+    out: Dict[str, Dict] = {}
+    for row in rows or []:
+        if isinstance(row, dict) and row.get("weekday") in WEEKDAY_CODES:
+            out.setdefault(row["weekday"], row)
+    return out
+
+
+@dataclasses.dataclass(frozen=True)
+class CalendarDay:
+    date: datetime.date
+    match: bool
+    training: int
+    focus: int
+    classes: int
+    travel: bool
+    recovery: bool
+    intensity: float
+
+    def line(self) -> str:
+        """Short description for prompts and the weekly tab."""
+        parts = ["試合日" if self.match else f"練習: {TRAINING_LABELS[self.training]}"]
+        if self.classes:
+            parts.append(f"授業 {self.classes}コマ")
+        if self.travel:
+            parts.append("移動あり")
+        if self.recovery:
+            parts.append("試合翌日")
+        parts.append(f"負荷 {self.intensity:.2f}")
+        return " / ".join(parts)
+
+
+class SeasonCalendar:
+    def __init__(self, start: datetime.date, end: datetime.date):
+        self.start = start
+        self.end = end
+        n = (end - start).days + 1
+        self._origin = start.toordinal()
+        self.weekday = (np.arange(self._origin, self._origin + n) - 1) % 7
+        self.match = np.zeros(n, dtype=bool)
+        self.away = np.zeros(n, dtype=bool)
+        self.training = np.zeros(n, dtype=np.int8)
+        self.focus = np.zeros(n, dtype=np.int8)
+        self.classes = np.zeros(n, dtype=np.int8)
+        self.travel = np.zeros(n, dtype=bool)
+        self.recovery = np.zeros(n, dtype=bool)
+        self.intensity = np.zeros(n, dtype=np.float32)
+        self._plan_table = np.zeros((7, 2), dtype=np.int8)
+        self._class_table = np.zeros(7, dtype=np.int8)
+        # 最後に取り込んだ元データ（差し替え・長さの変化で再計算）
+        self._sources: Dict[str, Tuple[object, int]] = {}
+        self.rebuilds: Dict[str, int] = {"schedule": 0, "plan": 0, "timetable": 0}
+
+    @classmethod
+    def for_player(cls, player) -> "SeasonCalendar":
+        """A calendar spanning the schedule's years and today plus :data:`LOOKAHEAD_DAYS`."""
+        ordinals = player.schedule_index.ordinals
+        first = datetime.date.fromordinal(ordinals[0]) if ordinals else None
+        last = datetime.date.fromordinal(ordinals[-1]) if ordinals else None
+        today = player.current_date
+        start = datetime.date(min(today.year, first.year if first else today.year), 1, 1)
+        end = max(datetime.date(today.year, 12, 31), today + datetime.timedelta(days=LOOKAHEAD_DAYS))
+        if last and last > end:
+            end = datetime.date(last.year, 12, 31)
+        return cls(start, end).refresh(player)
+
+    def covers(self, day: datetime.date, days: int = 0) -> bool:
+        return self.start <= day and day + datetime.timedelta(days=days) <= self.end
+
+    # --- Incremental refresh ------------------------------------------
+    def _changed(self, name: str, source) -> bool:
+        seen = self._sources.get(name)
+        if seen is not None and seen[0] is source and seen[1] == len(source):
+            return False
+        self._sources[name] = (source, len(source))
+        self.rebuilds[name] += 1
+        return True
+
+    def refresh(self, player) -> "SeasonCalendar":
+        """Recompute only the columns whose source table changed since the last call."""
+        changed = False
+        index = player.schedule_index
+        if self._changed("schedule", index):
+            self._fill_matches(index)
+            changed = True
+        if self._changed("plan", player.team_weekly_plan):
+            self._fill_plan(player.team_weekly_plan)
+            changed = True
+        if self._changed("timetable", player.school_timetable):
+            self._fill_classes(player.school_timetable)
+            changed = True
+        if changed:
+            self._fill_intensity()
+        return self
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Force a source (or all of them) to be re-read on the next refresh."""
+        for key in [name] if name else list(self._sources):
+            self._sources.pop(key, None)
+
+    def _fill_matches(self, index) -> None:
+        self.match[:] = False
+        self.away[:] = False
+        n = len(self.match)
+        for ordinal, fixture in index.by_ordinal.items():
+            i = ordinal - self._origin
+            if 0 <= i < n:
+                self.match[i] = True
+                self.away[i] = not fixture.get("home", True)
+        self.recovery[:] = False
+        self.recovery[1:] = self.match[:-1]
+        # アウェー戦の当日と前日は移動日
+        self.travel[:] = self.away
+        self.travel[:-1] |= self.away[1:]
+
+    def _fill_plan(self, plan: Sequence[Dict]) -> None:
+        rows = _by_weekday(plan)
+        for wd, code in enumerate(WEEKDAY_CODES):
+            self._plan_table[wd] = plan_day(rows.get(code), wd)
+        self.training[:] = self._plan_table[self.weekday, 0]
+        self.focus[:] = self._plan_table[self.weekday, 1]
+
+    def _fill_classes(self, timetable: Sequence[Dict]) -> None:
+        rows = _by_weekday(timetable)
+        for wd, code in enumerate(WEEKDAY_CODES):
+            self._class_table[wd] = timetable_periods(rows.get(code))
+        self.classes[:] = self._class_table[self.weekday]
+
+    def _fill_intensity(self) -> None:
+        level = np.where(self.match, TRAINING_MATCH, self.training)
+        # 試合翌日は予定にかかわらず軽めまで
+        level = np.where(self.recovery & ~self.match, np.minimum(level, TRAINING_LIGHT), level)
+        load = TRAINING_LOAD[level] + CLASS_LOAD * self.classes + TRAVEL_LOAD * self.travel
+        self.intensity[:] = np.clip(load, 0.0, 1.0)
+
+    # --- Lookups -------------------------------------------------------
+    def _pos(self, day: datetime.date) -> int:
+        i = day.toordinal() - self._origin
+        if not 0 <= i < len(self.match):
+            raise KeyError(day)
+        return i
+
+    def day(self, day: datetime.date) -> CalendarDay:
+        i = self._pos(day)
+        match = bool(self.match[i])
+        return CalendarDay(
+            date=day,
+            match=match,
+            training=TRAINING_MATCH if match else int(self.training[i]),
+            focus=int(self.focus[i]),
+            classes=int(self.classes[i]),
+            travel=bool(self.travel[i]),
+            recovery=bool(self.recovery[i]),
+            intensity=float(self.intensity[i]),
+        )
+
+    def focus_on(self, day: datetime.date) -> int:
+        return int(self.focus[self._pos(day)])
+
+    def week(self, start: datetime.date, days: int = 7) -> List[CalendarDay]:
+        return [self.day(start + datetime.timedelta(days=i)) for i in range(days)]
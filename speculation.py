@@ -0,0 +1,144 @@
+"""Speculative execution of the next LLM calls in the daily loop.
+
+While the player reads an event, every offered choice can already be
+resolved in the background; once a resolution has been applied the next
+event can be generated before the player asks for it.  Each speculation is
+keyed by a *state version* (a fingerprint of everything the prompts read
+from :class:`game_data.Player`), so anything computed for an older state is
+simply thrown away.  Speculations still outstanding plus those discarded
+today count against a per-game-day budget; once it is spent no further
+speculative calls are issued until the next day is resolved.  A result is
+only used if it has already finished — a click never waits on a
+speculative call queued behind interactive work.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import background
+
+logger = logging.getLogger(__name__)
+
+# 選択肢3つ＋次のイベント1つ＋前日の使われなかった選択肢2つが収まる
+DEFAULT_MAX_WASTED = 6
+
+
+def state_version(player) -> str:
+    """Fingerprint the player fields that event/resolution prompts depend on."""
+    payload = {
+        "date": str(player.current_date),
+        "team": player.team_name,
+        "category": player.team_category,
+        "position": player.position,
+        "age": player.age,
+        "ca": round(float(player.ca), 4),
+        "pa": round(float(player.pa), 4),
+        "hp": player.hp,
+        "mp": player.mp,
+        "npcs": [(n.role, n.name, n.relation) for n in player.npcs],
+        "schedule": len(player.schedule),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def snapshot(player):
+    """Copy the player so background prompts never observe a half-applied update."""
+    return copy.deepcopy(player)
+
+
+class Speculator:
+    """Per-session registry of speculative futures keyed by state version."""
+
+    def __init__(self, max_wasted: int = DEFAULT_MAX_WASTED):
+        self.max_wasted = max_wasted
+        self.launched = 0
+        self.used = 0
+        self.wasted = 0
+        self.wasted_today = 0
+        self._slots: Dict[Tuple[str, str, Hashable], Future] = {}
+
+    @property
+    def exhausted(self) -> bool:
+        # 走っている先読みは無駄になりうるので、捨てた分と合わせて数える
+        return self.wasted_today + len(self._slots) >= self.max_wasted
+
+    def speculate(
+        self,
+        version: str,
+        kind: str,
+        arg: Hashable,
+        fn: Callable[..., Any],
+        *args: Any,
+    ) -> bool:
+        """Start ``fn(*args)`` for ``(version, kind, arg)`` unless already running."""
+        key = (version, kind, arg)
+        if key in self._slots or self.exhausted:
+            return False
+        self._slots[key] = background.submit(fn, *args)
+        self.launched += 1
+        return True
+
+    def take(
+        self,
+        version: str,
+        kind: str,
+        arg: Hashable = None,
+    ) -> Any:
+        """Return the speculated result if it has already finished, or ``None``.
+
+        An unfinished speculation is cancelled and counted as wasted; the
+        caller makes the interactive call instead of waiting for it.
+        """
+        fut = self._slots.pop((version, kind, arg), None)
+        if fut is None:
+            return None
+        if not fut.done():
+            fut.cancel()
+            self._waste(1)
+            return None
+        try:
+            value = fut.result()
+        except Exception as exc:
+            logger.warning("speculative %s failed: %s", kind, exc)
+            self._waste(1)
+            return None
+        if value:
+            self.used += 1
+        else:
+            self._waste(1)
+        return value
+
+    def invalidate(self, keep_version: Optional[str] = None) -> int:
+        """Drop every speculation not made for ``keep_version``."""
+        stale = [k for k in self._slots if k[0] != keep_version]
+        for key in stale:
+            self._slots.pop(key).cancel()
+        self._waste(len(stale))
+        return len(stale)
+
+    def new_day(self) -> None:
+        """Reset the daily waste budget once a day has been resolved.
+
+        Call this before :meth:`invalidate`, so the previous day's unused
+        speculations count against the new day's budget.
+        """
+        self.wasted_today = 0
+
+    def _waste(self, n: int) -> None:
+        self.wasted += n
+        self.wasted_today += n
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "launched": self.launched,
+            "used": self.used,
+            "wasted": self.wasted,
+            "pending": len(self._slots),
+        }
@@ -0,0 +1,278 @@
+"""Incremental league tables fed by fixture results.
+
+Each league competition the player's team plays in gets a
+:class:`LeagueTable`: per-team arrays of played / won / drawn / lost /
+goals for / goals against, plus a strength per club taken from the same
+model :mod:`match_engine` uses for opponents.  When one of the player's
+fixtures is decided, :func:`record_fixture` applies that result and plays
+the rest of the matchday for the other clubs in one vector draw, paired by
+the same circle-method round robin :mod:`fixtures` schedules with, so the
+whole table is current after every matchday.  An update touches each team
+at most once (O(teams)); ranks are sorted on read with the usual
+tie-breakers (points, goal difference, goals for, name).
+
+Tables live on ``Player.standings`` keyed by ``competition_code`` and are
+saved as a few flat integer lists.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import fixtures
+import match_engine
+
+POINTS_WIN = 3
+POINTS_DRAW = 1
+# P, W, D, L, GF, GA の列
+COLUMNS = ("played", "won", "drawn", "lost", "gf", "ga")
+_P, _W, _D, _L, _GF, _GA = range(len(COLUMNS))
+
+
+class LeagueTable:
+    def __init__(
+        self,
+        code: str,
+        name: str,
+        teams: Sequence[str],
+        strength: Optional[Sequence[float]] = None,
+        stats: Optional[np.ndarray] = None,
+        through: str = "",
+    ):
+        self.code = code
+        self.name = name or code
+        self.teams: List[str] = list(teams)
+        self.index: Dict[str, int] = {t: i for i, t in enumerate(self.teams)}
+        n = len(self.teams)
+        self.strength = np.asarray(strength if strength is not None else np.zeros(n), dtype=float)
+        self.stats = stats if stats is not None else np.zeros((n, len(COLUMNS)), dtype=np.int32)
+        self.through = through
+        self._rounds: Optional[List[List[tuple]]] = None  # 総当たりの組み合わせ（チーム番号）
+
+    def __len__(self) -> int:
+        return len(self.teams)
+
+    # --- Updates -------------------------------------------------------
+    def add_team(self, team: str, strength: float) -> int:
+        if team in self.index:
+            return self.index[team]
+        self.index[team] = len(self.teams)
+        self.teams.append(team)
+        self.strength = np.append(self.strength, strength)
+        self.stats = np.vstack([self.stats, np.zeros((1, len(COLUMNS)), dtype=np.int32)])
+        self._rounds = None
+        return self.index[team]
+
+    def apply_results(self, home: np.ndarray, away: np.ndarray, hg: np.ndarray, ag: np.ndarray) -> None:
+        """Apply a batch of results given as team-index and goal arrays."""
+        home, away = np.asarray(home, dtype=np.intp), np.asarray(away, dtype=np.intp)
+        hg, ag = np.asarray(hg, dtype=np.int32), np.asarray(ag, dtype=np.int32)
+        s = self.stats
+        # 1節の中で同じチームは1回しか出てこないので、fancy index への加算でよい
+        for side, gf, ga in ((home, hg, ag), (away, ag, hg)):
+            s[side, _P] += 1
+            s[side, _W] += gf > ga
+            s[side, _D] += gf == ga
+            s[side, _L] += gf < ga
+            s[side, _GF] += gf
+            s[side, _GA] += ga
+
+    def apply_result(self, home: str, away: str, hg: int, ag: int) -> None:
+        self.apply_results([self.index[home]], [self.index[away]], [hg], [ag])
+
+    def round_pairs(self, matchday: int) -> List[tuple]:
+        """``(home, away)`` team indices for ``matchday`` (0-based) of a repeating round robin.
+
+        Even cycles use the circle-method rounds as they are, odd cycles swap
+        home and away, like :func:`fixtures.league_rounds`.
+        """
+        if self._rounds is None:
+            self._rounds = [
+                [(self.index[a], self.index[b]) for a, b in pairs]
+                for pairs in fixtures.circle_rounds(self.teams)
+            ]
+        if not self._rounds:
+            return []
+        cycle, r = divmod(matchday, len(self._rounds))
+        pairs = self._rounds[r]
+        return pairs if cycle % 2 == 0 else [(b, a) for a, b in pairs]
+
+    def simulate_others(self, rng: np.random.Generator, busy: Iterable[str], matchday: int) -> int:
+        """Play ``matchday``'s round-robin pairs that do not involve ``busy``; returns matches played.
+
+        The player's real fixture comes from the schedule, so the clubs it
+        displaces from their round-robin pairs meet each other instead.
+        """
+        busy_idx = {self.index[t] for t in busy if t in self.index}
+        home, away, spare = [], [], []
+        for h, a in self.round_pairs(matchday):
+            if h in busy_idx and a in busy_idx:
+                continue
+            if h in busy_idx or a in busy_idx:
+                spare.append(a if h in busy_idx else h)
+                continue
+            home.append(h)
+            away.append(a)
+        for i in range(0, len(spare) - 1, 2):
+            home.append(spare[i])
+            away.append(spare[i + 1])
+        pairs = len(home)
+        if not pairs:
+            return 0
+        home, away = np.array(home, dtype=np.intp), np.array(away, dtype=np.intp)
+        lam_h, lam_a = match_engine.expected_goals(self.strength[home], self.strength[away], np.ones(pairs, dtype=bool))
+        hg, ag = match_engine.sample_scores(rng, lam_h, lam_a)
+        self.apply_results(home, away, hg, ag)
+        return pairs
+
+    # --- Reading -------------------------------------------------------
+    @property
+    def points(self) -> np.ndarray:
+        return self.stats[:, _W] * POINTS_WIN + self.stats[:, _D] * POINTS_DRAW
+
+    def order(self) -> np.ndarray:
+        """Team indices from first to last (points, GD, GF, then name)."""
+        s = self.stats
+        gd = s[:, _GF] - s[:, _GA]
+        names = np.array(self.teams, dtype=object)
+        # lexsort は最後のキーが最優先
+        return np.lexsort((names, -s[:, _GF], -gd, -self.points))
+
+    def rank_of(self, team: str) -> Optional[int]:
+        i = self.index.get(team)
+        if i is None:
+            return None
+        return int(np.flatnonzero(self.order() == i)[0]) + 1
+
+    def rows(self, highlight: str = "") -> List[Dict]:
+        s, pts = self.stats, self.points
+        rows = []
+        for rank, i in enumerate(self.order(), start=1):
+            rows.append({
+                "順位": rank,
+                "チーム": f"★ {self.teams[i]}" if self.teams[i] == highlight else self.teams[i],
+                "試合": int(s[i, _P]),
+                "勝": int(s[i, _W]),
+                "分": int(s[i, _D]),
+                "敗": int(s[i, _L]),
+                "得点": int(s[i, _GF]),
+                "失点": int(s[i, _GA]),
+                "得失点差": int(s[i, _GF] - s[i, _GA]),
+                "勝点": int(pts[i]),
+            })
+        return rows
+
+    # --- Persistence ---------------------------------------------------
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "teams": self.teams,
+            "strength": [round(float(x), 1) for x in self.strength],
+            "stats": self.stats.ravel().tolist(),
+            "through": self.through,
+        }
+
+    @classmethod
+    def from_dict(cls, code: str, data: Dict) -> "LeagueTable":
+        teams = data.get("teams", [])
+        stats = np.asarray(data.get("stats", []), dtype=np.int32)
+        if stats.size != len(teams) * len(COLUMNS):
+            stats = np.zeros((len(teams), len(COLUMNS)), dtype=np.int32)
+        strength = data.get("strength") or None
+        if strength is not None and len(strength) != len(teams):
+            # 長さが合わない保存データは、平均の強さに各クラブの固定の差を足して作り直す
+            level = float(np.mean(strength)) if len(strength) else 0.0
+            strength = [match_engine.opponent_strength(t, level) for t in teams]
+        return cls(
+            code,
+            data.get("name", code),
+            teams,
+            strength=strength,
+            stats=stats.reshape(len(teams), len(COLUMNS)),
+            through=data.get("through", ""),
+        )
+
+
+def tables_to_dict(tables: Dict[str, LeagueTable]) -> Dict[str, Dict]:
+    return {code: t.to_dict() for code, t in tables.items()}
+
+
+def tables_from_dict(data: Optional[Dict]) -> Dict[str, LeagueTable]:
+    return {code: LeagueTable.from_dict(code, d) for code, d in (data or {}).items()}
+
+
+# --- Wiring to the player ---------------------------------------------------
+def competition_meta(player, code: str) -> Dict:
+    return next((c for c in player.competitions if c.get("code") == code), {})
+
+
+def is_league(player, code: str) -> bool:
+    meta = competition_meta(player, code)
+    if meta.get("type"):
+        return meta["type"] == "league"
+    # メタ情報が無ければ、対戦相手が4チーム以上ある大会をリーグとみなす
+    opponents = {m.get("opponent") for m in player.schedule if m.get("competition_code") == code}
+    return len(opponents) >= 4
+
+
+def build_table(player, code: str) -> LeagueTable:
+    """A fresh table: the player's team, every scheduled opponent, padded to ``team_count``."""
+    meta = competition_meta(player, code)
+    level = match_engine.squad_strength(player)[0]
+    table = LeagueTable(code, meta.get("name", code), [])
+    table.add_team(player.team_name, level)
+    for m in player.schedule:
+        if m.get("competition_code") == code and m.get("opponent"):
+            table.add_team(m["opponent"], match_engine.opponent_strength(m["opponent"], level))
+    try:
+        team_count = int(meta.get("team_count") or 0)
+    except (TypeError, ValueError):
+        team_count = 0
+    filler = 1
+    while len(table) < team_count:
+        name = f"{table.name} クラブ{filler}"
+        filler += 1
+        if name not in table.index:
+            table.add_team(name, match_engine.opponent_strength(name, level))
+    return table
+
+
+def record_fixture(player, fixture: Dict, outcome) -> Optional[LeagueTable]:
+    """Apply one of the player's results and simulate the rest of that matchday."""
+    code = fixture.get("competition_code") or ""
+    if not code or not is_league(player, code):
+        return None
+    table = player.standings.get(code)
+    if table is None:
+        table = player.standings[code] = build_table(player, code)
+    date = fixture.get("date", "")
+    if date and date <= table.through:
+        return table  # 適用済み
+    opponent = fixture.get("opponent", "")
+    own = player.team_name
+    for team in (own, opponent):
+        if team not in table.index:
+            level = match_engine.squad_strength(player)[0]
+            table.add_team(team, match_engine.opponent_strength(team, level))
+    # 自チームの消化試合数がそのまま今日の節番号
+    matchday = int(table.stats[table.index[own], _P])
+    if outcome.home:
+        table.apply_result(own, opponent, outcome.goals_for, outcome.goals_against)
+    else:
+        table.apply_result(opponent, own, outcome.goals_against, outcome.goals_for)
+    rng = np.random.default_rng(zlib.crc32(f"{code}|{date}".encode("utf-8")))
+    table.simulate_others(rng, busy=(own, opponent), matchday=matchday)
+    table.through = date
+    return table
+
+
+def fallback_rows(player) -> List[Dict]:
+    """Zero rows per scheduled competition before any result is in."""
+    codes = sorted({m.get("competition_code") for m in player.schedule if m.get("competition_code")})
+    return [
+        {"大会": competition_meta(player, code).get("name", code), "チーム": player.team_name, "試合": 0, "勝点": 0}
+        for code in codes or ["リーグ"]
+    ]
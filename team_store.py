@@ -0,0 +1,167 @@
+"""Process-wide store of generated team templates shared across sessions.
+
+Players who start at the same club (the default is "慶應義塾大学ソッカー部C2
+チーム") all need the same squad list and the same season's fixtures.  The
+store keeps one read-only template per ``(part, team, category, season,
+source)`` — ``team_data`` (formation, real_players) and ``schedule``
+(competitions, schedule skeleton) — and builds a missing one through
+:class:`background.SingleFlight`, so N sessions arriving together cost one
+generation.  ``source`` names the backend and model that produced it, so a
+stub or replayed template is never served to a live session, and templates
+older than :data:`MAX_AGE_SECONDS` are rebuilt.  Templates are frozen into
+mapping proxies and tuples; a session reads them directly and takes its
+own mutable copy with :func:`thaw` only when it stores the data on its
+``Player``.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import background
+
+MAX_TEMPLATES = 256
+# 実在クラブの陣容・大会構成もいずれ変わるので、半日で作り直す
+MAX_AGE_SECONDS = 12 * 3600
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_team_name(name: str) -> str:
+    """NFKC + casefold + no whitespace, so "ＦＣ東京" and "FC 東京" share a template."""
+    text = unicodedata.normalize("NFKC", name or "")
+    return _SPACE_RE.sub("", text).casefold()
+
+
+def freeze(value: Any) -> Any:
+    """Deep read-only copy: dicts become mapping proxies and lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Mutable deep copy of a (possibly frozen) template."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class TeamTemplateStore:
+    """Bounded LRU of frozen templates with single-flight generation."""
+
+    def __init__(
+        self,
+        max_templates: int = MAX_TEMPLATES,
+        flight: Optional[background.SingleFlight] = None,
+        max_age: float = MAX_AGE_SECONDS,
+    ):
+        self.max_templates = max_templates
+        self.max_age = max_age
+        self._flight = flight or background.SingleFlight()
+        self._lock = threading.Lock()
+        # key → (作成時刻, テンプレート)
+        self._templates: "OrderedDict[Hashable, Tuple[float, MappingProxyType]]" = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(part: str, team_name: str, category: str, season: int, source: str = "") -> Tuple[str, str, str, int, str]:
+        return (part, normalize_team_name(team_name), category or "", int(season), source or "")
+
+    def _lookup(self, key: Hashable) -> Optional[MappingProxyType]:
+        # self._lock を持った状態で呼ぶ
+        entry = self._templates.get(key)
+        if entry is None:
+            return None
+        created, tpl = entry
+        if time.monotonic() - created > self.max_age:
+            del self._templates[key]
+            self.expired += 1
+            return None
+        return tpl
+
+    def get(self, part: str, team_name: str, category: str, season: int, source: str = "") -> Optional[MappingProxyType]:
+        key = self.key(part, team_name, category, season, source)
+        with self._lock:
+            tpl = self._lookup(key)
+            if tpl is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+            return tpl
+
+    def get_or_build(
+        self,
+        part: str,
+        team_name: str,
+        category: str,
+        season: int,
+        build: Callable[[], Optional[Dict]],
+        source: str = "",
+    ) -> Optional[MappingProxyType]:
+        """Shared template for the key, building it once if nobody has yet.
+
+        ``build`` returns a plain dict or ``None`` on failure; failures are
+        not stored so the next session tries again.
+        """
+        tpl = self.get(part, team_name, category, season, source)
+        if tpl is not None:
+            return tpl
+        key = self.key(part, team_name, category, season, source)
+        tpl, _ = self._flight.do(key, self._build, key, build)
+        return tpl
+
+    def invalidate(self, part: str, team_name: str, category: str, season: int, source: str = "") -> None:
+        with self._lock:
+            self._templates.pop(self.key(part, team_name, category, season, source), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "templates": len(self._templates),
+                "hits": self.hits,
+                "builds": self.builds,
+                "expired": self.expired,
+            }
+
+    def _build(self, key: Hashable, build: Callable[[], Optional[Dict]]) -> Optional[MappingProxyType]:
+        # 待っている間に別スレッドが作り終えていることがある
+        with self._lock:
+            tpl = self._lookup(key)
+        if tpl is not None:
+            return tpl
+        data = build()
+        if not data:
+            return None
+        tpl = freeze(data)
+        with self._lock:
+            self.builds += 1
+            self._templates[key] = (time.monotonic(), tpl)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return tpl
+
+
+_default_store: Optional[TeamTemplateStore] = None
+_default_lock = threading.Lock()
+
+
+def get_store() -> TeamTemplateStore:
+    """Return the process-wide store shared by every Streamlit session."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = TeamTemplateStore()
+        return _default_store
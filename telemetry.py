@@ -0,0 +1,270 @@
+"""Per-call telemetry for LLM requests.
+
+``call_gemini`` fills one :class:`CallRecord` per call (prompt kind, caller,
+wall time, prompt/response size, token usage from the response metadata,
+retries, cache status, estimated cost) and hands it to :func:`record`.
+Records are appended to a size-rotated JSONL file and aggregated in memory
+so the admin panel can show p50/p95/p99 per kind and a Prometheus-style text
+exposition can be served or downloaded.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_PATH = Path("telemetry") / "llm_calls.jsonl"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+WINDOW = 1000
+
+# 1M トークンあたりの概算単価 (USD: 入力, 出力)。コスト表示は目安。
+PRICES_PER_MTOK: Dict[str, tuple] = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-3-pro-preview": (2.00, 12.00),
+}
+
+
+@dataclasses.dataclass
+class CallRecord:
+    kind: str
+    caller: str = ""
+    model: str = ""
+    backend: str = ""
+    ts: float = dataclasses.field(default_factory=time.time)
+    wall_ms: float = 0.0
+    prompt_chars: int = 0
+    response_chars: int = 0
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    saved_tokens: int = 0  # prompt_builder が圧縮で削った入力トークン（見積もり）
+    retries: int = 0
+    cache: str = "bypass"  # hit / miss / shared / bypass
+    status: str = "ok"  # ok / error / invalid / circuit_open / rate_limited
+    repaired: bool = False
+    cost_usd: float = 0.0
+
+    def add_usage(self, usage: Dict) -> None:
+        """Accumulate token counts (a repaired call reports two responses)."""
+        for field in ("prompt_tokens", "output_tokens", "total_tokens"):
+            if usage.get(field) is not None:
+                setattr(self, field, (getattr(self, field) or 0) + int(usage[field]))
+
+    def finish(self, started: float) -> "CallRecord":
+        self.wall_ms = (time.perf_counter() - started) * 1000
+        self.cost_usd = estimate_cost(self.model, self.prompt_tokens, self.output_tokens)
+        return self
+
+
+def estimate_cost(model: str, prompt_tokens: Optional[int], output_tokens: Optional[int]) -> float:
+    name = model.split("/")[-1]
+    price = PRICES_PER_MTOK.get(name)
+    if not price:
+        return 0.0
+    return ((prompt_tokens or 0) * price[0] + (output_tokens or 0) * price[1]) / 1_000_000
+
+
+def usage_from_metadata(meta) -> Dict[str, Optional[int]]:
+    """Read ``usage_metadata`` of a Gemini response into a plain dict."""
+    if meta is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(meta, "prompt_token_count", None),
+        "output_tokens": getattr(meta, "candidates_token_count", None),
+        "total_tokens": getattr(meta, "total_token_count", None),
+    }
+
+
+def _quantile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+class Telemetry:
+    def __init__(self, log_path: Optional[Path] = LOG_PATH):
+        self.log_path = Path(log_path) if log_path else None
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=WINDOW))
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._collectors: Dict[str, Callable[[], List[str]]] = {}
+
+    def register_collector(self, name: str, collect: Callable[[], List[str]]) -> None:
+        """Add extra exposition lines (e.g. queue gauges) to :meth:`prometheus_text`."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def record(self, rec: CallRecord) -> None:
+        with self._lock:
+            c = self._counters[rec.kind]
+            c["calls"] += 1
+            c[f"status_{rec.status}"] += 1
+            c[f"cache_{rec.cache}"] += 1
+            c["retries"] += rec.retries
+            c["repaired"] += int(rec.repaired)
+            c["prompt_tokens"] += rec.prompt_tokens or 0
+            c["output_tokens"] += rec.output_tokens or 0
+            c["saved_tokens"] += rec.saved_tokens
+            c["cost_usd"] += rec.cost_usd
+            c["wall_ms_sum"] += rec.wall_ms
+            self._latency[rec.kind].append(rec.wall_ms)
+            if self.log_path is not None:
+                self._append(rec)
+
+    def summary(self) -> List[Dict]:
+        """One row per prompt kind for the admin panel."""
+        with self._lock:
+            rows = []
+            for kind in sorted(self._counters):
+                c = self._counters[kind]
+                lat = sorted(self._latency[kind])
+                calls = c["calls"] or 1
+                rows.append({
+                    "kind": kind,
+                    "calls": int(c["calls"]),
+                    "p50_ms": round(_quantile(lat, 0.50), 1),
+                    "p95_ms": round(_quantile(lat, 0.95), 1),
+                    "p99_ms": round(_quantile(lat, 0.99), 1),
+                    "cache_hit_rate": round(c["cache_hit"] / calls, 3),
+                    "errors": int(
+                        c["status_error"] + c["status_invalid"] + c["status_circuit_open"] + c["status_rate_limited"]
+                    ),
+                    "retries": int(c["retries"]),
+                    "prompt_tokens": int(c["prompt_tokens"]),
+                    "output_tokens": int(c["output_tokens"]),
+                    "saved_tokens": int(c["saved_tokens"]),
+                    "cost_usd": round(c["cost_usd"], 4),
+                })
+            return rows
+
+    def percentile(self, kind: str, q: float) -> Optional[float]:
+        with self._lock:
+            lat = sorted(self._latency.get(kind, ()))
+        return _quantile(lat, q) if lat else None
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition (counters plus a latency summary per kind)."""
+        lines = [
+            "# HELP llm_calls_total LLM calls by prompt kind and status.",
+            "# TYPE llm_calls_total counter",
+        ]
+        with self._lock:
+            snapshot = {k: dict(v) for k, v in self._counters.items()}
+            latency = {k: sorted(v) for k, v in self._latency.items()}
+            collectors = list(self._collectors.values())
+        for kind, c in sorted(snapshot.items()):
+            for key, val in sorted(c.items()):
+                if key.startswith("status_"):
+                    lines.append(f'llm_calls_total{{kind="{kind}",status="{key[7:]}"}} {int(val)}')
+        lines += ["# HELP llm_cache_total Cache lookups by result.", "# TYPE llm_cache_total counter"]
+        for kind, c in sorted(snapshot.items()):
+            for key, val in sorted(c.items()):
+                if key.startswith("cache_"):
+                    lines.append(f'llm_cache_total{{kind="{kind}",result="{key[6:]}"}} {int(val)}')
+        for metric, key, help_text in (
+            ("llm_retries_total", "retries", "Retried attempts."),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Input tokens."),
+            ("llm_output_tokens_total", "output_tokens", "Output tokens."),
+            ("llm_prompt_tokens_saved_total", "saved_tokens", "Input tokens saved by compact prompts (estimate)."),
+            ("llm_cost_usd_total", "cost_usd", "Estimated cost in USD."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for kind, c in sorted(snapshot.items()):
+                lines.append(f'{metric}{{kind="{kind}"}} {c.get(key, 0):g}')
+        lines += [
+            "# HELP llm_call_latency_ms Wall time per LLM call over the recent window.",
+            "# TYPE llm_call_latency_ms summary",
+        ]
+        for kind, lat in sorted(latency.items()):
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'llm_call_latency_ms{{kind="{kind}",quantile="{q}"}} {_quantile(lat, q):.1f}')
+            lines.append(f'llm_call_latency_ms_sum{{kind="{kind}"}} {snapshot[kind].get("wall_ms_sum", 0):.1f}')
+            lines.append(f'llm_call_latency_ms_count{{kind="{kind}"}} {int(snapshot[kind].get("calls", 0))}')
+        for collect in collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+    # --- JSONL ---------------------------------------------------------
+    def _append(self, rec: CallRecord) -> None:
+        path = self.log_path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.stat().st_size >= LOG_MAX_BYTES:
+                self._rotate()
+            with path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(dataclasses.asdict(rec), ensure_ascii=False) + "\n")
+        except OSError:
+            # 計測の失敗でゲームを止めない
+            pass
+
+    def _rotate(self) -> None:
+        path = self.log_path
+        for i in range(LOG_BACKUPS, 0, -1):
+            src = path.with_name(f"{path.name}.{i - 1}") if i > 1 else path
+            dst = path.with_name(f"{path.name}.{i}")
+            if src.exists():
+                src.replace(dst)
+
+
+_default: Optional[Telemetry] = None
+_default_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def get_telemetry() -> Telemetry:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Telemetry()
+        return _default
+
+
+def record(rec: CallRecord) -> None:
+    get_telemetry().record(rec)
+
+
+def start_metrics_server(port: int = 9464) -> Optional[int]:
+    """Serve ``/metrics`` from this process on a daemon thread (idempotent).
+
+    Returns the bound port, or ``None`` if the port could not be bound
+    (already in use, no permission).
+    """
+    global _server
+    with _default_lock:
+        if _server is not None:
+            return _server.server_address[1]
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = get_telemetry().prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        except OSError as exc:
+            logger.warning("cannot serve /metrics on port %d: %s", port, exc)
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return _server.server_address[1]